@@ -7,9 +7,11 @@ AI сервис для обработки запросов через OpenRouter
 
 import requests
 import json
+import threading
+import time
 from typing import Optional, Dict, List
 from config import Config
-from repositories import ClientRepository, TransactionRepository
+from repositories import ClientRepository, TransactionRepository, AnomalyRepository
 
 class AIService:
     """AI сервис"""
@@ -60,6 +62,7 @@ class AIService:
         transactions = TransactionRepository.get_by_client(client_id, limit=100)
         summary = TransactionRepository.get_summary(client_id)
         categories = TransactionRepository.get_by_category(client_id)
+        anomalies = AnomalyRepository.get_by_client(client_id, limit=10)
         
         # Формируем контекст
         context = f"""Данные клиента:
@@ -93,6 +96,17 @@ class AIService:
                 for cat in expense_cats:
                     context += f"  💸 {cat['category']}: -{cat['total']:,.2f} ₽ ({cat['count']} транзакций)\n"
         
+        # Необычные транзакции — готовый результат anomalies.py, модели не нужно искать их в списке
+        if anomalies:
+            context += "\nНеобычные транзакции (автоматический поиск):\n"
+            for anomaly in anomalies:
+                context += (f"  ⚠️ {anomaly['booking_date']} | {anomaly['category']} | "
+                            f"{anomaly['amount']:,.2f} ₽ | {anomaly['reason']} "
+                            f"(обычно {anomaly['baseline']:,.2f} ₽)")
+                if anomaly.get('description'):
+                    context += f" | {anomaly['description']}"
+                context += "\n"
+        
         # Добавляем последние 10 транзакций
         if transactions:
             context += f"\nПоследние 10 транзакций:\n"
@@ -111,20 +125,27 @@ class AIService:
         
         return context
     
-    def ask(self, question: str, client_id: Optional[str] = None) -> Dict:
+    def ask(self, question: str, client_id: Optional[str] = None,
+            context: Optional[str] = None) -> Dict:
         """
         Задать вопрос AI
-        
+
         Args:
             question: Вопрос пользователя
             client_id: ID клиента (опционально)
-            
+            context: Готовый контекст (если уже построен, например в пакетном анализе)
+
         Returns:
-            dict: Результат от AI
+            dict: Результат от AI (с длительностью этапов в 'timings', мс)
         """
+        timings = {}
+        
         try:
-            # Строим контекст
-            context = self.build_context(client_id)
+            # Строим контекст (если не передан готовый)
+            started = time.perf_counter()
+            if context is None:
+                context = self.build_context(client_id)
+            timings['context_ms'] = (time.perf_counter() - started) * 1000
             
             # Формируем сообщения
             messages = [
@@ -162,24 +183,31 @@ class AIService:
             }
             
             # Отправляем запрос в API
+            started = time.perf_counter()
             response = requests.post(
                 self.api_url,
                 headers=headers,
                 json=payload,
                 timeout=Config.AI_TIMEOUT
             )
+            timings['upstream_ms'] = (time.perf_counter() - started) * 1000
             
             # Обрабатываем ответ
             if response.status_code == 200:
                 result = response.json()
                 answer = result['choices'][0]['message']['content']
                 
+                started = time.perf_counter()
+                context_summary = self.get_context_summary(client_id) if client_id else None
+                timings['summary_ms'] = (time.perf_counter() - started) * 1000
+                
                 return {
                     'success': True,
                     'answer': answer,
                     'model': self.model,
                     'has_context': bool(context),
-                    'context_summary': self.get_context_summary(client_id) if client_id else None
+                    'context_summary': context_summary,
+                    'timings': timings
                 }
             else:
                 error_msg = f"AI API ошибка: {response.status_code}"
@@ -193,18 +221,21 @@ class AIService:
                 return {
                     'success': False,
                     'error': error_msg,
-                    'status_code': response.status_code
+                    'status_code': response.status_code,
+                    'timings': timings
                 }
                 
         except requests.exceptions.Timeout:
             return {
                 'success': False,
-                'error': 'AI сервис не отвечает (таймаут 30 сек)'
+                'error': 'AI сервис не отвечает (таймаут 30 сек)',
+                'retryable': True
             }
         except requests.exceptions.RequestException as e:
             return {
                 'success': False,
-                'error': f'Ошибка подключения к AI: {str(e)}'
+                'error': f'Ошибка подключения к AI: {str(e)}',
+                'retryable': True
             }
         except Exception as e:
             return {
@@ -262,5 +293,43 @@ class AIService:
                 "Как работает AI ассистент?"
             ]
 
-# Глобальный экземпляр
-ai_service = AIService()
+# ============ ЕДИНСТВЕННЫЙ ЭКЗЕМПЛЯР ============
+# Как и db_manager: создаётся при первом обращении, подменяется через set_ai_service
+
+_ai_service = None
+_ai_service_lock = threading.Lock()
+
+
+def get_ai_service() -> AIService:
+    """AI сервис (создаётся при первом вызове по Config)"""
+    global _ai_service
+    if _ai_service is None:
+        with _ai_service_lock:
+            if _ai_service is None:
+                _ai_service = AIService()
+    return _ai_service
+
+
+def set_ai_service(service: Optional[AIService]) -> Optional[AIService]:
+    """Подменить AI сервис; None — снова создавать при первом обращении
+    
+    Возвращает предыдущий сервис
+    """
+    global _ai_service
+    with _ai_service_lock:
+        previous = _ai_service
+        _ai_service = service
+    return previous
+
+
+class _LazyAIService:
+    """Прокси к get_ai_service(): `from ai_service import ai_service` работает как раньше"""
+    
+    def __getattr__(self, name):
+        return getattr(get_ai_service(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(get_ai_service(), name, value)
+
+
+ai_service = _LazyAIService()
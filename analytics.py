@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# analytics.py
+"""
+Колоночный снимок для аналитики по всему портфелю
+После синхронизации банка его transactions, balances и accounts выгружаются
+в Parquet, а /api/analytics/* считают агрегаты по снимку во встроенном
+DuckDB: векторно и без нагрузки на рабочую БД
+
+    <ANALYTICS_DIR>/CURRENT                      имя текущего снимка
+    <ANALYTICS_DIR>/<снимок>/meta.json           время выгрузки, строки по банкам
+    <ANALYTICS_DIR>/<снимок>/transactions/bank_code=<код>/month=<ГГГГ-ММ>/*.parquet
+    <ANALYTICS_DIR>/<снимок>/balances/bank_code=<код>/*.parquet
+
+Новый снимок пишется рядом с текущим (файлы остальных банков переносятся
+жёсткими ссылками), затем атомарно меняется CURRENT: запросы видят снимок
+целиком, старый или новый
+
+pyarrow и duckdb — необязательные зависимости: без них или без ANALYTICS_DIR
+снимок не выгружается, а /api/analytics/* отвечают 503
+
+    python3 analytics.py export               # выгрузить все банки
+    python3 analytics.py export --bank abank  # обновить один банк
+    python3 analytics.py info
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from config import Config
+from app_logging import get_logger, setup_logging
+from database import ALL_SHARDS, db_manager
+
+logger = get_logger('analytics')
+
+SNAPSHOT_TABLES = ('transactions', 'balances', 'accounts')
+
+# Таблицы, дополнительно разбитые по месяцу: колонка с датой
+MONTH_PARTITIONS = {'transactions': 'booking_date_time'}
+
+# Типы колонок в Parquet; остальные — строки (даты в формате БД)
+COLUMN_TYPES = {'id': 'int64', 'amount': 'float64'}
+
+EXPORT_BATCH_SIZE = 50000
+
+# Сколько снимков хранить (текущий и предыдущий — под идущие запросы)
+KEEP_SNAPSHOTS = 2
+
+CURRENT_FILE = 'CURRENT'
+META_FILE = 'meta.json'
+
+# group_by эндпоинтов -> выражение DuckDB
+TRANSACTION_GROUPS = {
+    'bank': 'bank_code',
+    'month': 'month',
+    'category': "COALESCE(category, 'Без категории')",
+    'currency': 'currency',
+}
+BALANCE_GROUPS = {
+    'bank': 'bank_code',
+    'currency': 'currency',
+    'balance_type': 'balance_type',
+}
+# Банк отдаёт баланс счёта в нескольких видах (InterimAvailable, InterimBooked):
+# без фильтра и группировки по виду суммы удвоились бы
+DEFAULT_BALANCE_TYPE = 'InterimAvailable'
+ACCOUNT_GROUPS = {
+    'bank': 'bank_code',
+    'currency': 'currency',
+    'account_type': 'account_type',
+    'status': 'status',
+}
+
+
+class AnalyticsUnavailable(Exception):
+    """Снимок аналитики не настроен, не выгружен или нет зависимостей"""
+
+
+def _require_dependencies():
+    if pa is None or duckdb is None:
+        raise AnalyticsUnavailable('Для аналитики установите pyarrow и duckdb')
+
+
+def read_current(analytics_dir: str) -> Optional[str]:
+    """Каталог текущего снимка (None — снимка ещё нет)"""
+    try:
+        with open(os.path.join(analytics_dir, CURRENT_FILE), encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(analytics_dir, name) if name else None
+
+
+def read_meta(snapshot_dir: str) -> Dict:
+    with open(os.path.join(snapshot_dir, META_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _bank_dir(snapshot_dir: str, table: str, bank_code: str) -> str:
+    return os.path.join(snapshot_dir, table, f"bank_code={bank_code}")
+
+
+class SnapshotExporter:
+    """Выгрузка банковских таблиц в версионный Parquet снимок"""
+
+    def __init__(self, analytics_dir: str = None, database=None):
+        self.analytics_dir = analytics_dir or Config.ANALYTICS_DIR
+        self.database = database or db_manager
+        # Выгрузки после синхронизаций банков идут по очереди
+        self._lock = threading.Lock()
+
+    def bank_codes(self) -> List[str]:
+        if self.database.sharded:
+            return self.database.shard_codes()
+        rows = self.database.execute_query(
+            'SELECT code FROM banks UNION SELECT DISTINCT bank_code FROM clients', shard=ALL_SHARDS
+        )
+        return sorted({row['code'] for row in rows if row['code']})
+
+    def _read_table(self, cursor, table: str, bank_code: str):
+        """Строки банка одной таблицы пачками по EXPORT_BATCH_SIZE в pyarrow.Table"""
+        cursor.execute(f'SELECT * FROM {table} WHERE bank_code = ?', (bank_code,))
+        columns = [column[0] for column in cursor.description]
+        schema = pa.schema([(column, COLUMN_TYPES.get(column, 'string')) for column in columns])
+
+        batches = []
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            values = list(zip(*[tuple(row) for row in rows]))
+            batches.append(pa.RecordBatch.from_arrays(
+                [pa.array(values[i], type=field.type) for i, field in enumerate(schema)],
+                schema=schema
+            ))
+        return pa.Table.from_batches(batches, schema=schema)
+
+    def _export_bank(self, snapshot_dir: str, bank_code: str) -> Dict[str, int]:
+        """Выгрузить банк из одной транзакции чтения: таблицы согласованы"""
+        manager = self.database.get_shard(bank_code) if self.database.sharded else self.database
+        counts = {}
+        with manager.get_connection() as conn:
+            manager.backend.begin_snapshot(conn)
+            cursor = manager.backend.cursor(conn)
+            for table in SNAPSHOT_TABLES:
+                data = self._read_table(cursor, table, bank_code)
+                counts[table] = data.num_rows
+                if not data.num_rows:
+                    continue
+
+                # bank_code и month — в пути (hive партиции), не в файлах
+                data = data.drop_columns(['bank_code'])
+                partitioning = None
+                date_column = MONTH_PARTITIONS.get(table)
+                if date_column:
+                    month = pc.fill_null(pc.utf8_slice_codeunits(data[date_column], 0, 7), 'unknown')
+                    data = data.append_column('month', month)
+                    partitioning = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+                ds.write_dataset(
+                    data, _bank_dir(snapshot_dir, table, bank_code),
+                    format='parquet', partitioning=partitioning,
+                    basename_template='part-{i}.parquet'
+                )
+        return counts
+
+    def _link_bank(self, source_dir: str, snapshot_dir: str, bank_code: str):
+        """Перенести файлы банка из прошлого снимка жёсткими ссылками (без копирования)"""
+        for table in SNAPSHOT_TABLES:
+            source = _bank_dir(source_dir, table, bank_code)
+            if os.path.isdir(source):
+                shutil.copytree(source, _bank_dir(snapshot_dir, table, bank_code), copy_function=os.link)
+
+    def export(self, bank_codes: Optional[List[str]] = None) -> Dict:
+        """Выгрузить новый снимок и сделать его текущим
+
+        bank_codes — банки, которые перечитать из БД; данные остальных
+        берутся из текущего снимка. None — выгрузить все банки
+        """
+        _require_dependencies()
+        if not self.analytics_dir:
+            raise AnalyticsUnavailable('ANALYTICS_DIR не задан')
+
+        with self._lock:
+            os.makedirs(self.analytics_dir, exist_ok=True)
+            current = read_current(self.analytics_dir)
+            previous = read_meta(current)['banks'] if current else {}
+
+            name = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+            snapshot_dir = os.path.join(self.analytics_dir, name)
+            meta = {'snapshot': name, 'created_at': datetime.now(timezone.utc).isoformat(), 'banks': {}}
+
+            try:
+                for bank_code in self.bank_codes():
+                    if bank_codes is not None and bank_code not in bank_codes and bank_code in previous:
+                        self._link_bank(current, snapshot_dir, bank_code)
+                        meta['banks'][bank_code] = previous[bank_code]
+                    else:
+                        meta['banks'][bank_code] = self._export_bank(snapshot_dir, bank_code)
+
+                os.makedirs(snapshot_dir, exist_ok=True)
+                with open(os.path.join(snapshot_dir, META_FILE), 'w', encoding='utf-8') as f:
+                    json.dump(meta, f, ensure_ascii=False, indent=2)
+
+                # Подмена указателя атомарна: читатели не видят недописанный снимок
+                pointer = os.path.join(self.analytics_dir, f"{CURRENT_FILE}.tmp")
+                with open(pointer, 'w', encoding='utf-8') as f:
+                    f.write(name)
+                os.replace(pointer, os.path.join(self.analytics_dir, CURRENT_FILE))
+            except Exception:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                raise
+
+            self._prune(name)
+
+        rows = sum(sum(counts.values()) for counts in meta['banks'].values())
+        logger.info("📦 Снимок аналитики %s: банков %d, строк %d", name, len(meta['banks']), rows)
+        return meta
+
+    def _prune(self, current_name: str):
+        """Удалить старые снимки, кроме KEEP_SNAPSHOTS последних
+
+        Открытые DuckDB файлы удалённого снимка дочитываются (Linux)
+        """
+        snapshots = sorted(
+            entry.name for entry in os.scandir(self.analytics_dir)
+            if entry.is_dir() and entry.name <= current_name
+        )
+        for name in snapshots[:-KEEP_SNAPSHOTS]:
+            shutil.rmtree(os.path.join(self.analytics_dir, name), ignore_errors=True)
+
+
+class AnalyticsEngine:
+    """Запросы к текущему снимку во встроенном DuckDB
+
+    Представления пересоздаются, когда меняется CURRENT (выгрузка могла
+    пройти в другом процессе). Каждый запрос — в своём курсоре DuckDB:
+    потоки воркера не мешают друг другу
+    """
+
+    def __init__(self, analytics_dir: str = None):
+        self.analytics_dir = analytics_dir or Config.ANALYTICS_DIR
+        self._conn = None
+        self._snapshot = None
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    def _cursor(self):
+        _require_dependencies()
+        if not self.analytics_dir:
+            raise AnalyticsUnavailable('ANALYTICS_DIR не задан')
+        snapshot = read_current(self.analytics_dir)
+        if snapshot is None:
+            raise AnalyticsUnavailable('Снимок аналитики ещё не выгружен')
+
+        with self._lock:
+            if snapshot != self._snapshot:
+                conn = duckdb.connect()
+                tables = set()
+                for table in SNAPSHOT_TABLES:
+                    root = os.path.join(snapshot, table)
+                    if not os.path.isdir(root):
+                        continue
+                    hive_types = {'bank_code': 'VARCHAR'}
+                    if table in MONTH_PARTITIONS:
+                        hive_types['month'] = 'VARCHAR'
+                    conn.execute(
+                        f"CREATE VIEW {table} AS SELECT * FROM read_parquet("
+                        f"'{os.path.join(root, '**', '*.parquet')}', "
+                        f"hive_partitioning = true, union_by_name = true, hive_types = {hive_types})"
+                    )
+                    tables.add(table)
+                self._conn, self._snapshot, self._tables = conn, snapshot, tables
+                logger.debug("Снимок аналитики: %s", snapshot)
+            return self._conn.cursor(), self._tables
+
+    def _query(self, table: str, query: str, params: tuple = ()) -> List[Dict]:
+        cursor, tables = self._cursor()
+        try:
+            if table not in tables:
+                return []
+            cursor.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _group_by(group_by: List[str], groups: Dict[str, str]) -> List[str]:
+        unknown = [name for name in group_by if name not in groups]
+        if unknown:
+            raise ValueError(f"Недопустимая группировка: {', '.join(unknown)} (доступны: {', '.join(groups)})")
+        return [f"{groups[name]} AS {name}" for name in group_by]
+
+    def get_info(self) -> Dict:
+        """Метаданные текущего снимка"""
+        cursor, _ = self._cursor()
+        cursor.close()
+        return read_meta(self._snapshot)
+
+    def get_totals(self, group_by: List[str], bank_code: Optional[str] = None,
+                   month_from: Optional[str] = None, month_to: Optional[str] = None) -> List[Dict]:
+        """Доходы, расходы и число транзакций по группам (bank, month, category, currency)
+
+        month_from/month_to — ГГГГ-ММ включительно; фильтры по партициям
+        отсекают лишние файлы, не читая их
+        """
+        columns = self._group_by(group_by, TRANSACTION_GROUPS)
+        conditions = []
+        params = []
+        if bank_code:
+            conditions.append('bank_code = ?')
+            params.append(bank_code)
+        if month_from:
+            conditions.append('month >= ?')
+            params.append(month_from)
+        if month_to:
+            conditions.append('month <= ?')
+            params.append(month_to)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        keys = ', '.join(str(i + 1) for i in range(len(columns)))
+        query = f'''
+            SELECT {''.join(column + ', ' for column in columns)}
+                SUM(CASE WHEN credit_debit_indicator = 'Credit' THEN amount ELSE 0 END) AS total_income,
+                SUM(CASE WHEN credit_debit_indicator = 'Debit' THEN amount ELSE 0 END) AS total_expense,
+                COUNT(*) AS transaction_count
+            FROM transactions
+            {where}
+            {f'GROUP BY {keys} ORDER BY {keys}' if columns else ''}
+        '''
+        rows = self._query('transactions', query, tuple(params))
+        for row in rows:
+            row['total_income'] = row['total_income'] or 0
+            row['total_expense'] = row['total_expense'] or 0
+            row['balance'] = row['total_income'] - row['total_expense']
+        return rows
+
+    def get_balances(self, group_by: List[str], balance_type: Optional[str] = None) -> List[Dict]:
+        """Сумма балансов счетов по группам (bank, currency, balance_type)
+
+        Без balance_type и группировки по нему — DEFAULT_BALANCE_TYPE
+        """
+        columns = self._group_by(group_by, BALANCE_GROUPS)
+        if not balance_type and 'balance_type' not in columns:
+            balance_type = DEFAULT_BALANCE_TYPE
+        keys = ', '.join(str(i + 1) for i in range(len(columns)))
+        query = f'''
+            SELECT {''.join(column + ', ' for column in columns)}
+                SUM(CASE WHEN credit_debit_indicator = 'Debit' THEN -amount ELSE amount END) AS total,
+                COUNT(DISTINCT account_id) AS account_count
+            FROM balances
+            {'WHERE balance_type = ?' if balance_type else ''}
+            {f'GROUP BY {keys} ORDER BY {keys}' if columns else ''}
+        '''
+        return self._query('balances', query, (balance_type,) if balance_type else ())
+
+    def get_accounts(self, group_by: List[str]) -> List[Dict]:
+        """Число счетов по группам (bank, currency, account_type, status)"""
+        columns = self._group_by(group_by, ACCOUNT_GROUPS)
+        keys = ', '.join(str(i + 1) for i in range(len(columns)))
+        query = f'''
+            SELECT {''.join(column + ', ' for column in columns)}
+                COUNT(*) AS account_count
+            FROM accounts
+            {f'GROUP BY {keys} ORDER BY {keys}' if columns else ''}
+        '''
+        return self._query('accounts', query)
+
+
+_engine = None
+_exporter = None
+_analytics_lock = threading.Lock()
+
+
+def get_analytics_engine() -> AnalyticsEngine:
+    """Общий AnalyticsEngine процесса (создаётся при первом обращении)"""
+    global _engine
+    if _engine is None:
+        with _analytics_lock:
+            if _engine is None:
+                _engine = AnalyticsEngine()
+    return _engine
+
+
+def set_analytics_engine(engine: Optional[AnalyticsEngine]) -> Optional[AnalyticsEngine]:
+    """Подменить AnalyticsEngine; None — снова создавать при первом обращении
+
+    Возвращает предыдущий
+    """
+    global _engine
+    with _analytics_lock:
+        previous = _engine
+        _engine = engine
+    return previous
+
+
+def export_after_sync(result: Dict):
+    """Хук после успешной синхронизации: перевыгрузить банк в снимок"""
+    global _exporter
+    with _analytics_lock:
+        if _exporter is None:
+            _exporter = SnapshotExporter()
+    _exporter.export([result['bank_code']])
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Колоночный снимок для аналитики')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Выгрузить снимок')
+    export_parser.add_argument('--bank', action='append', help='Код банка (можно несколько раз)')
+
+    subparsers.add_parser('info', help='Текущий снимок')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    if not Config.ANALYTICS_DIR:
+        parser.error('ANALYTICS_DIR не задан')
+
+    if args.command == 'export':
+        meta = SnapshotExporter().export(args.bank)
+    else:
+        meta = get_analytics_engine().get_info()
+
+    print(f"📦 Снимок {meta['snapshot']} ({meta['created_at']})")
+    for bank_code, counts in meta['banks'].items():
+        print(f"🏦 {bank_code}: " + ', '.join(f"{table}: {count}" for table, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
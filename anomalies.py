@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# anomalies.py
+"""
+Поиск необычных транзакций клиентов без LLM
+После синхронизации банка его транзакции читаются одним запросом, статистика
+считается векторно в numpy по всем клиентам сразу, найденное сохраняется в
+transaction_anomalies. API (/api/clients/<id>/anomalies, /api/anomalies) и
+контекст AI читают готовую таблицу
+
+Виды аномалий (ANOMALY_KINDS):
+    amount        сумма далеко от обычной для клиента, категории и направления:
+                  робастный z-score по медиане и MAD выше ANOMALY_THRESHOLD
+    spike         расходы категории за месяц в ANOMALY_SPIKE_RATIO раз выше
+                  медианы месяцев клиента (отмечается крупнейшая транзакция месяца)
+    new_merchant  крупный платёж получателю, которому клиент раньше не платил,
+                  за последние ANOMALY_NEW_MERCHANT_DAYS дней истории клиента
+
+numpy — необязательная зависимость: без него поиск не выполняется, а API
+отдаёт сохранённые ранее результаты
+
+    python3 anomalies.py detect               # все банки
+    python3 anomalies.py detect --bank abank
+"""
+
+import argparse
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import Config
+from app_logging import get_logger, setup_logging
+from database import ALL_SHARDS, db_manager
+
+logger = get_logger('anomalies')
+
+ANOMALY_KINDS = {
+    'amount': 'Сумма намного выше обычной для категории',
+    'spike': 'Расходы категории за месяц намного выше обычных',
+    'new_merchant': 'Крупный платёж новому получателю',
+}
+
+# Меньше транзакций (месяцев) в группе — статистике не доверяем
+MIN_HISTORY = 5
+MIN_MONTHS = 3
+
+# MAD * 1.4826 (= MAD / 0.6745) оценивает стандартное отклонение; при MAD = 0
+# (больше половины сумм одинаковые) — среднее отклонение * 1.2533
+MAD_SCALE = 0.6745
+MEAN_DEVIATION_SCALE = 1.2533
+
+# Платёж новому получателю крупный, если во столько раз больше медианного расхода клиента
+NEW_MERCHANT_RATIO = 2.0
+
+READ_BATCH_SIZE = 50000
+
+# Транзакции банка: клиент, банк, id, категория, направление (income/expense),
+# сумма, дата ГГГГ-ММ-ДД, описание
+SOURCE_QUERIES = {
+    'banking': '''
+        SELECT
+            client_id,
+            bank_code,
+            transaction_id,
+            COALESCE(category, 'Без категории'),
+            CASE credit_debit_indicator WHEN 'Credit' THEN 'income' ELSE 'expense' END,
+            amount,
+            substr(CAST(booking_date_time AS TEXT), 1, 10),
+            COALESCE(transaction_information, '')
+        FROM transactions
+        WHERE bank_code = ? AND credit_debit_indicator IN ('Credit', 'Debit')
+          AND booking_date_time IS NOT NULL AND amount IS NOT NULL
+    ''',
+    'crm': '''
+        SELECT
+            CAST(client_id AS TEXT),
+            '',
+            CAST(id AS TEXT),
+            COALESCE(category, 'Без категории'),
+            direction,
+            amount,
+            substr(CAST(transaction_date AS TEXT), 1, 10),
+            COALESCE(description, '')
+        FROM transactions
+        WHERE transaction_date IS NOT NULL AND amount IS NOT NULL
+    '''
+}
+
+INSERT_ANOMALY = '''
+    INSERT INTO transaction_anomalies
+    (client_id, bank_code, transaction_id, kind, category, direction, amount,
+     booking_date, description, score, baseline)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Номера чеков, карт и заказов в описании не меняют получателя
+_MERCHANT_NOISE = re.compile(r'[\d#№*]+')
+
+
+class AnomaliesUnavailable(Exception):
+    """Поиск аномалий невозможен: нет numpy"""
+
+
+def _group_ids(*columns) -> 'np.ndarray':
+    """Плотные номера групп 0..n-1 по сочетанию значений колонок
+
+    Колонка — последовательность строк или уже номера (целые); номера
+    сочетания уплотняются после каждой колонки и не переполняют int64
+    """
+    ids = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        column = np.asarray(column)
+        if column.dtype.kind != 'i':
+            column = np.unique(column, return_inverse=True)[1]
+        ids = np.unique(ids * (column.max() + 1) + column, return_inverse=True)[1]
+    return ids
+
+
+def group_median(groups: 'np.ndarray', values: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """Медиана values по каждой группе (номера групп плотные) и размеры групп
+
+    Одна сортировка по (группа, значение): медиана группы — середина её отрезка
+    """
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups)
+    starts = np.cumsum(counts) - counts
+    lower = ordered[starts + (counts - 1) // 2]
+    upper = ordered[starts + counts // 2]
+    return (lower + upper) / 2, counts
+
+
+def _merchant(description: str) -> str:
+    return ' '.join(_MERCHANT_NOISE.sub(' ', description.lower()).split())
+
+
+class AnomalyDetector:
+    """Пакетный поиск аномалий по банку: чтение, numpy, замена результатов банка"""
+
+    def __init__(self, database=None, threshold: float = None, spike_ratio: float = None,
+                 new_merchant_days: int = None):
+        self.database = database or db_manager
+        self.threshold = threshold or Config.ANOMALY_THRESHOLD
+        self.spike_ratio = spike_ratio or Config.ANOMALY_SPIKE_RATIO
+        self.new_merchant_days = new_merchant_days or Config.ANOMALY_NEW_MERCHANT_DAYS
+        # Поиски после синхронизаций разных банков идут по очереди
+        self._lock = threading.Lock()
+
+    def _structure(self) -> str:
+        columns = self.database.get_columns('transactions')
+        return 'banking' if 'transaction_id' in columns else 'crm'
+
+    def bank_codes(self) -> List[str]:
+        """Банки с транзакциями; в CRM структуре — один банк ''"""
+        if self._structure() == 'crm':
+            return ['']
+        if self.database.sharded:
+            return self.database.shard_codes()
+        rows = self.database.execute_query('SELECT DISTINCT bank_code FROM transactions', shard=ALL_SHARDS)
+        return sorted(row['bank_code'] for row in rows if row['bank_code'])
+
+    def _manager(self, bank_code: str):
+        return self.database.get_shard(bank_code) if self.database.sharded else self.database
+
+    def _read(self, manager, structure: str, bank_code: str) -> List[tuple]:
+        with manager.get_connection() as conn:
+            cursor = manager.backend.cursor(conn)
+            cursor.execute(SOURCE_QUERIES[structure], (bank_code,) if structure == 'banking' else ())
+            rows = []
+            while True:
+                batch = cursor.fetchmany(READ_BATCH_SIZE)
+                if not batch:
+                    break
+                rows.extend(tuple(row) for row in batch)
+        return rows
+
+    def find(self, rows: List[tuple]) -> List[tuple]:
+        """Аномалии среди строк SOURCE_QUERIES: строки для INSERT_ANOMALY"""
+        if np is None:
+            raise AnomaliesUnavailable('Для поиска аномалий установите numpy')
+        if not rows:
+            return []
+
+        clients, banks, ids, categories, directions, amounts, dates, descriptions = zip(*rows)
+        amount = np.asarray(amounts, dtype=np.float64)
+        expense = np.asarray(directions) == 'expense'
+        client_ids = _group_ids(clients)
+        found = []
+
+        def flag(kind, index, score, baseline):
+            for i, s, b in zip(index.tolist(), score.tolist(), baseline.tolist()):
+                found.append((clients[i], banks[i], ids[i], kind, categories[i], directions[i],
+                              amounts[i], dates[i], descriptions[i], round(s, 2), round(b, 2)))
+
+        # amount: робастный z-score в группе клиент + категория + направление
+        group = _group_ids(client_ids, categories, directions)
+        median, counts = group_median(group, amount)
+        deviation = np.abs(amount - median[group])
+        mad, _ = group_median(group, deviation)
+        mean_deviation = np.bincount(group, weights=deviation) / counts
+        scale = np.where(mad > 0, mad / MAD_SCALE, mean_deviation * MEAN_DEVIATION_SCALE)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = (amount - median[group]) / scale[group]
+        outliers = np.flatnonzero((counts[group] >= MIN_HISTORY) & (scale[group] > 0) & (score > self.threshold))
+        flag('amount', outliers, score[outliers], median[group][outliers])
+
+        if not expense.any():
+            return found
+        rows_index = np.flatnonzero(expense)
+
+        # spike: сумма расходов группы за месяц против медианы её месяцев
+        expense_dates = np.asarray(dates)[rows_index]
+        months = expense_dates.astype('U7')
+        month_group = _group_ids(group[rows_index], months)
+        totals = np.bincount(month_group, weights=amount[rows_index])
+        parent = np.empty(len(totals), dtype=np.int64)
+        parent[month_group] = group[rows_index]
+        parent = np.unique(parent, return_inverse=True)[1]
+        month_median, month_counts = group_median(parent, totals)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = totals / month_median[parent]
+        spikes = np.flatnonzero((month_counts[parent] >= MIN_MONTHS) & (month_median[parent] > 0)
+                                & (ratio > self.spike_ratio))
+        if len(spikes):
+            # Крупнейшая транзакция месяца: последняя в сортировке (месяц, сумма)
+            order = np.lexsort((amount[rows_index], month_group))
+            last = np.cumsum(np.bincount(month_group)) - 1
+            largest = rows_index[order[last]]
+            flag('spike', largest[spikes], ratio[spikes], month_median[parent][spikes])
+
+        # new_merchant: первая оплата получателю в последние дни истории клиента
+        unique_descriptions, description_ids = np.unique(np.asarray(descriptions)[rows_index], return_inverse=True)
+        merchant_names = np.array([_merchant(description) for description in unique_descriptions.tolist()])
+        merchant = _group_ids(merchant_names[description_ids])
+        day = expense_dates.astype('datetime64[D]').astype(np.int64)
+        client = _group_ids(client_ids[rows_index])
+        client_median, _ = group_median(client, amount[rows_index])
+        client_first = np.full(client.max() + 1, np.iinfo(np.int64).max)
+        client_last = np.full(client.max() + 1, np.iinfo(np.int64).min)
+        np.minimum.at(client_first, client, day)
+        np.maximum.at(client_last, client, day)
+
+        pair = _group_ids(client, merchant)
+        order = np.lexsort((day, pair))
+        pair_counts = np.bincount(pair)
+        first = order[np.cumsum(pair_counts) - pair_counts]
+        window_start = client_last[client[first]] - self.new_merchant_days
+        baseline = client_median[client[first]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = amount[rows_index][first] / baseline
+        named = merchant_names[description_ids[first]] != ''
+        new = ((day[first] >= window_start) & (client_first[client[first]] < window_start)
+               & (baseline > 0) & (score >= NEW_MERCHANT_RATIO) & named)
+        flag('new_merchant', rows_index[first[new]], score[new], baseline[new])
+        return found
+
+    def detect(self, bank_codes: Optional[List[str]] = None) -> Dict[str, int]:
+        """Пересчитать аномалии банков: {bank_code: найдено}
+
+        Результаты банка заменяются в одной транзакции: читатели видят
+        старый или новый набор целиком
+        """
+        if np is None:
+            raise AnomaliesUnavailable('Для поиска аномалий установите numpy')
+
+        structure = self._structure()
+        found = {}
+        with self._lock:
+            for bank_code in bank_codes if bank_codes is not None else self.bank_codes():
+                manager = self._manager(bank_code)
+                if manager is None:
+                    continue
+                anomalies = self.find(self._read(manager, structure, bank_code))
+                with manager.get_connection() as conn:
+                    cursor = manager.backend.cursor(conn)
+                    cursor.execute('DELETE FROM transaction_anomalies WHERE bank_code = ?', (bank_code,))
+                    if anomalies:
+                        cursor.executemany(INSERT_ANOMALY, anomalies)
+                found[bank_code] = len(anomalies)
+                logger.info("🔎 Аномалии %s: %d", bank_code or 'CRM', len(anomalies))
+        return found
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_anomaly_detector() -> AnomalyDetector:
+    """Детектор процесса (создаётся при первом вызове по Config)"""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = AnomalyDetector()
+    return _detector
+
+
+def detect_after_sync(result: Dict):
+    """Хук после успешной синхронизации: пересчитать аномалии банка"""
+    if np is None:
+        logger.warning("⚠️ numpy не установлен: аномалии %s не пересчитаны", result['bank_code'])
+        return
+    get_anomaly_detector().detect([result['bank_code']])
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Поиск необычных транзакций')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    detect_parser = subparsers.add_parser('detect', help='Пересчитать аномалии')
+    detect_parser.add_argument('--bank', action='append', help='Код банка (можно несколько раз)')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    try:
+        found = get_anomaly_detector().detect(args.bank)
+    except AnomaliesUnavailable as e:
+        parser.error(str(e))
+
+    print(f"✅ Аномалий: {sum(found.values())} (банков: {len(found)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,37 @@
 Flask REST API для AI CRM системы
 Endpoints для работы с клиентами, транзакциями и AI
 """
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for
+from flask import Flask, Blueprint, request, jsonify, render_template, session, redirect, url_for
 from flask_cors import CORS
 from typing import Optional
 from functools import wraps
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import math
+import time
 from config import Config
 from repositories import (
     ClientRepository,
+    CustomerRepository,
     TransactionRepository,
-    AIConversationRepository
+    AIConversationRepository,
+    AIAnalysisRepository,
+    DataVersionRepository,
+    SyncRunRepository,
+    AnomalyRepository
 )
-from ai_service import ai_service
+from database import db_manager, set_db_manager, DatabaseManager
+from ai_service import ai_service, set_ai_service, AIService
+from assets import init_assets
+from app_logging import get_logger, setup_logging, init_request_logging
+from client_refresh import get_client_refresher, RefreshRateLimited
+from analytics import get_analytics_engine, AnalyticsUnavailable
+from bulk_ingest import BulkIngest, detect_after_ingest, detect_format
 import bcrypt
 
-app = Flask(__name__)
-app.secret_key = Config.SECRET_KEY  # Для работы сессий
-CORS(app)
+# Все маршруты приложения; регистрируются в create_app
+crm = Blueprint('crm', __name__)
 
-# Настройки сессий
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 часа
+logger = get_logger('api')
 
 
 # ============ AUTHENTICATION ============
@@ -38,15 +48,28 @@ def login_required(f):
     return decorated_function
 
 
-@app.route('/login')
+def read_snapshot(f):
+    """Декоратор: все чтения эндпоинта из одного снимка БД
+    
+    Несколько запросов одного ответа (список, количество, балансы) видят
+    согласованные данные, пока импорт пишет в БД
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with db_manager.snapshot():
+            return f(*args, **kwargs)
+    return decorated_function
+
+
+@crm.route('/login')
 def login_page():
     """Страница авторизации"""
     if session.get('authenticated'):
-        return redirect(url_for('index'))
+        return redirect(url_for('crm.index'))
     return render_template('login.html')
 
 
-@app.route('/api/auth/login', methods=['POST'])
+@crm.route('/api/auth/login', methods=['POST'])
 def login():
     """API авторизации с bcrypt хешированием"""
     try:
@@ -95,21 +118,21 @@ def login():
             }), 401
             
     except Exception as e:
-        print(f"❌ Ошибка авторизации: {str(e)}")
+        logger.exception("❌ Ошибка авторизации: %s", e)
         return jsonify({
             'success': False,
             'message': 'Ошибка сервера при авторизации'
         }), 500
 
 
-@app.route('/api/auth/logout', methods=['POST'])
+@crm.route('/api/auth/logout', methods=['POST'])
 def logout():
     """Выход из системы"""
     session.clear()
     return jsonify({'success': True, 'message': 'Вы вышли из системы'}), 200
 
 
-@app.route('/api/auth/check', methods=['GET'])
+@crm.route('/api/auth/check', methods=['GET'])
 def check_auth():
     """Проверка статуса авторизации"""
     return jsonify({
@@ -119,91 +142,148 @@ def check_auth():
 
 # ============ MAIN PAGE ============
 
-@app.route('/')
+@crm.route('/')
 def index():
     """Главная страница"""
     if not session.get('authenticated'):
-        return redirect(url_for('login_page'))
+        return redirect(url_for('crm.login_page'))
     return render_template('index.html')
 
 # ============ CLIENTS ENDPOINTS ============
 
-@app.route('/api/clients', methods=['GET'])
+# Максимальный размер страницы списка клиентов
+MAX_CLIENTS_PAGE = 500
+
+
+@crm.route('/api/clients', methods=['GET'])
 @login_required
+@read_snapshot
 def get_clients():
+    """Список клиентов с балансом и рейтингом
+    
+    ?offset=0&limit=100 — постраничная выдача, в ответе total.
+    Без limit — все клиенты
+    """
     try:
-        print("Получение списка клиентов...")
         status = request.args.get('status')
-        print(f"Фильтр по статусу: {status}")
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 0 < limit <= MAX_CLIENTS_PAGE:
+            return jsonify(error=f'limit должен быть от 1 до {MAX_CLIENTS_PAGE}'), 400
+        
+        clients = ClientRepository.get_all(status=status, limit=limit, offset=offset)
+        total = ClientRepository.get_count(status=status) if limit else offset + len(clients)
         
-        clients = ClientRepository.get_all(status=status)
-        print(f"Найдено клиентов: {len(clients)}")
-        print(f"Первые 3 клиента: {clients[:3] if clients else []}")
+        # Балансы только клиентов страницы; статистика для рейтинга —
+        # из кэша до изменения данных
+        balances = TransactionRepository.get_balances([str(client['id']) for client in clients])
+        balance_stats = TransactionRepository.get_balance_stats()
         
-        # Добавляем баланс для каждого клиента
         for client in clients:
-            try:
-                summary = TransactionRepository.get_summary(client['id'])
-                client['balance'] = summary['balance']
-                
-                # Добавляем рейтинг
-                rating = TransactionRepository.calculate_client_rating(client['id'])
-                client['rating'] = rating
-            except Exception as e:
-                print(f"Ошибка при получении данных для клиента {client['id']}: {e}")
-                client['balance'] = 0
-                client['rating'] = 3.0
-        
-        return jsonify(clients=clients), 200
+            balance = balances.get(str(client['id']), 0)
+            client['balance'] = balance
+            client['rating'] = TransactionRepository.rating_from_balance(balance, balance_stats)
+        
+        return jsonify(clients=clients, total=total, offset=offset, limit=limit), 200
     except Exception as e:
-        print(f"Ошибка в get_clients: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка в get_clients: %s", e)
         return jsonify(error=str(e)), 500
 
-@app.route('/api/clients/<string:client_id>', methods=['GET'])
+# Секции карточки клиента для ?include= и лимит по умолчанию (None — без лимита)
+CLIENT_DETAIL_SECTIONS = {
+    'summary': None,
+    'transactions': None,
+    'recent_tx': 10,
+    'categories': None,
+    'conversations': 10,
+    'anomalies': 10
+}
+MAX_INCLUDE_LIMIT = 500
+
+
+def parse_include(raw: Optional[str]) -> Optional[dict]:
+    """Разобрать ?include=summary,recent_tx:10,categories в {секция: лимит}
+    
+    None — параметр не передан (полный ответ, как раньше)
+    """
+    if raw is None:
+        return None
+    
+    include = {}
+    for item in raw.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, limit = item.partition(':')
+        if name not in CLIENT_DETAIL_SECTIONS:
+            raise ValueError(f"Неизвестная секция: {name}")
+        if limit:
+            if not limit.isdigit() or not 0 < int(limit) <= MAX_INCLUDE_LIMIT:
+                raise ValueError(f"Лимит секции {name} должен быть от 1 до {MAX_INCLUDE_LIMIT}")
+            include[name] = int(limit)
+        else:
+            include[name] = CLIENT_DETAIL_SECTIONS[name]
+    return include
+
+
+@crm.route('/api/clients/<string:client_id>', methods=['GET'])
 @login_required
+@read_snapshot
 def get_client_details(client_id):
-    """Получить детальную информацию о клиенте"""
+    """Получить детальную информацию о клиенте
+    
+    ?include=summary,recent_tx:10,categories,conversations:5 — вернуть только
+    нужные секции; лимиты передаются в запросы к БД. recent_tx отдаётся
+    в поле transactions. Без include — все секции и вся история транзакций
+    """
     try:
-        print(f"🔍 Запрос клиента: {client_id}")
+        try:
+            include = parse_include(request.args.get('include'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if include is None:
+            include = {'transactions': None, 'summary': None, 'conversations': 10, 'categories': None,
+                       'anomalies': 10}
         
         # Получаем данные клиента
         client = ClientRepository.get_by_id(client_id)
         if not client:
-            print(f"❌ Клиент не найден: {client_id}")
+            logger.debug("Клиент не найден: %s", client_id)
             return jsonify({'error': 'Клиент не найден'}), 404
         
-        print(f"✅ Найден клиент: {client}")
+        result = {'client': client}
         
-        # Получаем транзакции
-        transactions = TransactionRepository.get_by_client(client_id)
-        print(f"📊 Транзакций: {len(transactions)}")
+        # Транзакции: вся история или последние N
+        if 'transactions' in include or 'recent_tx' in include:
+            limit = include.get('recent_tx') if 'transactions' not in include else include['transactions']
+            result['transactions'] = TransactionRepository.get_by_client(client_id, limit=limit)
         
-        # Получаем финансовую сводку
-        summary = TransactionRepository.get_summary(client_id)
-        print(f"💰 Сводка: {summary}")
+        # Финансовая сводка
+        if 'summary' in include:
+            result['summary'] = TransactionRepository.get_summary(client_id)
         
-        # Получаем историю AI диалогов
-        conversations = AIConversationRepository.get_by_client(client_id, limit=10)
+        # История AI диалогов
+        if 'conversations' in include:
+            result['conversations'] = AIConversationRepository.get_by_client(
+                client_id, limit=include['conversations'] or 10
+            )
         
-        # Получаем статистику по категориям
-        categories = TransactionRepository.get_by_category(client_id)
+        # Статистика по категориям
+        if 'categories' in include:
+            result['categories'] = TransactionRepository.get_by_category(client_id, limit=include['categories'])
         
-        return jsonify({
-            'client': client,
-            'transactions': transactions,
-            'summary': summary,
-            'conversations': conversations,
-            'categories': categories
-        }), 200
+        # Необычные транзакции (anomalies.py)
+        if 'anomalies' in include:
+            limit = min(max(include['anomalies'] or 10, 1), MAX_INCLUDE_LIMIT)
+            result['anomalies'] = AnomalyRepository.get_by_client(client_id, limit=limit)
+        
+        return jsonify(result), 200
     except Exception as e:
-        print(f"❌ Ошибка получения клиента: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка получения клиента %s: %s", client_id, e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/clients', methods=['POST'])
+@crm.route('/api/clients', methods=['POST'])
 @login_required
 def create_client():
     """Создать нового клиента"""
@@ -228,7 +308,7 @@ def create_client():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/clients/<string:client_id>', methods=['PUT'])
+@crm.route('/api/clients/<string:client_id>', methods=['PUT'])
 @login_required
 def update_client(client_id):
     """Обновить данные клиента"""
@@ -250,7 +330,7 @@ def update_client(client_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/clients/<string:client_id>', methods=['DELETE'])
+@crm.route('/api/clients/<string:client_id>', methods=['DELETE'])
 @login_required
 def delete_client(client_id):
     """Удалить клиента"""
@@ -264,9 +344,71 @@ def delete_client(client_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@crm.route('/api/customers/<string:client_id>', methods=['GET'])
+@login_required
+@read_snapshot
+def get_customer(client_id):
+    """Клиент по всем банкам: показатели в каждом банке и общий итог"""
+    try:
+        if ClientRepository._detect_structure() != 'banking':
+            return jsonify({'error': 'Сводка по банкам доступна только для банковской БД'}), 400
+        
+        customer = CustomerRepository.get_by_id(client_id)
+        if not customer:
+            return jsonify({'error': 'Клиент не найден'}), 404
+        
+        return jsonify(customer), 200
+    except Exception as e:
+        logger.exception("❌ Ошибка сводки клиента %s: %s", client_id, e)
+        return jsonify({'error': str(e)}), 500
+
 # ============ TRANSACTIONS ENDPOINTS ============
 
-@app.route('/api/transactions', methods=['POST'])
+@crm.route('/api/clients/<string:client_id>/refresh', methods=['POST'])
+@login_required
+def refresh_client(client_id):
+    """Загрузить свежие данные клиента из банка
+    
+    Только этот клиент в этом банке: несколько запросов к API банка вместо
+    полного импорта. Параллельные запросы на одного клиента ждут одну загрузку
+    (coalesced: true), слишком частые получают 429 с Retry-After
+    """
+    try:
+        if ClientRepository._detect_structure() != 'banking':
+            return jsonify({'error': 'Обновление из банка доступно только для банковской БД'}), 400
+        
+        client = ClientRepository.get_by_id(client_id)
+        if not client:
+            return jsonify({'error': 'Клиент не найден'}), 404
+        
+        try:
+            future, coalesced = get_client_refresher().submit(
+                client['client_id_original'], client['bank_code']
+            )
+        except RefreshRateLimited as e:
+            retry_after = max(1, math.ceil(e.retry_after))
+            response = jsonify({'error': str(e), 'retry_after': retry_after})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        
+        try:
+            result = future.result(timeout=Config.CLIENT_REFRESH_TIMEOUT)
+        except FuturesTimeoutError:
+            # Загрузка продолжается в фоне, данные появятся по /api/data-version
+            return jsonify({'status': 'pending', 'coalesced': coalesced}), 202
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 404
+        
+        result = dict(result, coalesced=coalesced)
+        if not result['success']:
+            return jsonify(dict(result, error='Банк не вернул данные клиента')), 502
+        
+        return jsonify(result), 200
+    except Exception as e:
+        logger.exception("❌ Ошибка обновления клиента %s: %s", client_id, e)
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/transactions', methods=['POST'])
 @login_required
 def create_transaction():
     """Создать новую транзакцию"""
@@ -299,20 +441,122 @@ def create_transaction():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/clients/<string:client_id>/transactions', methods=['GET'])
+@crm.route('/api/transactions/bulk', methods=['POST'])
+@login_required
+def bulk_create_transactions():
+    """Массовая загрузка транзакций CRM из NDJSON или CSV (bulk_ingest.py)
+    
+    Файл — телом запроса (Content-Type: application/x-ndjson или text/csv)
+    или полем file формы; ?format=ndjson|csv — если тип не определяется.
+    Ошибочные строки пропускаются и возвращаются с номером строки
+    """
+    try:
+        if TransactionRepository._detect_structure() == 'banking':
+            return jsonify({'error': 'Используйте банковский API для создания транзакций'}), 400
+        
+        upload = request.files.get('file')
+        if upload is not None:
+            stream = upload.stream
+            fmt = request.args.get('format') or detect_format(upload.mimetype, upload.filename)
+        else:
+            stream = request.stream
+            fmt = request.args.get('format') or detect_format(request.mimetype)
+        if fmt is None:
+            return jsonify({'error': 'Формат файла: ndjson или csv'}), 400
+        
+        report = BulkIngest().run(stream, fmt)
+        detect_after_ingest(report)
+        return jsonify(report), 201 if report['inserted'] else 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("❌ Ошибка массовой загрузки транзакций: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/transactions/search', methods=['GET'])
+@login_required
+def search_transactions():
+    """Полнотекстовый поиск транзакций (q; client_id, bank, from, to — фильтры)"""
+    try:
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), 500)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        transactions = TransactionRepository.search(
+            request.args.get('q', type=str),
+            client_id=request.args.get('client_id', type=str),
+            bank_code=request.args.get('bank', type=str),
+            date_from=request.args.get('from', type=str),
+            date_to=request.args.get('to', type=str),
+            limit=limit,
+            offset=offset
+        )
+        return jsonify({'transactions': transactions, 'offset': offset, 'limit': limit}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/clients/<string:client_id>/transactions', methods=['GET'])
 @login_required
 def get_client_transactions(client_id):
     """Получить транзакции клиента"""
     try:
         limit = request.args.get('limit', type=int)
-        transactions = TransactionRepository.get_by_client(client_id, limit=limit)
-        return jsonify({'transactions': transactions}), 200
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        transactions = TransactionRepository.get_by_client(client_id, limit=limit, offset=offset)
+        return jsonify({'transactions': transactions, 'offset': offset, 'limit': limit}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/clients/<string:client_id>/timeline', methods=['GET'])
+@login_required
+def get_client_timeline(client_id):
+    """Доходы и расходы клиента по периодам (granularity: month, quarter, year)"""
+    try:
+        granularity = request.args.get('granularity', default='month', type=str)
+        timeline = TransactionRepository.get_timeline(
+            client_id,
+            granularity=granularity,
+            month_from=request.args.get('from', type=str),
+            month_to=request.args.get('to', type=str)
+        )
+        return jsonify({'timeline': timeline, 'granularity': granularity}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============ ANOMALIES ENDPOINTS ============
+
+@crm.route('/api/clients/<string:client_id>/anomalies', methods=['GET'])
+@login_required
+def get_client_anomalies(client_id):
+    """Необычные транзакции клиента (пересчитываются после синхронизации)"""
+    try:
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), 500)
+        anomalies = AnomalyRepository.get_by_client(client_id, limit=limit)
+        return jsonify({'anomalies': anomalies}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/anomalies', methods=['GET'])
+@login_required
+def get_anomalies():
+    """Последние необычные транзакции по всем клиентам"""
+    try:
+        kind = request.args.get('kind', type=str)
+        bank_code = request.args.get('bank', type=str)
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), 500)
+        
+        anomalies = AnomalyRepository.get_recent(kind=kind, bank_code=bank_code, limit=limit)
+        return jsonify({'anomalies': anomalies}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ============ AI ENDPOINTS ============
 
-@app.route('/api/ai/ask', methods=['POST'])
+@crm.route('/api/ai/ask', methods=['POST'])
 @login_required
 def ai_ask():
     """Задать вопрос AI ассистенту"""
@@ -334,22 +578,30 @@ def ai_ask():
             }), 500
         
         # Сохраняем диалог в БД
+        timings = result.get('timings', {})
+        started = time.perf_counter()
         AIConversationRepository.create(
             client_id=client_id,
             question=question,
             answer=result['answer'],
             context_data=str(result.get('context_summary'))
         )
+        timings['persist_ms'] = (time.perf_counter() - started) * 1000
         
-        return jsonify({
+        response = jsonify({
             'answer': result['answer'],
             'model': result['model'],
             'has_context': result['has_context']
-        }), 200
+        })
+        # Длительность этапов для профилирования (см. bench_ai.py)
+        response.headers['Server-Timing'] = ', '.join(
+            f"{name[:-3]};dur={value:.1f}" for name, value in timings.items()
+        )
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/ai/suggestions', methods=['GET'])
+@crm.route('/api/ai/suggestions', methods=['GET'])
 @login_required
 def ai_suggestions():
     """Получить предложенные вопросы"""
@@ -360,58 +612,89 @@ def ai_suggestions():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/ai/conversations', methods=['GET'])
+@crm.route('/api/ai/conversations', methods=['GET'])
 @login_required
 def get_conversations():
-    """Получить историю AI диалогов"""
+    """Получить историю AI диалогов (client_id, q — поиск; before — следующая страница)"""
     try:
-        client_id = request.args.get('client_id', type=str)
-        limit = request.args.get('limit', default=20, type=int)
+        limit = min(max(request.args.get('limit', default=20, type=int), 1), 100)
+        conversations = AIConversationRepository.get_page(
+            client_id=request.args.get('client_id', type=str),
+            text=request.args.get('q', type=str),
+            before=request.args.get('before', type=int),
+            limit=limit
+        )
+        # Курсор следующей страницы: id последнего диалога, если страница полная
+        next_before = conversations[-1]['id'] if len(conversations) == limit else None
+        return jsonify({'conversations': conversations, 'next_before': next_before}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/ai/analyses', methods=['GET'])
+@login_required
+@read_snapshot
+def get_analyses():
+    """Получить результаты последнего пакетного AI анализа по клиентам"""
+    try:
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), 500)
+        order_by = request.args.get('order_by', default='turnover', type=str)
         
-        if client_id:
-            conversations = AIConversationRepository.get_by_client(client_id, limit=limit)
-        else:
-            conversations = AIConversationRepository.get_recent_global(limit=limit)
+        analyses = AIAnalysisRepository.get_latest(limit=limit, order_by=order_by)
+        return jsonify({'analyses': analyses}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/ai/analyses/<string:client_id>', methods=['GET'])
+@login_required
+def get_client_analysis(client_id):
+    """Получить последний пакетный AI анализ клиента"""
+    try:
+        analysis = AIAnalysisRepository.get_by_client(client_id)
         
-        return jsonify({'conversations': conversations}), 200
+        if not analysis:
+            return jsonify({'error': 'Анализ для клиента не найден'}), 404
+        
+        return jsonify({'analysis': analysis}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============ SYNC ENDPOINTS ============
+
+@crm.route('/api/sync/runs', methods=['GET'])
+@login_required
+def get_sync_runs():
+    """История синхронизаций с банками (sync_scheduler.py)"""
+    try:
+        bank_code = request.args.get('bank', type=str)
+        limit = min(max(request.args.get('limit', default=50, type=int), 1), 500)
+        
+        runs = SyncRunRepository.get_recent(bank_code=bank_code, limit=limit)
+        return jsonify({'runs': runs}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ============ STATISTICS ENDPOINTS ============
 
-@app.route('/api/stats', methods=['GET'])
+@crm.route('/api/stats', methods=['GET'])
 @login_required
+@read_snapshot
 def get_stats():
     """Получить общую статистику системы"""
     try:
-        print("📥 Запрос статистики")
-        
         # Статистика клиентов
         total_clients = ClientRepository.get_count()
-        print(f"👥 Всего клиентов: {total_clients}")
-        
         active_clients = ClientRepository.get_count(status='active')
-        print(f"✅ Активных клиентов: {active_clients}")
         
-        # Получаем финансовую статистику по всем клиентам
-        clients = ClientRepository.get_all()
-        print(f"📊 Получено клиентов для статистики: {len(clients)}")
+        # Финансовая статистика по всем клиентам одним агрегатом
+        # (в раздельном режиме — параллельно по БД банков)
+        totals = TransactionRepository.get_totals()
+        total_income = totals['total_income']
+        total_expense = totals['total_expense']
+        total_transactions = totals['transaction_count']
         
-        total_income = 0
-        total_expense = 0
-        total_transactions = 0
-        
-        for client in clients:
-            try:
-                summary = TransactionRepository.get_summary(client['id'])
-                total_income += summary['total_income']
-                total_expense += summary['total_expense']
-                total_transactions += summary['transaction_count']
-            except Exception as e:
-                print(f"⚠️ Ошибка получения транзакций для клиента {client['id']}: {e}")
-                continue
-        
-        print(f"💰 Доходы: {total_income}, Расходы: {total_expense}")
+        logger.debug("Статистика: клиентов %d, доходы %s, расходы %s", total_clients, total_income, total_expense)
         
         return jsonify({
             'clients': {
@@ -427,40 +710,164 @@ def get_stats():
             }
         }), 200
     except Exception as e:
-        print(f"❌ ОШИБКА в get_stats: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка в get_stats: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@crm.route('/api/data-version', methods=['GET'])
+@login_required
+@read_snapshot
+def get_data_version():
+    """Версия данных: фронтенд перезагружает список клиентов, только когда она меняется"""
+    try:
+        return jsonify({'version': DataVersionRepository.get_version()}), 200
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
+@crm.route('/api/health', methods=['GET'])
 def health_check():
-    """Проверка работоспособности API"""
+    """Проверка готовности API: процесс жив и БД доступна"""
+    database_ok = db_manager.ping()
     return jsonify({
-        'status': 'ok',
+        'status': 'ok' if database_ok else 'unavailable',
         'service': 'AI CRM API',
-        'version': '1.0.0'
-    }), 200
+        'version': '1.0.0',
+        'database': 'ok' if database_ok else 'unavailable'
+    }), 200 if database_ok else 503
+
+# ============ ANALYTICS ENDPOINTS ============
+
+def parse_group_by(default: str) -> list:
+    """group_by=bank,month → ['bank', 'month']; пустой — без группировки"""
+    raw = request.args.get('group_by', default, type=str)
+    return [name.strip() for name in raw.split(',') if name.strip()]
+
+
+def analytics_endpoint(f):
+    """Декоратор: ошибки аналитики — 400 (параметры) и 503 (нет снимка)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except AnalyticsUnavailable as e:
+            return jsonify({'error': str(e)}), 503
+        except Exception as e:
+            logger.exception("❌ Ошибка аналитики: %s", e)
+            return jsonify({'error': str(e)}), 500
+    return decorated_function
+
+
+@crm.route('/api/analytics/snapshot', methods=['GET'])
+@login_required
+@analytics_endpoint
+def get_analytics_snapshot():
+    """Текущий снимок аналитики: время выгрузки и строки по банкам"""
+    return jsonify(get_analytics_engine().get_info()), 200
+
+@crm.route('/api/analytics/totals', methods=['GET'])
+@login_required
+@analytics_endpoint
+def get_analytics_totals():
+    """Доходы и расходы по портфелю: group_by из bank, month, category, currency"""
+    rows = get_analytics_engine().get_totals(
+        parse_group_by('bank,month'),
+        bank_code=request.args.get('bank', type=str),
+        month_from=request.args.get('from', type=str),
+        month_to=request.args.get('to', type=str)
+    )
+    return jsonify({'totals': rows}), 200
+
+@crm.route('/api/analytics/balances', methods=['GET'])
+@login_required
+@analytics_endpoint
+def get_analytics_balances():
+    """Балансы счетов: group_by из bank, currency, balance_type"""
+    rows = get_analytics_engine().get_balances(
+        parse_group_by('bank,currency'),
+        balance_type=request.args.get('balance_type', type=str)
+    )
+    return jsonify({'balances': rows}), 200
+
+@crm.route('/api/analytics/accounts', methods=['GET'])
+@login_required
+@analytics_endpoint
+def get_analytics_accounts():
+    """Количество счетов: group_by из bank, currency, account_type, status"""
+    rows = get_analytics_engine().get_accounts(parse_group_by('bank'))
+    return jsonify({'accounts': rows}), 200
 
 # ============ ERROR HANDLERS ============
 
-@app.errorhandler(404)
+@crm.app_errorhandler(404)
 def not_found(error):
     """Обработчик 404 ошибки"""
     return jsonify({'error': 'Endpoint не найден'}), 404
 
-@app.errorhandler(500)
+@crm.app_errorhandler(500)
 def internal_error(error):
     """Обработчик 500 ошибки"""
     return jsonify({'error': 'Внутренняя ошибка сервера'}), 500
 
+# ============ APP FACTORY ============
+
+def create_app(config: Optional[dict] = None,
+               database: Optional[DatabaseManager] = None,
+               ai: Optional[AIService] = None) -> Flask:
+    """Создать Flask приложение
+    
+    Args:
+        config: дополнительные настройки Flask (app.config)
+        database: менеджер БД вместо Config.DATABASE_FILE,
+                  например DatabaseManager(':memory:') в тестах
+        ai: AI сервис вместо создаваемого по Config
+    
+    БД и AI сервис создаются лениво — при первом запросе, а не здесь.
+    database и ai подменяют общие объекты процесса (set_db_manager,
+    set_ai_service): репозитории берут db_manager из модуля, поэтому
+    подмена действует на все приложения процесса, включая app ниже.
+    Два приложения с разными БД в одном процессе не поддерживаются;
+    тестам следует вернуть прежние объекты после себя
+    """
+    if database is not None:
+        set_db_manager(database)
+    if ai is not None:
+        set_ai_service(ai)
+    
+    setup_logging()
+    
+    app = Flask(__name__)
+    app.secret_key = Config.SECRET_KEY  # Для работы сессий
+    CORS(app)
+    
+    # Настройки сессий
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 часа
+    if config:
+        app.config.update(config)
+    
+    # Хэшированная статика из static/dist и gzip для JSON
+    init_assets(app)
+    # X-Request-ID и correlation_id в логах запроса
+    init_request_logging(app)
+    
+    app.register_blueprint(crm)
+    return app
+
+
+# Экземпляр для gunicorn (app:app) и запуска напрямую
+app = create_app()
+
 # ============ MAIN ============
 
 if __name__ == '__main__':
-    print("🚀 Запуск AI CRM API сервера...")
-    print(f"📍 URL: http://{Config.FLASK_HOST}:{Config.FLASK_PORT}")
-    print(f"🤖 AI модель: {Config.AI_MODEL}")
-    print(f"💾 База данных: {Config.DATABASE_FILE}")
-    print("-" * 50)
+    logger.info("🚀 Запуск AI CRM API сервера: http://%s:%s", Config.FLASK_HOST, Config.FLASK_PORT)
+    logger.info("🤖 AI модель: %s, 💾 база данных: %s", Config.AI_MODEL, Config.DATABASE_FILE)
+    
+    if Config.SYNC_ENABLED:
+        from sync_scheduler import start_scheduler
+        start_scheduler()
     
     app.run(
         host=Config.FLASK_HOST,
@@ -0,0 +1,234 @@
+# app_logging.py
+"""
+Логирование сервиса
+- уровни (LOG_LEVEL), вывод текстом или JSON построчно (LOG_FORMAT=text|json)
+- запись в stderr идёт из отдельного потока (QueueListener): поток запроса
+  только кладёт запись в очередь и не ждёт синхронный stdout
+- correlation_id запроса (заголовок X-Request-ID) или задачи (синхронизация,
+  пакетный анализ) попадает в каждую запись через contextvars
+- частые сообщения выборочные: extra=sampled() пропускает долю LOG_SAMPLE_RATE
+
+Сообщения передаются с аргументами: logger.debug("Клиент %s", client_id) —
+строка собирается, только если запись действительно пишется
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import Config
+
+ROOT_LOGGER = 'crm'
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Входящий X-Request-ID попадает в логи как есть — только безопасные символы
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+# Атрибуты LogRecord, которые не надо дублировать в JSON как extra поля
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'correlation_id', 'sample_rate', 'context'
+}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер модуля: get_logger('importer') → crm.importer"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def bind_correlation_id(value: Optional[str] = None):
+    """Все записи внутри блока (в этом потоке/контексте) получают correlation_id"""
+    token = correlation_id.set(value or new_correlation_id())
+    try:
+        yield correlation_id.get()
+    finally:
+        correlation_id.reset(token)
+
+
+def sampled(rate: Optional[float] = None) -> dict:
+    """extra для частых сообщений: пишется только доля rate (по умолчанию LOG_SAMPLE_RATE)
+
+        logger.debug("Транзакция %s", tx_id, extra=sampled())
+    """
+    return {'sample_rate': Config.LOG_SAMPLE_RATE if rate is None else rate}
+
+
+class ContextFilter(logging.Filter):
+    """Добавить correlation_id и отбросить невыбранные sampled() записи"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, 'sample_rate', None)
+        if rate is not None and rate < 1 and random.random() >= rate:
+            return False
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; extra поля записи добавляются как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'correlation_id', None):
+            data['correlation_id'] = record.correlation_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                data[key] = value
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Отдать запись потоку записи: сообщение и traceback собираются здесь
+    (аргументы могут измениться позже), форматирование строки вывода — в потоке записи"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """Текст для консоли: время, уровень, [correlation_id] логгер: сообщение"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(context)s%(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        cid = getattr(record, 'correlation_id', None)
+        record.context = f"[{cid}] " if cid else ''
+        return super().format(record)
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _start_listener(handler: logging.Handler, log_queue: queue.Queue):
+    global _listener
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, force: bool = False):
+    """Настроить логгер crm (повторный вызов ничего не делает, кроме force=True)
+
+    Args:
+        level: уровень (по умолчанию Config.LOG_LEVEL)
+        fmt: 'text' или 'json' (по умолчанию Config.LOG_FORMAT)
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    with _setup_lock:
+        if root.handlers and not force:
+            return root
+
+        _stop_listener()
+        for old_handler in list(root.handlers):
+            root.removeHandler(old_handler)
+
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if (fmt or Config.LOG_FORMAT) == 'json' else TextFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+
+        root.addHandler(queue_handler)
+        root.setLevel((level or Config.LOG_LEVEL).upper())
+        root.propagate = False
+        _start_listener(handler, log_queue)
+
+        # Поток записи не переживает fork (gunicorn preload_app) — поднимаем заново в воркере
+        if hasattr(os, 'register_at_fork') and not getattr(setup_logging, '_fork_hook', False):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+            setup_logging._fork_hook = True
+
+    return root
+
+
+def init_request_logging(app):
+    """correlation_id на каждый запрос Flask
+
+    Берётся из X-Request-ID (прокси, фронтенд) или создаётся, возвращается
+    в ответе тем же заголовком. На уровне DEBUG запросы пишутся выборочно
+    """
+    from flask import g, request
+
+    http_logger = get_logger('http')
+
+    @app.before_request
+    def bind_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        correlation_id.set(incoming if _REQUEST_ID_PATTERN.match(incoming) else new_correlation_id())
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        cid = correlation_id.get()
+        if cid:
+            response.headers[REQUEST_ID_HEADER] = cid
+        if http_logger.isEnabledFor(logging.DEBUG):
+            duration_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+            http_logger.debug("%s %s → %s за %.1f мс", request.method, request.path,
+                              response.status_code, duration_ms, extra=sampled())
+        return response
+
+    @app.teardown_request
+    def unbind_request_id(error):
+        # Поток gthread обслуживает следующие запросы — id не должен «протечь»
+        correlation_id.set(None)
+
+
+def _restart_after_fork():
+    """В дочернем процессе: новая очередь (блокировку старой мог держать поток
+    записи родителя в момент fork) и новый поток записи"""
+    global _listener
+    if _listener is None:
+        return
+    handler = _listener.handlers[0]
+    _listener = None
+
+    log_queue = queue.SimpleQueue()
+    for queue_handler in logging.getLogger(ROOT_LOGGER).handlers:
+        if isinstance(queue_handler, _QueueHandler):
+            queue_handler.queue = log_queue
+    _start_listener(handler, log_queue)
+
+
+atexit.register(_stop_listener)
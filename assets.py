@@ -0,0 +1,100 @@
+# assets.py
+"""
+Раздача статики и сжатие ответов
+- url_for('static', filename='app.js') → dist/app.<хэш>.js по манифесту build_assets.py
+- файлы из static/dist отдаются с Cache-Control: immutable и заранее сжатыми (.br/.gz)
+- JSON ответы API больше порога сжимаются gzip на лету
+"""
+
+import gzip
+import json
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+from config import Config
+from app_logging import get_logger
+
+logger = get_logger('assets')
+
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Заранее сжатые варианты в порядке предпочтения
+PRECOMPRESSED = [('br', '.br'), ('gzip', '.gz')]
+
+
+def load_manifest(static_folder: str) -> dict:
+    """Манифест сборки: {'app.js': 'dist/app.<хэш>.js'}; пустой, если сборки нет"""
+    path = os.path.join(static_folder, DIST_DIRNAME, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _accepts(encoding: str) -> bool:
+    return encoding in request.headers.get('Accept-Encoding', '').lower()
+
+
+def _add_vary(response):
+    vary = {v.strip() for v in response.headers.get('Vary', '').split(',') if v.strip()}
+    vary.add('Accept-Encoding')
+    response.headers['Vary'] = ', '.join(sorted(vary))
+
+
+def init_assets(app):
+    """Подключить манифест статики, раздачу static/dist и gzip для JSON"""
+    manifest = load_manifest(app.static_folder)
+    dist_folder = os.path.join(app.static_folder, DIST_DIRNAME)
+    app.extensions['asset_manifest'] = manifest
+
+    if manifest:
+        logger.info("📦 Статика из сборки: %d файлов", len(manifest))
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        """Подменить имя файла на хэшированное из манифеста"""
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    @app.route(f'{app.static_url_path}/{DIST_DIRNAME}/<path:filename>')
+    def dist_asset(filename):
+        """Собранный файл: имя меняется вместе с содержимым, поэтому кэш бессрочный"""
+        response = None
+        for encoding, suffix in PRECOMPRESSED:
+            if _accepts(encoding) and os.path.exists(os.path.join(dist_folder, filename + suffix)):
+                # Тип по исходному имени, а не по .gz/.br
+                response = send_from_directory(
+                    dist_folder, filename + suffix,
+                    mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                )
+                response.headers['Content-Encoding'] = encoding
+                break
+
+        if response is None:
+            response = send_from_directory(dist_folder, filename)
+
+        response.headers['Cache-Control'] = f'public, max-age={Config.STATIC_MAX_AGE}, immutable'
+        _add_vary(response)
+        return response
+
+    @app.after_request
+    def gzip_json_response(response):
+        """Сжать крупный JSON ответ, если клиент принимает gzip"""
+        if (response.mimetype != 'application/json'
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not _accepts('gzip')):
+            return response
+
+        data = response.get_data()
+        if len(data) < Config.GZIP_MIN_SIZE:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=Config.GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        _add_vary(response)
+        return response
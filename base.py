@@ -6,20 +6,29 @@ base.py - Прямой импорт данных из банковских API 
 """
 
 import requests
-import sqlite3
 import os
 import json
 import time
 from datetime import datetime
 from dotenv import load_dotenv
 
+from app_logging import get_logger, setup_logging
+from database import (ROLLUP_UPSERT, ensure_anomaly_table, ensure_category_column,
+                      ensure_rollup_table, ensure_transaction_search, reclassify_transactions,
+                      shard_file)
+from categorizer import get_categorizer
+from storage import create_backend
+
 load_dotenv()
 
+logger = get_logger('importer')
+
 class DirectAPIToSQLite:
     """Получение данных из API банков и прямая запись в SQLite"""
     
     def __init__(self, db_file='multibank_real.db'):
         self.db_file = db_file
+        self.backend = None
         self.conn = None
         self.cursor = None
 
@@ -56,10 +65,37 @@ class DirectAPIToSQLite:
             "team047-10": "consent-c45178b64ae1"
         }
         
+        # Количество клиентов в каждом банке ({CLIENT_ID}-1 ... {CLIENT_ID}-N)
+        self.clients_per_bank = 10
+        
         # Настройки повторов
         self.max_retries = 5
         self.retry_delay = 1.5
         self.request_delay = 0.5
+        self.client_delay = 0.5
+        self.bank_delay = 1
+        
+        # Пагинация транзакций
+        self.page_size = 100
+        self.max_pages = 50
+        
+        # Инкрементальная синхронизация: транзакции с этой даты (ISO 8601).
+        # Банк может игнорировать фильтр — дубликаты отсекает UNIQUE(transaction_id, bank_code)
+        self.since = None
+        
+        # Запись в БД: API читает ту же БД, поэтому WAL и короткие транзакции.
+        # Данные клиента сначала скачиваются целиком, потом пишутся пачками
+        self.journal_mode = 'WAL'
+        self.busy_timeout = 30  # секунд ожидания блокировки
+        self.write_batch_size = 1000  # строк на транзакцию
+        
+        # Итоги новых транзакций (transaction_rollups) до записи вместе с ними:
+        # (client_id, bank_code, month, direction, category) -> [сумма, количество]
+        self.rollup_deltas = {}
+        
+        # Раздельные БД: каждый банк пишется в <shard_dir>/<bank_code>.db
+        # (см. DB_SHARD_DIR в config.py); None — все банки в db_file
+        self.shard_dir = os.getenv('DB_SHARD_DIR') or None
         
         # Статистика
         self.stats = {
@@ -74,23 +110,36 @@ class DirectAPIToSQLite:
     
     # ==================== СОЗДАНИЕ БАЗЫ ДАННЫХ ====================
     
-    def create_database(self):
-        """Создать БД со схемой (если не существует) или переиспользовать существующую"""
+    def database_file(self, bank_code=None):
+        """Файл БД банка: в раздельном режиме свой на каждый банк"""
+        if self.shard_dir and bank_code:
+            return shard_file(self.shard_dir, bank_code)
+        return self.db_file
+    
+    
+    def create_database(self, bank_code=None):
+        """Создать БД со схемой (если не существует) или переиспользовать существующую
         
-        db_exists = os.path.exists(self.db_file)
+        bank_code — в раздельном режиме (shard_dir) открыть БД этого банка
+        """
+        # DB_BACKEND=postgresql — подключение из пула, запросы переводит storage.py
+        self.backend = create_backend(self.database_file(bank_code), self.busy_timeout)
+        db_exists = self.backend.exists()
         
         if db_exists:
-            print("📊 Подключение к существующей БД...")
-            print(f"  ℹ️  БД: {self.db_file}")
-            print(f"  🔄 Режим: Обновление данных")
+            logger.debug("📊 Подключение к существующей БД %s: обновление данных", self.backend.location)
         else:
-            print("📊 Создание новой БД...")
-            print(f"  ✨ БД: {self.db_file}")
-            print(f"  🔄 Режим: Первичная инициализация")
+            logger.info("📊 Создание новой БД %s: первичная инициализация", self.backend.location)
+            if self.shard_dir and bank_code:
+                os.makedirs(self.shard_dir, exist_ok=True)
         
         # Подключаемся к БД (создаст файл если не существует)
-        self.conn = sqlite3.connect(self.db_file)
-        self.cursor = self.conn.cursor()
+        self.conn = self.backend.connect()
+        self.cursor = self.backend.cursor(self.conn)
+        
+        # WAL: читатели API не блокируются записью импорта (PostgreSQL PRAGMA пропускает)
+        self.cursor.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        self.cursor.execute('PRAGMA synchronous=NORMAL')
         
         # Таблица банков
         self.cursor.execute('''
@@ -168,6 +217,7 @@ class DirectAPIToSQLite:
                 value_date_time TIMESTAMP,
                 transaction_code TEXT,
                 transaction_information TEXT,
+                category TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 UNIQUE(transaction_id, bank_code)
             )
@@ -190,39 +240,53 @@ class DirectAPIToSQLite:
             )
         ''')
         
+        # Полнотекстовый поиск: индекс ведут триггеры, в существующей БД строится по всей таблице
+        ensure_transaction_search(self.backend, self.cursor)
+        
+        # Категории (categorizer.py): в БД без колонки считаются по всей таблице
+        if ensure_category_column(self.backend, self.cursor):
+            reclassify_transactions(self.backend, self.cursor)
+        
+        # Помесячные итоги для таймлайна; в существующей БД считаются из transactions
+        ensure_rollup_table(self.backend, self.cursor, 'banking')
+        ensure_anomaly_table(self.cursor)
+        
         self.conn.commit()
         
-        if db_exists:
-            print("  ✓ Подключено к существующей БД")
-            print("  💡 Новые данные будут добавлены/обновлены\n")
-        else:
-            print("  ✓ БД схема создана\n")
+        if not db_exists:
+            logger.info("✓ БД схема создана")
     
     
     # ==================== API МЕТОДЫ ====================
     
     def get_token(self, bank_url):
-        """Получить токен для банка"""
-        try:
-            response = requests.post(
-                f"{bank_url}/auth/bank-token",
-                params={
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret
-                },
-                timeout=10
-            )
+        """Получить токен для банка (с повторами при 429/5xx и сетевых ошибках)"""
+        for attempt in range(self.max_retries):
+            try:
+                response = requests.post(
+                    f"{bank_url}/auth/bank-token",
+                    params={
+                        "client_id": self.client_id,
+                        "client_secret": self.client_secret
+                    },
+                    timeout=10
+                )
+                
+                if response.status_code == 200:
+                    data = response.json()
+                    token = data.get('access_token') or data.get('bank_token')
+                    return token
+                
+                logger.warning("❌ Токен не получен (status: %s)", response.status_code)
+                if response.status_code != 429 and response.status_code < 500:
+                    return None
+            except Exception as e:
+                logger.warning("❌ Ошибка получения токена: %s", e)
             
-            if response.status_code == 200:
-                data = response.json()
-                token = data.get('access_token') or data.get('bank_token')
-                return token
-            else:
-                print(f"  ❌ Токен не получен (status: {response.status_code})")
-                return None
-        except Exception as e:
-            print(f"  ❌ Ошибка получения токена: {e}")
-            return None
+            if attempt < self.max_retries - 1:
+                time.sleep(self.retry_delay)
+        
+        return None
     
     
     def get_products(self, bank_url, bank_code):
@@ -254,13 +318,13 @@ class DirectAPIToSQLite:
                         ))
                         self.stats['products'] += 1
                     except Exception as e:
-                        print(f"  ⚠️ Ошибка сохранения продукта: {e}")
+                        logger.warning("⚠️ Ошибка сохранения продукта: %s", e)
                 
                 self.conn.commit()
                 return len(products)
             return 0
         except Exception as e:
-            print(f"  ⚠️ Ошибка получения продуктов: {e}")
+            logger.warning("⚠️ Ошибка получения продуктов: %s", e)
             return 0
     
     
@@ -271,10 +335,10 @@ class DirectAPIToSQLite:
         if bank_code == 'vbank':
             existing_consent = self.vbank_consents.get(client_id)
             if existing_consent:
-                print(f"    ✓ Используем существующий consent: {existing_consent}")
+                logger.debug("✓ Используем существующий consent: %s", existing_consent)
                 return existing_consent
             else:
-                print(f"    ⚠️ Нет consent для {client_id}")
+                logger.warning("⚠️ Нет consent для %s", client_id)
                 return None
         
         # Для abank - создаём новый (автоматически)
@@ -312,14 +376,14 @@ class DirectAPIToSQLite:
                     data = response.json()
                     consent_id = data.get('consent_id') or data.get('consentId')
                     if consent_id:
-                        print(f"    ✓ Consent ID: {consent_id}")
+                        logger.debug("✓ Consent ID: %s", consent_id)
                         return consent_id
                 
                 if attempt < self.max_retries - 1:
                     time.sleep(self.retry_delay)
                     
             except Exception as e:
-                print(f"    ⚠️ Ошибка создания согласия: {e}")
+                logger.warning("⚠️ Ошибка создания согласия: %s", e)
                 if attempt < self.max_retries - 1:
                     time.sleep(self.retry_delay)
         
@@ -351,7 +415,7 @@ class DirectAPIToSQLite:
                         return accounts
                 
                 if attempt < self.max_retries - 1:
-                    print(f"  ⏳ Попытка {attempt + 1}/{self.max_retries}: счетов нет, повтор...")
+                    logger.debug("⏳ Попытка %d/%d: счетов нет, повтор...", attempt + 1, self.max_retries)
                     time.sleep(self.retry_delay)
             except Exception as e:
                 if attempt < self.max_retries - 1:
@@ -386,8 +450,20 @@ class DirectAPIToSQLite:
         return []
     
     
+    def transaction_params(self, page):
+        """Параметры запроса страницы транзакций"""
+        params = {'limit': self.page_size, 'page': page}
+        if self.since:
+            params['from_booking_date_time'] = self.since
+        return params
+    
+    
     def get_transactions_with_retry(self, bank_url, token, account_id, consent_id):
-        """Получить транзакции с повторами если пусто"""
+        """Получить транзакции с повторами если пусто (все страницы)
+        
+        При инкрементальной загрузке (since) пустой ответ 200 — нормальный
+        случай: новых транзакций нет, повтор только при ошибке запроса
+        """
         for attempt in range(self.max_retries):
             headers = {
                 'Authorization': f'Bearer {token}',
@@ -399,7 +475,7 @@ class DirectAPIToSQLite:
             try:
                 response = requests.get(
                     f"{bank_url}/accounts/{account_id}/transactions",
-                    params={'limit': 100, 'page': 1},
+                    params=self.transaction_params(1),
                     headers=headers,
                     timeout=10
                 )
@@ -408,10 +484,14 @@ class DirectAPIToSQLite:
                     data = response.json()
                     transactions = data if isinstance(data, list) else data.get('data', {}).get('transaction', [])
                     if transactions:
+                        if isinstance(data, dict):
+                            transactions += self.get_next_transaction_pages(bank_url, headers, account_id, data)
                         return transactions
+                    if self.since:
+                        return []
                 
                 if attempt < self.max_retries - 1:
-                    print(f"  ⏳ Попытка {attempt + 1}/{self.max_retries}: транзакций нет, повтор...")
+                    logger.debug("⏳ Попытка %d/%d: транзакций нет, повтор...", attempt + 1, self.max_retries)
                     time.sleep(self.retry_delay)
             except Exception as e:
                 if attempt < self.max_retries - 1:
@@ -420,6 +500,48 @@ class DirectAPIToSQLite:
         return []
     
     
+    def get_next_transaction_pages(self, bank_url, headers, account_id, first_page):
+        """Догрузить страницы 2..N, если API вернул meta.totalPages или links.next"""
+        total_pages = first_page.get('meta', {}).get('totalPages') or 0
+        has_next = bool(first_page.get('links', {}).get('next'))
+        transactions = []
+        page = 2
+        
+        while (page <= total_pages or (not total_pages and has_next)) and page <= self.max_pages:
+            data = None
+            for attempt in range(self.max_retries):
+                time.sleep(self.request_delay)
+                try:
+                    response = requests.get(
+                        f"{bank_url}/accounts/{account_id}/transactions",
+                        params=self.transaction_params(page),
+                        headers=headers,
+                        timeout=10
+                    )
+                    if response.status_code == 200:
+                        data = response.json()
+                        break
+                except Exception as e:
+                    pass
+                
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.retry_delay)
+            
+            if data is None:
+                logger.warning("⚠️ Страница %d транзакций %s не получена", page, account_id)
+                break
+            
+            page_transactions = data.get('data', {}).get('transaction', [])
+            if not page_transactions:
+                break
+            
+            transactions += page_transactions
+            has_next = bool(data.get('links', {}).get('next'))
+            page += 1
+        
+        return transactions
+    
+    
     # ==================== СОХРАНЕНИЕ В БД ====================
     
     def save_account_to_db(self, account, client_id, bank_code):
@@ -459,7 +581,7 @@ class DirectAPIToSQLite:
             ))
             self.stats['accounts'] += 1
         except Exception as e:
-            print(f"  ⚠️ Ошибка сохранения счета: {e}")
+            logger.warning("⚠️ Ошибка сохранения счета: %s", e)
     
     
     def save_balance_to_db(self, balance, account_id, client_id, bank_code):
@@ -486,11 +608,11 @@ class DirectAPIToSQLite:
             ))
             self.stats['balances'] += 1
         except Exception as e:
-            print(f"  ⚠️ Ошибка сохранения баланса: {e}")
+            logger.warning("⚠️ Ошибка сохранения баланса: %s", e)
     
     
-    def save_transaction_to_db(self, transaction, account_id, client_id, bank_code):
-        """Сохранить транзакцию в БД"""
+    def save_transaction_to_db(self, transaction, account_id, client_id, bank_code, category=None):
+        """Сохранить транзакцию в БД (category — из categorizer.py)"""
         try:
             amount_data = transaction.get('amount', {})
             bank_tx_code = transaction.get('bankTransactionCode', {})
@@ -499,12 +621,19 @@ class DirectAPIToSQLite:
             if not transaction_id:
                 transaction_id = f"tx-{bank_code}-{int(time.time()*1000)}"
             
+            if category is None:
+                category = get_categorizer().categorize(
+                    transaction.get('transactionInformation', ''),
+                    bank_tx_code.get('code'),
+                    transaction.get('creditDebitIndicator')
+                )
+            
             self.cursor.execute('''
                 INSERT OR IGNORE INTO transactions
                 (transaction_id, account_id, client_id, bank_code, amount,
                  currency, credit_debit_indicator, status,
-                 booking_date_time, value_date_time, transaction_code, transaction_information)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 booking_date_time, value_date_time, transaction_code, transaction_information, category)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 transaction_id,
                 account_id,
@@ -517,11 +646,79 @@ class DirectAPIToSQLite:
                 transaction.get('bookingDateTime'),
                 transaction.get('valueDateTime'),
                 bank_tx_code.get('code'),
-                transaction.get('transactionInformation', '')
+                transaction.get('transactionInformation', ''),
+                category
             ))
             self.stats['transactions'] += 1
+            
+            # Уже сохранённые транзакции (INSERT OR IGNORE) в итоги не добавляются
+            if self.cursor.rowcount == 1:
+                self.add_to_rollup(client_id, bank_code, transaction, category)
         except Exception as e:
-            print(f"  ⚠️ Ошибка сохранения транзакции: {e}")
+            logger.warning("⚠️ Ошибка сохранения транзакции: %s", e)
+    
+    
+    def add_to_rollup(self, client_id, bank_code, transaction, category):
+        """Учесть новую транзакцию в итогах месяца (как ROLLUP_BACKFILL)"""
+        direction = {'Credit': 'income', 'Debit': 'expense'}.get(transaction.get('creditDebitIndicator'))
+        booking_date = transaction.get('bookingDateTime')
+        if direction is None or not booking_date:
+            return
+        
+        key = (client_id, bank_code, str(booking_date)[:7], direction, category)
+        delta = self.rollup_deltas.setdefault(key, [0.0, 0])
+        delta[0] += float(transaction.get('amount', {}).get('amount') or 0)
+        delta[1] += 1
+    
+    
+    def flush_rollups(self):
+        """Добавить накопленные итоги в transaction_rollups (в текущей транзакции)"""
+        if not self.rollup_deltas:
+            return
+        self.cursor.executemany(ROLLUP_UPSERT, [
+            key + (total, count) for key, (total, count) in self.rollup_deltas.items()
+        ])
+        self.rollup_deltas = {}
+    
+    
+    def save_client_data(self, client_id, bank_code, accounts, balances, transactions):
+        """Записать счета, балансы и транзакции клиента
+        
+        Коммит каждые write_batch_size строк: блокировка записи держится
+        миллисекунды, и запросы API на запись не ждут весь импорт клиента.
+        Итоги месяцев коммитятся вместе со своими транзакциями
+        """
+        rows = 0
+        
+        def flush_if_needed():
+            nonlocal rows
+            rows += 1
+            if rows % self.write_batch_size == 0:
+                self.flush_rollups()
+                self.conn.commit()
+        
+        for acc in accounts:
+            self.save_account_to_db(acc, client_id, bank_code)
+            flush_if_needed()
+        
+        for bal, acc_id in balances:
+            self.save_balance_to_db(bal, acc_id, client_id, bank_code)
+            flush_if_needed()
+        
+        # Категории всей пачки клиента одним вызовом: описания повторяются,
+        # каждое уникальное проверяется правилами один раз
+        categories = get_categorizer().categorize_many(
+            (tx.get('transactionInformation', ''), tx.get('bankTransactionCode', {}).get('code'),
+             tx.get('creditDebitIndicator'))
+            for tx, _ in transactions
+        )
+        
+        for (tx, acc_id), category in zip(transactions, categories):
+            self.save_transaction_to_db(tx, acc_id, client_id, bank_code, category)
+            flush_if_needed()
+        
+        self.flush_rollups()
+        self.conn.commit()
     
     
     # ==================== ОСНОВНАЯ ЛОГИКА ====================
@@ -532,9 +729,7 @@ class DirectAPIToSQLite:
         bank_code = bank['code']
         bank_url = bank['url']
         
-        print(f"\n{'='*70}")
-        print(f"🏦 БАНК: {bank_name} ({bank_code})")
-        print(f"{'='*70}")
+        logger.info("🏦 Банк: %s (%s)", bank_name, bank_code)
         
         # Сохраняем банк в БД
         try:
@@ -545,104 +740,129 @@ class DirectAPIToSQLite:
             self.stats['banks'] += 1
             self.conn.commit()
         except Exception as e:
-            print(f"  ❌ Ошибка сохранения банка: {e}")
+            logger.error("❌ Ошибка сохранения банка %s: %s", bank_code, e)
             return 0, 0
         
         # Получаем токен
-        print(f"🔑 Получение токена...")
+        logger.debug("🔑 Получение токена...")
         token = self.get_token(bank_url)
         if not token:
-            print(f"❌ Банк {bank_name} пропущен - нет токена\n")
+            logger.error("❌ Банк %s пропущен - нет токена", bank_name)
             return 0, 0
-        print(f"  ✅ Токен получен")
+        logger.debug("✅ Токен получен")
         
         # Получаем продукты
-        print(f"📦 Получение продуктов...")
         products_count = self.get_products(bank_url, bank_code)
-        print(f"  ✅ Получено {products_count} продуктов")
+        logger.debug("📦 Получено %d продуктов", products_count)
         
         # Получаем данные клиентов
-        print(f"\n👥 Получение данных 10 клиентов...\n")
+        logger.info("👥 Получение данных %d клиентов...", self.clients_per_bank)
         successful_clients = 0
         failed_clients = []
         
-        for i in range(1, 11):
+        for i in range(1, self.clients_per_bank + 1):
             client_id = f"{self.client_id}-{i}"
-            print(f"  👤 Клиент {i}/10: {client_id}")
-            
-            # Сохраняем клиента в БД
-            try:
-                self.cursor.execute('''
-                    INSERT OR IGNORE INTO clients (client_id, bank_code)
-                    VALUES (?, ?)
-                ''', (client_id, bank_code))
-                self.stats['clients'] += 1
-                self.conn.commit()
-            except Exception as e:
-                print(f"  ❌ Ошибка сохранения клиента: {e}")
-                failed_clients.append(client_id)
-                continue
+            logger.debug("👤 Клиент %d/%d: %s", i, self.clients_per_bank, client_id)
             
-            # Получаем consent (используем существующий для vbank)
-            consent_id = self.create_consent_with_retry(bank_url, token, client_id, bank_code)
-            if not consent_id:
-                print(f"  ❌ Согласие не получено")
+            if not self.fetch_client_data(bank_url, bank_code, token, client_id):
                 failed_clients.append(client_id)
                 continue
             
-            # Получаем счета
-            accounts = self.get_accounts_with_retry(bank_url, token, client_id, consent_id)
-            print(f"  → Счетов: {len(accounts)}")
-            
-            if not accounts:
-                print(f"  ❌ Счета не получены после {self.max_retries} попыток")
-                failed_clients.append(client_id)
-                continue
-            
-            # Для каждого счета
-            total_balances = 0
-            total_transactions = 0
-            
-            for acc in accounts:
-                acc_id = acc.get('accountId')
-                
-                # Сохраняем счет
-                self.save_account_to_db(acc, client_id, bank_code)
-                
-                # Балансы
-                balances = self.get_balances(bank_url, token, acc_id, consent_id)
-                for bal in balances:
-                    self.save_balance_to_db(bal, acc_id, client_id, bank_code)
-                    total_balances += 1
-                
-                # Транзакции
-                transactions = self.get_transactions_with_retry(bank_url, token, acc_id, consent_id)
-                for tx in transactions:
-                    self.save_transaction_to_db(tx, acc_id, client_id, bank_code)
-                    total_transactions += 1
-            
-            # Сохраняем изменения после каждого клиента
-            self.conn.commit()
-            
-            print(f"  💾 Балансов: {total_balances}, Транзакций: {total_transactions}")
             successful_clients += 1
             
             # Пауза между клиентами
-            if i < 10:
-                time.sleep(0.5)
+            if i < self.clients_per_bank:
+                time.sleep(self.client_delay)
         
         # Итоги по банку
-        print(f"\n {'─'*66}")
-        print(f"  ✅ Успешно: {successful_clients}/10 клиентов")
+        logger.info("✅ %s: успешно %d/%d клиентов", bank_code, successful_clients, self.clients_per_bank)
         if failed_clients:
-            print(f"  ❌ Не удалось: {len(failed_clients)}")
-            for client in failed_clients:
-                print(f"    • {client}")
-        print(f" {'─'*66}")
+            logger.warning("❌ %s: не удалось %d: %s", bank_code, len(failed_clients), ', '.join(failed_clients))
         
         return successful_clients, len(failed_clients)
     
     
+    def fetch_client_data(self, bank_url, bank_code, token, client_id):
+        """Получить и сохранить данные одного клиента банка
+        
+        Returns:
+            True, если данные клиента сохранены
+        """
+        # Сохраняем клиента в БД
+        try:
+            self.cursor.execute('''
+                INSERT OR IGNORE INTO clients (client_id, bank_code)
+                VALUES (?, ?)
+            ''', (client_id, bank_code))
+            self.stats['clients'] += 1
+            self.conn.commit()
+        except Exception as e:
+            logger.warning("❌ Ошибка сохранения клиента %s: %s", client_id, e)
+            return False
+        
+        # Получаем consent (используем существующий для vbank)
+        consent_id = self.create_consent_with_retry(bank_url, token, client_id, bank_code)
+        if not consent_id:
+            logger.warning("❌ Согласие для %s не получено", client_id)
+            return False
+        
+        # Получаем счета
+        accounts = self.get_accounts_with_retry(bank_url, token, client_id, consent_id)
+        logger.debug("→ Счетов: %d", len(accounts))
+        
+        if not accounts:
+            logger.warning("❌ Счета %s не получены после %d попыток", client_id, self.max_retries)
+            return False
+        
+        # Для каждого счета скачиваем балансы и транзакции
+        # (без записи: транзакция БД не должна висеть на время HTTP запросов)
+        balances = []
+        transactions = []
+        
+        for acc in accounts:
+            acc_id = acc.get('accountId')
+            
+            for bal in self.get_balances(bank_url, token, acc_id, consent_id):
+                balances.append((bal, acc_id))
+            
+            for tx in self.get_transactions_with_retry(bank_url, token, acc_id, consent_id):
+                transactions.append((tx, acc_id))
+        
+        # Сохраняем клиента короткими транзакциями
+        self.save_client_data(client_id, bank_code, accounts, balances, transactions)
+        
+        logger.debug("💾 %s: балансов %d, транзакций %d", client_id, len(balances), len(transactions))
+        return True
+    
+    
+    def refresh_client(self, client_id, bank_code):
+        """Обновить одного клиента банка (POST /api/clients/<id>/refresh)
+        
+        Токен, согласие, счета, балансы и транзакции только этого клиента —
+        несколько запросов вместо полного импорта
+        
+        Returns:
+            True, если данные клиента сохранены
+        Raises:
+            ValueError: банк не настроен
+        """
+        bank = next((b for b in self.banks if b['code'] == bank_code), None)
+        if bank is None:
+            raise ValueError(f"Банк не настроен: {bank_code}")
+        
+        try:
+            self.create_database(bank_code)
+            
+            token = self.get_token(bank['url'])
+            if not token:
+                logger.error("❌ Банк %s: нет токена", bank['name'])
+                return False
+            
+            return self.fetch_client_data(bank['url'], bank_code, token, client_id)
+        finally:
+            self.close()
+    
+    
     def fetch_all_banks(self):
         """Получить данные всех банков"""
         print("""
@@ -661,19 +881,24 @@ class DirectAPIToSQLite:
         
         # Обрабатываем каждый банк
         for bank in self.banks:
+            if self.shard_dir:
+                # Каждый банк — в свою БД
+                self.close()
+                self.create_database(bank['code'])
             successful, failed = self.fetch_bank_data(bank)
             total_successful += successful
             total_failed += failed
             
             # Пауза между банками
-            time.sleep(1)
+            time.sleep(self.bank_delay)
         
         # Финальные итоги
+        total_clients = self.clients_per_bank * len(self.banks)
         print(f"\n{'='*70}")
         print(f"🎉 ФИНАЛЬНЫЕ ИТОГИ ПО ВСЕМ БАНКАМ")
         print(f"{'='*70}")
-        print(f"✅ Всего успешно обработано: {total_successful}/20 клиентов")
-        print(f"❌ Не удалось обработать: {total_failed}/20 клиентов")
+        print(f"✅ Всего успешно обработано: {total_successful}/{total_clients} клиентов")
+        print(f"❌ Не удалось обработать: {total_failed}/{total_clients} клиентов")
         print(f"{'='*70}\n")
         
         return total_successful > 0
@@ -742,31 +967,52 @@ class DirectAPIToSQLite:
     
     
     def close(self):
-        """Закрыть соединение с БД"""
+        """Закрыть соединение с БД (PostgreSQL — вернуть в пул)"""
         if self.conn:
-            self.conn.close()
+            self.backend.release(self.conn)
+            self.conn = None
+    
+    
+    def sync_bank(self, bank):
+        """Синхронизировать один банк (для sync_scheduler.py)
+        
+        Returns:
+            (успешных клиентов, неудачных клиентов); исключения не глотаются —
+            планировщик записывает их в историю запусков
+        """
+        try:
+            self.create_database(bank['code'])
+            return self.fetch_bank_data(bank)
+        finally:
+            self.close()
     
     
     def run(self):
         """Запустить полный процесс"""
         try:
-            # Создаем БД
-            self.create_database()
+            # Создаем БД (в раздельном режиме — по одной на банк в fetch_all_banks)
+            if not self.shard_dir:
+                self.create_database()
             
             # Получаем данные из всех банков
             if self.fetch_all_banks():
                 # Выводим статистику
-                self.print_statistics()
-                print(f"\n✅ Готово! База данных создана: {self.db_file}")
+                if self.shard_dir:
+                    for bank in self.banks:
+                        self.close()
+                        self.create_database(bank['code'])
+                        self.print_statistics()
+                    print(f"\n✅ Готово! Базы данных банков: {self.shard_dir}")
+                else:
+                    self.print_statistics()
+                    print(f"\n✅ Готово! База данных создана: {self.db_file}")
                 return True
             else:
                 print("\n❌ Не удалось получить данные ни из одного банка")
                 return False
                 
         except Exception as e:
-            print(f"\n❌ Критическая ошибка: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Критическая ошибка: %s", e)
             return False
         finally:
             self.close()
@@ -774,6 +1020,7 @@ class DirectAPIToSQLite:
 
 def main():
     """Главная функция"""
+    setup_logging()
     importer = DirectAPIToSQLite('multibank_real.db')
     importer.run()
 
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# batch_analysis.py
+"""
+Пакетный AI анализ всех клиентов CRM
+Контексты строятся параллельно, запросы к LLM идут с ограничением
+конкурентности и частоты. Результаты сохраняются в ai_client_analyses,
+откуда дашборд читает их без обращения к AI
+Запуск по расписанию (cron): python3 batch_analysis.py
+"""
+
+import argparse
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from config import Config
+from app_logging import get_logger, setup_logging, bind_correlation_id
+from repositories import ClientRepository, TransactionRepository, AIAnalysisRepository
+from ai_service import ai_service
+
+logger = get_logger('batch')
+
+
+class RateLimiter:
+    """Простой token bucket: не более rate запросов в секунду"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Дождаться свободного токена"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class BatchAnalysisRunner:
+    """Прогон AI анализа по всем клиентам из ClientRepository.get_all()"""
+
+    # Коды ответа AI API, при которых имеет смысл повторить запрос
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, question: str = None, context_workers: int = None,
+                 concurrency: int = None, rate_limit: float = None,
+                 max_retries: int = None):
+        self.question = question or Config.AI_BATCH_QUESTION
+        self.context_workers = context_workers or Config.AI_BATCH_CONTEXT_WORKERS
+        self.concurrency = concurrency or Config.AI_BATCH_CONCURRENCY
+        self.max_retries = Config.AI_BATCH_MAX_RETRIES if max_retries is None else max_retries
+        self.rate_limiter = RateLimiter(
+            Config.AI_BATCH_RATE_LIMIT if rate_limit is None else rate_limit,
+            burst=self.concurrency
+        )
+        self.batch_id = None
+
+        # Статистика
+        self.stats = {
+            'clients': 0,
+            'success': 0,
+            'errors': 0
+        }
+
+    def _build_context(self, client_id: str) -> Dict:
+        """Построить контекст и сводку клиента (выполняется в пуле потоков)"""
+        return {
+            'client_id': client_id,
+            'context': ai_service.build_context(client_id),
+            'summary': TransactionRepository.get_summary(client_id)
+        }
+
+    def _ask(self, item: Dict) -> Dict:
+        """Отправить запрос в LLM с ограничением частоты и повторами"""
+        started = time.monotonic()
+        result = None
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            result = ai_service.ask(
+                question=self.question,
+                client_id=item['client_id'],
+                context=item['context']
+            )
+
+            # Повтор — при кодах RETRY_STATUS_CODES, таймауте и ошибке подключения
+            retryable = result.get('retryable') or result.get('status_code') in self.RETRY_STATUS_CODES
+            if result['success'] or not retryable:
+                break
+
+            if attempt < self.max_retries:
+                time.sleep(2 ** attempt)
+
+        item['result'] = result
+        item['duration_ms'] = int((time.monotonic() - started) * 1000)
+        return item
+
+    def _save(self, item: Dict):
+        """Сохранить результат анализа клиента"""
+        result = item['result']
+
+        AIAnalysisRepository.create(
+            batch_id=self.batch_id,
+            client_id=item['client_id'],
+            question=self.question,
+            status='success' if result['success'] else 'error',
+            answer=result.get('answer'),
+            model=result.get('model', ai_service.model),
+            error=result.get('error'),
+            summary=item['summary'],
+            duration_ms=item['duration_ms']
+        )
+
+        if result['success']:
+            self.stats['success'] += 1
+        else:
+            self.stats['errors'] += 1
+            logger.warning("❌ %s: %s", item['client_id'], result.get('error'))
+
+    def run(self, limit: Optional[int] = None) -> Dict:
+        """Запустить анализ по всем клиентам"""
+        self.batch_id = f"batch-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+        # Все записи прогона помечены batch_id
+        with bind_correlation_id(self.batch_id):
+            started = time.monotonic()
+
+            clients = ClientRepository.get_all()
+            if limit:
+                clients = clients[:limit]
+            client_ids: List[str] = [str(client['id']) for client in clients]
+            self.stats['clients'] = len(client_ids)
+
+            logger.info("🤖 Пакетный AI анализ %s: клиентов %d", self.batch_id, len(client_ids))
+            logger.info("⚙️ Контексты: %d потоков, LLM: %d параллельно, %s запр/сек",
+                        self.context_workers, self.concurrency, self.rate_limiter.rate)
+
+            with ThreadPoolExecutor(max_workers=self.context_workers) as context_pool, \
+                    ThreadPoolExecutor(max_workers=self.concurrency) as llm_pool:
+
+                # Контексты строятся параллельно, готовые сразу уходят в LLM
+                context_futures = [context_pool.submit(self._build_context, cid) for cid in client_ids]
+                llm_futures = []
+
+                for future in as_completed(context_futures):
+                    try:
+                        llm_futures.append(llm_pool.submit(self._ask, future.result()))
+                    except Exception as e:
+                        logger.warning("⚠️ Ошибка построения контекста: %s", e)
+                        self.stats['errors'] += 1
+
+                # Запись в БД — из одного потока, чтобы не конкурировать за блокировку SQLite
+                for done, future in enumerate(as_completed(llm_futures), start=1):
+                    try:
+                        self._save(future.result())
+                    except Exception as e:
+                        logger.warning("⚠️ Ошибка сохранения результата: %s", e)
+                        self.stats['errors'] += 1
+
+                    if done % 50 == 0:
+                        logger.info("⏳ Обработано %d/%d", done, len(client_ids))
+
+            self.stats['duration_sec'] = round(time.monotonic() - started, 2)
+            self.stats['batch_id'] = self.batch_id
+
+            logger.info("✅ Успешно: %d, ❌ Ошибок: %d, ⏱ %s сек",
+                        self.stats['success'], self.stats['errors'], self.stats['duration_sec'])
+
+            return self.stats
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Пакетный AI анализ всех клиентов')
+    parser.add_argument('--question', help='Вопрос для анализа каждого клиента')
+    parser.add_argument('--limit', type=int, help='Ограничить количество клиентов')
+    parser.add_argument('--context-workers', type=int, help='Потоков для построения контекста')
+    parser.add_argument('--concurrency', type=int, help='Параллельных запросов к LLM')
+    parser.add_argument('--rate-limit', type=float, help='Запросов к LLM в секунду (0 — без лимита)')
+    args = parser.parse_args()
+
+    runner = BatchAnalysisRunner(
+        question=args.question,
+        context_workers=args.context_workers,
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit
+    )
+    setup_logging()
+    runner.run(limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
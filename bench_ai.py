@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# bench_ai.py
+"""
+Бенчмарк задержек /api/ai/ask
+Гоняет запросы с заданной конкурентностью и считает p50/p95/p99
+отдельно по этапам: построение контекста, запрос к LLM, сохранение диалога.
+Длительности этапов берутся из заголовка Server-Timing ответа
+
+По умолчанию работает в одном процессе: Flask test client + локальная
+заглушка LLM (mock_llm_server.py) поверх копии базы данных
+    python3 bench_ai.py --requests 200 --concurrency 8 --mock-latency 300
+
+Против запущенного сервера (AI_API_URL на сервере указывает на заглушку):
+    python3 bench_ai.py --base-url http://127.0.0.1:5000 --username admin --password ...
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль с линейной интерполяцией"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Разобрать заголовок Server-Timing: 'context;dur=1.2, upstream;dur=300.5'"""
+    timings = {}
+    for metric in (header or '').split(','):
+        parts = [p.strip() for p in metric.split(';')]
+        if not parts[0]:
+            continue
+        for param in parts[1:]:
+            if param.startswith('dur='):
+                try:
+                    timings[parts[0]] = float(param[4:])
+                except ValueError:
+                    pass
+    return timings
+
+
+class AIBenchmark:
+    """Нагрузка на /api/ai/ask и сбор статистики по этапам"""
+
+    PHASES = ['context', 'upstream', 'summary', 'persist']
+
+    def __init__(self, make_client, client_ids: List[str], question: str,
+                 total_requests: int, concurrency: int):
+        self.make_client = make_client
+        self.client_ids = client_ids or [None]
+        self.question = question
+        self.total_requests = total_requests
+        self.concurrency = concurrency
+        self.samples = []
+        self.errors = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def _next_index(self):
+        with self.lock:
+            if self.counter >= self.total_requests:
+                return None
+            self.counter += 1
+            return self.counter - 1
+
+    def _worker(self):
+        post = self.make_client()
+        while True:
+            index = self._next_index()
+            if index is None:
+                return
+
+            payload = {
+                'question': self.question,
+                'client_id': self.client_ids[index % len(self.client_ids)]
+            }
+            started = time.perf_counter()
+            try:
+                status, headers = post('/api/ai/ask', payload)
+            except Exception as e:
+                status, headers = type(e).__name__, {}
+            total_ms = (time.perf_counter() - started) * 1000
+
+            with self.lock:
+                if status == 200:
+                    sample = parse_server_timing(headers.get('Server-Timing'))
+                    sample['total'] = total_ms
+                    sample['overhead'] = total_ms - sample.get('upstream', 0)
+                    self.samples.append(sample)
+                else:
+                    self.errors[str(status)] = self.errors.get(str(status), 0) + 1
+
+    def run(self) -> Dict:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._worker) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_sec = time.perf_counter() - started
+
+        report = {
+            'requests': self.total_requests,
+            'concurrency': self.concurrency,
+            'success': len(self.samples),
+            'errors': self.errors,
+            'wall_sec': round(wall_sec, 3),
+            'throughput_rps': round(len(self.samples) / wall_sec, 2) if wall_sec else 0,
+            'phases_ms': {}
+        }
+
+        for phase in self.PHASES + ['overhead', 'total']:
+            values = [s[phase] for s in self.samples if phase in s]
+            if not values:
+                continue
+            report['phases_ms'][phase] = {
+                'p50': round(percentile(values, 50), 2),
+                'p95': round(percentile(values, 95), 2),
+                'p99': round(percentile(values, 99), 2),
+                'mean': round(sum(values) / len(values), 2),
+                'max': round(max(values), 2)
+            }
+
+        return report
+
+
+def print_report(report: Dict):
+    """Вывести отчёт таблицей"""
+    print(f"\n{'='*70}")
+    print(f"📊 /api/ai/ask: {report['success']}/{report['requests']} успешно, "
+          f"конкурентность {report['concurrency']}, {report['throughput_rps']} запр/сек")
+    if report['errors']:
+        print(f"  ❌ Ошибки: {report['errors']}")
+    print(f"{'='*70}")
+    print(f"  {'Этап':<10} {'p50':>10} {'p95':>10} {'p99':>10} {'mean':>10} {'max':>10}")
+    for phase, stats in report['phases_ms'].items():
+        print(f"  {phase:<10} " + ' '.join(f"{stats[k]:>10.1f}" for k in ('p50', 'p95', 'p99', 'mean', 'max')))
+    print(f"{'='*70}")
+
+
+def make_inprocess_clients(args):
+    """Flask test client поверх копии БД и локальной заглушки LLM"""
+    from mock_llm_server import MockLLMServer, MockLLMSettings
+
+    workdir = tempfile.mkdtemp(prefix='bench_ai_')
+    db_copy = os.path.join(workdir, 'bench.db')
+    shutil.copy(args.db, db_copy)
+    os.environ['DATABASE_FILE'] = db_copy
+
+    server = MockLLMServer(settings=MockLLMSettings(
+        latency_ms=args.mock_latency,
+        jitter_ms=args.mock_jitter,
+        tokens_per_sec=args.mock_tokens_per_sec,
+        completion_tokens=args.mock_completion_tokens,
+        error_rate=args.mock_error_rate,
+        seed=42
+    )).start()
+
+    # Импорт после подмены DATABASE_FILE: Config читает окружение при импорте
+    from app import app
+    from ai_service import ai_service
+    from repositories import ClientRepository
+
+    ai_service.api_url = server.url
+    client_ids = [str(c['id']) for c in ClientRepository.get_all()]
+
+    def make_client():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['authenticated'] = True
+
+        def post(path, payload):
+            response = client.post(path, json=payload)
+            return response.status_code, response.headers
+        return post
+
+    def cleanup():
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return make_client, client_ids, cleanup
+
+
+def make_remote_clients(args):
+    """HTTP клиенты к запущенному серверу (с авторизацией)"""
+    import requests
+
+    def login():
+        session = requests.Session()
+        response = session.post(f"{args.base_url}/api/auth/login",
+                                json={'username': args.username, 'password': args.password})
+        response.raise_for_status()
+        return session
+
+    def make_client():
+        session = login()
+
+        def post(path, payload):
+            response = session.post(f"{args.base_url}{path}", json=payload, timeout=120)
+            return response.status_code, response.headers
+        return post
+
+    data = login().get(f"{args.base_url}/api/clients").json()
+    client_ids = [str(c['id']) for c in data.get('clients', [])]
+
+    return make_client, client_ids, lambda: None
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Бенчмарк задержек /api/ai/ask по этапам')
+    parser.add_argument('--requests', type=int, default=100, help='Всего запросов')
+    parser.add_argument('--concurrency', type=int, default=8, help='Параллельных запросов')
+    parser.add_argument('--question', default='Проанализируй расходы клиента')
+    parser.add_argument('--client-ids', help='Список client_id через запятую (по умолчанию все)')
+    parser.add_argument('--db', default='multibank_real.db', help='БД для in-process режима (копируется)')
+    parser.add_argument('--mock-latency', type=float, default=300, help='Задержка заглушки LLM, мс')
+    parser.add_argument('--mock-jitter', type=float, default=50, help='Разброс задержки заглушки, мс')
+    parser.add_argument('--mock-tokens-per-sec', type=float, default=0)
+    parser.add_argument('--mock-completion-tokens', type=int, default=200)
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--base-url', help='URL запущенного сервера (вместо in-process режима)')
+    parser.add_argument('--username', default=os.getenv('AUTH_USERNAME', 'admin'))
+    parser.add_argument('--password', default=os.getenv('BENCH_PASSWORD', ''))
+    parser.add_argument('--json', action='store_true', help='Вывести отчёт в JSON')
+    args = parser.parse_args()
+
+    if args.base_url:
+        make_client, client_ids, cleanup = make_remote_clients(args)
+    else:
+        make_client, client_ids, cleanup = make_inprocess_clients(args)
+
+    if args.client_ids:
+        client_ids = args.client_ids.split(',')
+
+    try:
+        benchmark = AIBenchmark(make_client, client_ids, args.question, args.requests, args.concurrency)
+        report = benchmark.run()
+    finally:
+        cleanup()
+
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# bench_importer.py
+"""
+Бенчмарк пропускной способности импорта DirectAPIToSQLite
+Поднимает локальные заглушки банков (mock_bank_server.py) в отдельных
+процессах, чтобы они не делили с импортом GIL и не попадали в замер памяти,
+импортирует данные во временную БД и считает клиентов/сек, транзакций/сек
+и пиковую память
+
+    python3 bench_importer.py --banks 2 --clients 50 --accounts 2 --transactions 500
+    python3 bench_importer.py --latency 50 --rate-limit-rate 0.05 --json
+    python3 bench_importer.py --since 2025-10-25T00:00:00Z   # инкрементальная загрузка
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Dict
+
+import requests
+
+from app_logging import setup_logging
+from base import DirectAPIToSQLite
+from mock_bank_server import MockBankServer, MockBankSettings
+
+
+def _serve_bank(settings_kwargs: Dict, bank_code: str, url_queue):
+    """Точка входа процесса с заглушкой банка"""
+    server = MockBankServer(settings=MockBankSettings(**settings_kwargs), bank_code=bank_code)
+    url_queue.put(server.url)
+    server.httpd.serve_forever()
+
+
+class ReadProbe(threading.Thread):
+    """Чтения как у /api/clients (список + балансы в одном снимке) параллельно
+    с импортом: задержка чтений не должна расти, пока идёт запись"""
+
+    def __init__(self, db_file: str, interval: float, journal_mode: str):
+        super().__init__(daemon=True)
+        self.db_file = db_file
+        self.interval = interval
+        self.journal_mode = journal_mode
+        self.samples = []
+        self.errors = {}
+        self.stopped = threading.Event()
+
+    def _ready(self) -> bool:
+        if not os.path.exists(self.db_file):
+            return False
+        import sqlite3
+        try:
+            conn = sqlite3.connect(self.db_file, timeout=1)
+            try:
+                return conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0] > 0
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return False
+
+    def run(self):
+        while not self.stopped.is_set() and not self._ready():
+            time.sleep(0.05)
+        if self.stopped.is_set():
+            return
+
+        from config import Config
+        from database import DatabaseManager, set_db_manager
+        from repositories import ClientRepository, TransactionRepository
+
+        # Репозитории читают через общий db_manager — подставляем менеджер пробы
+        Config.DB_JOURNAL_MODE = self.journal_mode
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = DatabaseManager(self.db_file)
+        set_db_manager(manager)
+
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            try:
+                with manager.snapshot():
+                    ClientRepository.get_all(limit=100)
+                    TransactionRepository.get_balances()
+                self.samples.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                key = str(e) or type(e).__name__
+                self.errors[key] = self.errors.get(key, 0) + 1
+            self.stopped.wait(self.interval)
+
+    def report(self) -> Dict:
+        from bench_ai import percentile
+        return {
+            'reads': len(self.samples),
+            'errors': self.errors,
+            'p50_ms': round(percentile(self.samples, 50), 2),
+            'p95_ms': round(percentile(self.samples, 95), 2),
+            'max_ms': round(max(self.samples), 2) if self.samples else 0,
+        }
+
+
+def run_benchmark(args) -> Dict:
+    """Импорт из заглушек во временную БД с замером времени и памяти"""
+    processes = []
+    workdir = tempfile.mkdtemp(prefix='bench_importer_')
+    db_file = os.path.join(workdir, 'import.db')
+
+    try:
+        settings_kwargs = {
+            'latency_ms': args.latency,
+            'jitter_ms': args.jitter,
+            'page_size': args.page_size,
+            'accounts_per_client': args.accounts,
+            'transactions_per_account': args.transactions,
+            'rate_limit_rate': args.rate_limit_rate,
+            'error_rate': args.error_rate,
+            'seed': args.seed
+        }
+
+        banks = []
+        url_queue = multiprocessing.Queue()
+        for i in range(1, args.banks + 1):
+            bank_code = f"mock{i}"
+            process = multiprocessing.Process(
+                target=_serve_bank, args=(settings_kwargs, bank_code, url_queue), daemon=True
+            )
+            process.start()
+            processes.append(process)
+            banks.append({'name': f"Mock Bank {i}", 'code': bank_code, 'url': url_queue.get(timeout=30)})
+
+        importer = DirectAPIToSQLite(db_file)
+        importer.client_id = 'bench'
+        importer.client_secret = 'bench'
+        importer.banks = banks
+        importer.clients_per_bank = args.clients
+        importer.page_size = args.page_size
+        importer.request_delay = 0
+        importer.client_delay = 0
+        importer.bank_delay = 0
+        importer.retry_delay = args.retry_delay
+        importer.journal_mode = args.journal_mode
+        importer.shard_dir = None  # замер одной БД, даже если задан DB_SHARD_DIR
+        importer.since = args.since
+
+        probe = None
+        if args.probe_reads:
+            probe = ReadProbe(db_file, args.probe_interval, args.journal_mode)
+            probe.start()
+
+        # Вывод импортёра глушим: синхронный stdout сам по себе искажает замер.
+        # Логи без setup_logging пишутся только от WARNING
+        output = sys.stderr if args.verbose else io.StringIO()
+        if args.verbose:
+            setup_logging('DEBUG')
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            success = importer.run()
+        wall_sec = time.perf_counter() - started
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if probe:
+            probe.stopped.set()
+            probe.join(timeout=30)
+
+        # ru_maxrss: килобайты на Linux, байты на macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        maxrss_mb = maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+        requests_by_endpoint = {}
+        for bank in banks:
+            counts = requests.get(f"{bank['url']}/__stats", timeout=10).json()['requests']
+            for endpoint, count in counts.items():
+                requests_by_endpoint[endpoint] = requests_by_endpoint.get(endpoint, 0) + count
+
+        stats = importer.stats
+        return {
+            'success': success,
+            'config': {
+                'banks': args.banks,
+                'clients_per_bank': args.clients,
+                'accounts_per_client': args.accounts,
+                'transactions_per_account': args.transactions,
+                'page_size': args.page_size,
+                'latency_ms': args.latency,
+                'rate_limit_rate': args.rate_limit_rate,
+                'error_rate': args.error_rate,
+                'since': args.since,
+            },
+            'wall_sec': round(wall_sec, 3),
+            'clients': stats['clients'],
+            'accounts': stats['accounts'],
+            'transactions': stats['transactions'],
+            'clients_per_sec': round(stats['clients'] / wall_sec, 2) if wall_sec else 0,
+            'transactions_per_sec': round(stats['transactions'] / wall_sec, 1) if wall_sec else 0,
+            'peak_traced_mb': round(peak_traced / (1024 * 1024), 2),
+            'peak_rss_mb': round(maxrss_mb, 2),
+            'db_size_mb': round(os.path.getsize(db_file) / (1024 * 1024), 2),
+            'http_requests': requests_by_endpoint,
+            'journal_mode': args.journal_mode,
+            'reads_during_import': probe.report() if probe else None,
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join(timeout=5)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report: Dict):
+    """Вывести отчёт"""
+    print(f"\n{'='*70}")
+    print(f"📊 Импорт DirectAPIToSQLite: {'✅' if report['success'] else '❌'} за {report['wall_sec']} сек")
+    print(f"{'='*70}")
+    print(f"  👥 Клиентов: {report['clients']} ({report['clients_per_sec']}/сек)")
+    print(f"  💳 Счетов: {report['accounts']}")
+    print(f"  💸 Транзакций: {report['transactions']} ({report['transactions_per_sec']}/сек)")
+    print(f"  🧠 Пик памяти: {report['peak_traced_mb']} MB (tracemalloc), {report['peak_rss_mb']} MB RSS")
+    print(f"  💾 Размер БД: {report['db_size_mb']} MB")
+    print(f"  🌐 HTTP запросов: {sum(report['http_requests'].values())}")
+    for endpoint, count in sorted(report['http_requests'].items()):
+        print(f"      {endpoint}: {count}")
+    reads = report['reads_during_import']
+    if reads:
+        print(f"  📖 Чтения во время импорта ({report['journal_mode']}): {reads['reads']}, "
+              f"p50 {reads['p50_ms']} ms, p95 {reads['p95_ms']} ms, max {reads['max_ms']} ms")
+        for error, count in reads['errors'].items():
+            print(f"      ❌ {error}: {count}")
+    print(f"{'='*70}")
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Бенчмарк импорта из Open Banking API')
+    parser.add_argument('--banks', type=int, default=2, help='Количество банков-заглушек')
+    parser.add_argument('--clients', type=int, default=20, help='Клиентов в каждом банке')
+    parser.add_argument('--accounts', type=int, default=2, help='Счетов на клиента')
+    parser.add_argument('--transactions', type=int, default=300, help='Транзакций на счёт')
+    parser.add_argument('--page-size', type=int, default=100, help='Размер страницы транзакций')
+    parser.add_argument('--latency', type=float, default=10, help='Задержка ответа заглушки, мс')
+    parser.add_argument('--jitter', type=float, default=2, help='Разброс задержки, мс')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 5xx')
+    parser.add_argument('--retry-delay', type=float, default=0.05, help='Пауза перед повтором, сек')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--since', help='Загружать транзакции с даты (ГГГГ-ММ-ДДTЧЧ:ММ:ССZ), как синхронизация')
+    parser.add_argument('--journal-mode', default='WAL', help='Режим журнала SQLite (WAL, DELETE)')
+    parser.add_argument('--probe-reads', action='store_true',
+                        help='Параллельно читать БД как /api/clients и замерять задержку')
+    parser.add_argument('--probe-interval', type=float, default=0.02, help='Пауза между чтениями пробы, сек')
+    parser.add_argument('--verbose', action='store_true', help='Показывать вывод импортёра')
+    parser.add_argument('--json', action='store_true', help='Вывести отчёт в JSON')
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# bench_repositories.py
+"""
+Бенчмарк горячих путей репозиториев и API на синтетических БД разного масштаба
+Для каждого масштаба (по умолчанию 100, 10k и 100k клиентов) генерирует БД
+через generate_test_data.py (кэшируется в --data-dir) и замеряет:
+  - ClientRepository.get_all
+  - TransactionRepository.get_summary / get_by_category / get_by_client /
+    calculate_client_rating
+  - /api/clients, /api/stats, /api/clients/<id> через Flask test client
+
+Каждый замер идёт в отдельном процессе с таймаутом: Config читает DATABASE_FILE
+при импорте, а квадратичные пути на больших масштабах не должны подвешивать прогон.
+Результат — JSON, который можно сравнить с прошлым релизом:
+    python3 bench_repositories.py --output bench.json
+    python3 bench_repositories.py --compare bench.json --threshold 1.3
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SCALES = [100, 10000, 100000]
+
+CASES = [
+    'repo.client.get_all',
+    'repo.transaction.get_summary',
+    'repo.transaction.get_by_category',
+    'repo.transaction.get_by_client',
+    'repo.transaction.calculate_client_rating',
+    'api.clients',
+    'api.stats',
+    'api.client_details',
+]
+
+
+# ==================== WORKER (один замер в отдельном процессе) ====================
+
+def _sample_client_id(db_file: str) -> str:
+    """Составной ID клиента из середины списка (без затрат на get_all)"""
+    conn = sqlite3.connect(db_file)
+    try:
+        count = conn.execute('SELECT COUNT(*) FROM clients').fetchone()[0]
+        row = conn.execute(
+            "SELECT client_id || '-' || bank_code FROM clients ORDER BY id LIMIT 1 OFFSET ?",
+            (count // 2,)
+        ).fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+
+def _make_case(case: str, client_id: str):
+    """Функция без аргументов, выполняющая замеряемую операцию"""
+    from repositories import ClientRepository, TransactionRepository
+
+    if case == 'repo.client.get_all':
+        return ClientRepository.get_all
+    if case == 'repo.transaction.get_summary':
+        return lambda: TransactionRepository.get_summary(client_id)
+    if case == 'repo.transaction.get_by_category':
+        return lambda: TransactionRepository.get_by_category(client_id)
+    if case == 'repo.transaction.get_by_client':
+        return lambda: TransactionRepository.get_by_client(client_id)
+    if case == 'repo.transaction.calculate_client_rating':
+        return lambda: TransactionRepository.calculate_client_rating(client_id)
+
+    from app import app
+    test_client = app.test_client()
+    with test_client.session_transaction() as sess:
+        sess['authenticated'] = True
+
+    paths = {
+        'api.clients': '/api/clients',
+        'api.stats': '/api/stats',
+        'api.client_details': f'/api/clients/{client_id}',
+    }
+
+    def call():
+        response = test_client.get(paths[case])
+        if response.status_code != 200:
+            raise RuntimeError(f"{paths[case]}: HTTP {response.status_code}")
+        return response
+
+    return call
+
+
+def run_worker(db_file: str, case: str, repeat: int, budget: float) -> Dict:
+    """Выполнить замер: прогрев + до repeat повторов в рамках budget секунд"""
+    client_id = _sample_client_id(db_file)
+    os.environ['DATABASE_FILE'] = db_file
+
+    # Весь служебный вывод приложения уходит в stderr, stdout — только JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        func = _make_case(case, client_id)
+        func()  # прогрев: инициализация схемы и кэша страниц SQLite
+
+        samples = []
+        started = time.perf_counter()
+        while len(samples) < repeat:
+            t0 = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - t0) * 1000)
+            if time.perf_counter() - started > budget:
+                break
+
+    return {
+        'status': 'ok',
+        'iterations': len(samples),
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+# ==================== ОРКЕСТРАТОР ====================
+
+def ensure_database(data_dir: str, clients: int, transactions: int, seed: int) -> str:
+    """Сгенерировать БД масштаба (или взять из кэша)"""
+    from generate_test_data import SyntheticDataGenerator
+
+    os.makedirs(data_dir, exist_ok=True)
+    db_file = os.path.join(data_dir, f"bench_c{clients}_t{transactions}_s{seed}.db")
+
+    if not os.path.exists(db_file):
+        print(f"🛠 Генерация БД: {clients:,} клиентов, {transactions} транзакций на счёт...", file=sys.stderr)
+        tmp_file = db_file + '.tmp'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        with contextlib.redirect_stdout(sys.stderr):
+            SyntheticDataGenerator(tmp_file, clients=clients, transactions=transactions, seed=seed).run()
+        os.replace(tmp_file, db_file)
+
+    return db_file
+
+
+def run_case(db_file: str, case: str, repeat: int, budget: float, timeout: float) -> Dict:
+    """Запустить замер в дочернем процессе"""
+    command = [
+        sys.executable, os.path.abspath(__file__), '--worker',
+        '--db', db_file, '--case', case,
+        '--repeat', str(repeat), '--budget', str(budget)
+    ]
+    try:
+        completed = subprocess.run(
+            command, cwd=BASE_DIR, capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return {'status': 'timeout', 'timeout_sec': timeout}
+
+    if completed.returncode != 0:
+        return {'status': 'error', 'error': completed.stderr.strip().splitlines()[-1:] or ['unknown']}
+
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _db_stats(db_file: str) -> Dict:
+    conn = sqlite3.connect(db_file)
+    try:
+        return {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('clients', 'accounts', 'transactions')
+        }
+    finally:
+        conn.close()
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(args) -> Dict:
+    """Прогнать все замеры на всех масштабах"""
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'transactions_per_account': args.transactions,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': []
+    }
+
+    cases = args.cases.split(',') if args.cases else CASES
+
+    for clients in args.scales:
+        db_file = ensure_database(args.data_dir, clients, args.transactions, args.seed)
+        dataset = _db_stats(db_file)
+        print(f"\n📊 Масштаб {clients:,} клиентов: {dataset}", file=sys.stderr)
+
+        for case in cases:
+            result = run_case(db_file, case, args.repeat, args.budget, args.case_timeout)
+            result.update({'case': case, 'scale': clients, 'dataset': dataset})
+            report['results'].append(result)
+
+            if result['status'] == 'ok':
+                print(f"  {case:<45} {result['median_ms']:>12.2f} ms  (x{result['iterations']})", file=sys.stderr)
+            else:
+                print(f"  {case:<45} {result['status']:>15}", file=sys.stderr)
+
+    return report
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    """Найти регрессии: медиана выросла больше чем в threshold раз или замер перестал укладываться в таймаут"""
+    previous = {(r['case'], r['scale']): r for r in baseline.get('results', [])}
+    regressions = []
+
+    for result in current['results']:
+        old = previous.get((result['case'], result['scale']))
+        if not old or old.get('status') != 'ok':
+            continue
+
+        if result['status'] != 'ok':
+            regressions.append({'case': result['case'], 'scale': result['scale'],
+                                'baseline_ms': old['median_ms'], 'current': result['status']})
+        elif result['median_ms'] > old['median_ms'] * threshold:
+            regressions.append({'case': result['case'], 'scale': result['scale'],
+                                'baseline_ms': old['median_ms'], 'current_ms': result['median_ms'],
+                                'ratio': round(result['median_ms'] / old['median_ms'], 2)})
+
+    return regressions
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Бенчмарк репозиториев и API на разных масштабах')
+    parser.add_argument('--scales', type=lambda v: [int(x) for x in v.split(',')],
+                        default=DEFAULT_SCALES, help='Масштабы (клиентов) через запятую')
+    parser.add_argument('--transactions', type=int, default=10, help='Среднее число транзакций на счёт')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cases', help=f"Замеры через запятую (по умолчанию все: {','.join(CASES)})")
+    parser.add_argument('--repeat', type=int, default=5, help='Повторов на замер')
+    parser.add_argument('--budget', type=float, default=10, help='Лимит времени на повторы замера, сек')
+    parser.add_argument('--case-timeout', type=float, default=120, help='Таймаут одного замера, сек')
+    parser.add_argument('--data-dir', default=os.path.join(BASE_DIR, 'bench_data'), help='Кэш сгенерированных БД')
+    parser.add_argument('--output', help='Файл для JSON отчёта (по умолчанию stdout)')
+    parser.add_argument('--compare', help='JSON отчёт прошлого релиза для поиска регрессий')
+    parser.add_argument('--threshold', type=float, default=1.3, help='Допустимый рост медианы (раз)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.db, args.case, args.repeat, args.budget)))
+        return
+
+    report = run_suite(args)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare_reports(baseline, report, args.threshold)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"\n💾 Отчёт сохранён: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if report.get('regressions'):
+        print(f"\n❌ Регрессии: {len(report['regressions'])}", file=sys.stderr)
+        for regression in report['regressions']:
+            print(f"  • {regression}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# build_assets.py
+"""
+Сборка статики для production
+Минифицирует static/*.css и static/*.js, добавляет хэш содержимого в имя
+файла и заранее сжимает результат (gzip, brotli — если установлен пакет brotli).
+Результат кладётся в static/dist/, соответствие имён — в static/dist/manifest.json.
+Flask подставляет хэшированные имена в url_for('static', ...) по манифесту (assets.py)
+
+Запуск перед деплоем:
+    python3 build_assets.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+HASH_LENGTH = 10
+
+
+def minify_css(source: str) -> str:
+    """Консервативная минификация CSS: комментарии и пробелы вокруг { } ; ,
+
+    Пробелы вокруг ':' не трогаем — в селекторах 'a :hover' и 'a:hover' различаются
+    """
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,])\s*', r'\1', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+def minify_js(source: str) -> str:
+    """Консервативная минификация JS без парсера: отступы, пустые строки и
+    строки-комментарии. Переводы строк сохраняются — автоматическая расстановка
+    точек с запятой и многострочные шаблонные строки продолжают работать
+    """
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+def _write(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_asset(filename: str, dist_dir: str, compress: bool = True) -> dict:
+    """Собрать один файл: минификация, хэш в имени, .gz и .br рядом"""
+    name, ext = os.path.splitext(filename)
+
+    with open(os.path.join(STATIC_DIR, filename), encoding='utf-8') as f:
+        source = f.read()
+
+    data = MINIFIERS[ext](source).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    hashed_name = f"{name}.{digest}{ext}"
+    target = os.path.join(dist_dir, hashed_name)
+
+    _write(target, data)
+    sizes = {'source': len(source.encode('utf-8')), 'minified': len(data)}
+
+    if compress:
+        # mtime=0: одинаковый вход даёт побайтно одинаковый .gz
+        gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+        _write(target + '.gz', gz_data)
+        sizes['gzip'] = len(gz_data)
+
+        if brotli is not None:
+            br_data = brotli.compress(data, quality=11)
+            _write(target + '.br', br_data)
+            sizes['brotli'] = len(br_data)
+
+    return {'path': f"{DIST_DIRNAME}/{hashed_name}", 'sizes': sizes}
+
+
+def build(compress: bool = True) -> dict:
+    """Пересобрать static/dist целиком и записать манифест"""
+    dist_dir = os.path.join(STATIC_DIR, DIST_DIRNAME)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for filename in sorted(os.listdir(STATIC_DIR)):
+        if os.path.splitext(filename)[1] not in MINIFIERS:
+            continue
+        if not os.path.isfile(os.path.join(STATIC_DIR, filename)):
+            continue
+
+        result = build_asset(filename, dist_dir, compress=compress)
+        manifest[filename] = result['path']
+
+        sizes = result['sizes']
+        details = ', '.join(f"{kind} {size / 1024:.1f} KB" for kind, size in sizes.items())
+        print(f"  ✓ {filename} → {result['path']} ({details})")
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Сборка статики: минификация, хэши, сжатие')
+    parser.add_argument('--no-compress', action='store_true', help='Не создавать .gz/.br')
+    args = parser.parse_args()
+
+    print("📦 Сборка статики...")
+    if brotli is None and not args.no_compress:
+        print("  ⚠️ Пакет brotli не установлен — только gzip")
+
+    manifest = build(compress=not args.no_compress)
+    print(f"✅ Собрано файлов: {len(manifest)}, манифест: static/{DIST_DIRNAME}/{MANIFEST_NAME}")
+
+
+if __name__ == "__main__":
+    main()
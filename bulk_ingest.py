@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# bulk_ingest.py
+"""
+Массовая загрузка транзакций в CRM структуру (POST /api/transactions/bulk)
+Файл NDJSON (объект на строку) или CSV с заголовком читается потоком,
+строки проверяются и пишутся пачками по INGEST_CHUNK_SIZE: одна транзакция
+БД и один executemany на пачку (TransactionRepository.create_many) вместо
+запроса на каждую транзакцию. Ошибочные строки пропускаются и попадают
+в отчёт с номером строки файла
+
+Поля: client_id, amount (> 0), direction (income/expense), category,
+description, transaction_date (ГГГГ-ММ-ДД). Без категории она определяется
+по описанию (categorizer.py), без даты — сегодняшняя (UTC)
+
+    python3 bulk_ingest.py load history.csv
+    python3 bulk_ingest.py load history.ndjson --format ndjson
+"""
+
+import argparse
+import codecs
+import csv
+import json
+import math
+import threading
+from datetime import date, datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+from app_logging import get_logger, setup_logging
+from database import db_manager
+from repositories import TransactionRepository
+from categorizer import get_categorizer
+from anomalies import AnomaliesUnavailable, get_anomaly_detector
+
+logger = get_logger('bulk_ingest')
+
+# Формат по Content-Type запроса или расширению файла
+INGEST_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+}
+
+DIRECTION_INDICATORS = {'income': 'Credit', 'expense': 'Debit'}
+
+ENCODING_ERROR = "Некорректная кодировка: ожидается UTF-8"
+
+
+def detect_format(content_type: Optional[str] = None, filename: Optional[str] = None) -> Optional[str]:
+    """ndjson, csv или None по Content-Type или имени файла"""
+    if content_type:
+        fmt = INGEST_FORMATS.get(content_type.split(';')[0].strip().lower())
+        if fmt:
+            return fmt
+    if filename and '.' in filename:
+        return INGEST_FORMATS.get(filename[filename.rindex('.'):].lower())
+    return None
+
+
+def _iter_lines(stream: BinaryIO, bad_lines: List[int]) -> Iterator[str]:
+    """Строки файла текстом по одной; номера строк не в UTF-8 — в bad_lines
+
+    Строка декодируется отдельно: ошибка кодировки портит только её,
+    а не весь буфер чтения, и попадает в отчёт со своим номером
+    """
+    for line_no, raw in enumerate(iter(stream.readline, b''), 1):
+        # CSV из Excel начинается с BOM
+        if line_no == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            yield raw.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.append(line_no)
+            yield raw.decode('utf-8', errors='replace')
+
+
+def iter_records(stream: BinaryIO, fmt: str) -> Iterator[Tuple[int, object]]:
+    """(номер строки файла, запись) по одной, не читая файл целиком
+
+    Запись — dict или исключение разбора строки (ValueError). У записи CSV
+    на нескольких строках (перевод строки в кавычках) номер — последней
+    """
+    bad_lines = []
+    if fmt == 'ndjson':
+        for line_no, line in enumerate(_iter_lines(stream, bad_lines), 1):
+            if bad_lines:
+                bad_lines.clear()
+                yield line_no, ValueError(ENCODING_ERROR)
+                continue
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f"Некорректный JSON: {e}")
+                continue
+            yield line_no, record if isinstance(record, dict) else ValueError("Ожидается JSON объект")
+    elif fmt == 'csv':
+        reader = csv.DictReader(_iter_lines(stream, bad_lines))
+        for record in reader:
+            if bad_lines:
+                bad_lines.clear()
+                yield reader.line_num, ValueError(ENCODING_ERROR)
+                continue
+            yield reader.line_num, record
+    else:
+        raise ValueError(f"Формат: {', '.join(sorted(set(INGEST_FORMATS.values())))}")
+
+
+def parse_record(record: Dict, today: str) -> tuple:
+    """Строка для TransactionRepository.create_many; ValueError — описание ошибки"""
+    client_id = record.get('client_id')
+    try:
+        client_id = int(client_id)
+    except (TypeError, ValueError):
+        raise ValueError("client_id: ожидается число")
+
+    try:
+        amount = float(record.get('amount'))
+    except (TypeError, ValueError):
+        raise ValueError("amount: ожидается число")
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError("amount: сумма должна быть больше 0")
+
+    direction = record.get('direction')
+    if direction not in DIRECTION_INDICATORS:
+        raise ValueError("direction: income или expense")
+
+    description = record.get('description') or None
+    if description is not None:
+        description = str(description)
+
+    transaction_date = record.get('transaction_date') or today
+    try:
+        # fromisoformat на порядок быстрее strptime: на больших файлах это заметно
+        transaction_date = date.fromisoformat(str(transaction_date)).isoformat()
+    except ValueError:
+        raise ValueError("transaction_date: ожидается ГГГГ-ММ-ДД")
+
+    category = record.get('category') or get_categorizer().categorize(
+        description, None, DIRECTION_INDICATORS[direction]
+    )
+    return (client_id, amount, str(category), direction, description, transaction_date)
+
+
+class BulkIngest:
+    """Загрузка одного файла: счётчики и отчёт об ошибках строк"""
+
+    def __init__(self, chunk_size: int = None, max_errors: int = None):
+        self.chunk_size = chunk_size or Config.INGEST_CHUNK_SIZE
+        self.max_errors = Config.INGEST_MAX_ERRORS if max_errors is None else max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def _error(self, line_no: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_no, 'error': message})
+
+    def _flush(self, chunk: List[Tuple[int, tuple]]):
+        """Проверить клиентов пачки одним запросом и записать её"""
+        client_ids = sorted({row[0] for _, row in chunk})
+        placeholders = ','.join('?' * len(client_ids))
+        known = {
+            int(row['id']) for row in db_manager.execute_query(
+                f'SELECT id FROM clients WHERE id IN ({placeholders})', tuple(client_ids)
+            )
+        }
+        rows = []
+        for line_no, row in chunk:
+            if row[0] in known:
+                rows.append(row)
+            else:
+                self._error(line_no, f"client_id: клиент {row[0]} не найден")
+        self.inserted += TransactionRepository.create_many(rows)
+
+    def run(self, stream: BinaryIO, fmt: str) -> Dict:
+        """Загрузить файл; пачки до ошибки БД остаются записанными"""
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        chunk = []
+        for line_no, record in iter_records(stream, fmt):
+            if isinstance(record, Exception):
+                self._error(line_no, str(record))
+                continue
+            try:
+                chunk.append((line_no, parse_record(record, today)))
+            except ValueError as e:
+                self._error(line_no, str(e))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+
+        logger.info("📥 Загружено транзакций: %d, с ошибками: %d", self.inserted, self.failed)
+        return self.report()
+
+    def report(self) -> Dict:
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+            'errors_truncated': self.failed > len(self.errors)
+        }
+
+
+def _detect_anomalies():
+    try:
+        get_anomaly_detector().detect([''])
+    except AnomaliesUnavailable as e:
+        logger.warning("⚠️ %s: аномалии после загрузки не пересчитаны", e)
+    except Exception as e:
+        logger.exception("❌ Ошибка пересчёта аномалий после загрузки: %s", e)
+
+
+def detect_after_ingest(report: Dict, wait: bool = False):
+    """Пересчитать аномалии CRM после загрузки (ANOMALY_DETECTION)
+
+    API не ждёт пересчёта (wait=False): он идёт по всей таблице и на
+    большой истории занимает секунды
+    """
+    if not report['inserted'] or not Config.ANOMALY_DETECTION:
+        return
+    if wait:
+        _detect_anomalies()
+    else:
+        threading.Thread(target=_detect_anomalies, name='ingest-anomalies', daemon=True).start()
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Массовая загрузка транзакций CRM')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load_parser = subparsers.add_parser('load', help='Загрузить NDJSON или CSV файл')
+    load_parser.add_argument('file', help='Путь к файлу')
+    load_parser.add_argument('--format', choices=sorted(set(INGEST_FORMATS.values())),
+                             help='По умолчанию — по расширению файла')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    fmt = args.format or detect_format(filename=args.file)
+    if fmt is None:
+        parser.error('Не удалось определить формат, укажите --format')
+    if TransactionRepository._detect_structure() == 'banking':
+        parser.error('Массовая загрузка доступна только для CRM БД')
+
+    with open(args.file, 'rb') as f:
+        report = BulkIngest().run(f, fmt)
+    detect_after_ingest(report, wait=True)
+
+    print(f"✅ Загружено: {report['inserted']}, с ошибками: {report['failed']}")
+    for error in report['errors']:
+        print(f"  строка {error['line']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
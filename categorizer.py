@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# categorizer.py
+"""
+Категоризация банковских транзакций по Config.TRANSACTION_CATEGORIES
+Описание (transaction_information) проверяется одним скомпилированным
+регулярным выражением из ключевых слов категорий своего направления:
+поступление (Credit) — только категории доходов, списание (Debit) — только
+расходов. Без совпадения — по коду операции (transaction_code), затем по
+направлению (Другие доходы / Другие расходы)
+
+Импорт (base.py) категоризирует транзакции клиента пачкой перед записью,
+результат хранится в индексированной колонке transactions.category.
+Пересчитать всю таблицу после изменения правил:
+
+    python3 categorizer.py reclassify
+    python3 categorizer.py test "Оплата в Пятёрочка"
+"""
+
+import argparse
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+
+# Ключевые слова (начало слова, без учёта регистра). При нескольких
+# совпадениях побеждает то, что раньше в описании
+CATEGORY_KEYWORDS = {
+    'Зарплата': ['зарплат', 'заработн', 'аванс', 'salary', 'payroll'],
+    'Продажи': ['выручк', 'продаж', 'эквайринг', 'оплата по договору', 'оплата по счету', 'оплата по счёту'],
+    'Инвестиции': ['дивиденд', 'купон', 'брокер', 'инвест', 'проценты по вклад', 'dividend'],
+    'Другие доходы': ['подработ', 'бонус', 'премия', 'кешбэк', 'кэшбэк', 'cashback', 'возврат средств',
+                      'возврат покупки', 'возврат товара', 'возврат платежа', 'возврат оплаты', 'refund'],
+    'Аренда': ['аренд', 'найм', 'rent'],
+    'Продукты': ['продукт', 'супермаркет', 'пятёрочк', 'пятерочк', 'перекрёст', 'перекрест',
+                 'магнит', 'ашан', 'вкусвилл', 'лента', 'grocery'],
+    'Транспорт': ['транспорт', 'такси', 'метро', 'азс', 'бензин', 'топлив', 'ржд', 'аэрофлот',
+                  'каршеринг', 'taxi', 'uber'],
+    'Развлечения': ['развлечен', 'кино', 'театр', 'концерт', 'ресторан', 'кафе',
+                    'netflix', 'steam', 'spotify'],
+    'Коммунальные услуги': ['жкх', 'коммунал', 'квартплат', 'электроэнерг', 'водоканал', 'газоснаб',
+                            'мосэнерго'],
+    'Здоровье': ['аптек', 'клиник', 'медицин', 'стоматолог', 'анализы', 'анализов', 'лаборатор',
+                 'pharmacy'],
+    'Образование': ['образован', 'обучени', 'курсы', 'онлайн-курс', 'школа', 'школы', 'школу',
+                    'университет', 'репетитор'],
+    'Одежда': ['одежд', 'обув', 'zara', 'lamoda'],
+    'Связь': ['связь', 'мтс', 'билайн', 'мегафон', 'теле2', 'ростелеком', 'интернет', 'мобильн'],
+}
+
+# Категории поступлений (Credit); остальные — списаний (Debit)
+INCOME_CATEGORIES = ('Зарплата', 'Продажи', 'Инвестиции', 'Другие доходы')
+
+# Коды операций с однозначной категорией
+TRANSACTION_CODE_CATEGORIES = {
+    'Salary': 'Зарплата',
+    'Dividend': 'Инвестиции',
+    'Interest': 'Инвестиции',
+    'Refund': 'Другие доходы',
+}
+
+INCOME_FALLBACK = 'Другие доходы'
+EXPENSE_FALLBACK = 'Другие расходы'
+
+# Сколько разных описаний помнить: у банка они в основном повторяются
+CACHE_SIZE = 100000
+
+
+class TransactionCategorizer:
+    """Правила категоризации, скомпилированные в регулярные выражения
+
+    Одна группа на категорию: m.lastgroup сразу даёт категорию, поиск —
+    один проход по описанию вместо проверки правил по очереди. Выражений
+    три: доходы (Credit), расходы (Debit) и все категории — для транзакций
+    без направления
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]] = None,
+                 codes: Dict[str, str] = None):
+        keywords = CATEGORY_KEYWORDS if keywords is None else keywords
+        self.codes = TRANSACTION_CODE_CATEGORIES if codes is None else codes
+
+        unknown = (set(keywords) | set(self.codes.values())) - set(Config.TRANSACTION_CATEGORIES)
+        if unknown:
+            raise ValueError(f"Категорий нет в TRANSACTION_CATEGORIES: {', '.join(sorted(unknown))}")
+
+        self.groups = {}
+        alternatives = {}
+        for i, (category, words) in enumerate(keywords.items()):
+            group = f"c{i}"
+            self.groups[group] = category
+            alternatives[category] = f"(?P<{group}>{'|'.join(re.escape(word) for word in words)})"
+
+        def compile_pattern(categories) -> Optional[re.Pattern]:
+            parts = [alternatives[category] for category in categories]
+            return re.compile(rf"(?<!\w)(?:{'|'.join(parts)})", re.IGNORECASE) if parts else None
+
+        self.patterns = {
+            'Credit': compile_pattern([c for c in alternatives if c in INCOME_CATEGORIES]),
+            'Debit': compile_pattern([c for c in alternatives if c not in INCOME_CATEGORIES]),
+            None: compile_pattern(alternatives),
+        }
+
+        self._cache = {}
+
+    def categorize(self, information: Optional[str], code: Optional[str] = None,
+                   indicator: Optional[str] = None) -> str:
+        """Категория транзакции по описанию, коду и направлению (Credit/Debit)"""
+        key = (information, code, indicator)
+        category = self._cache.get(key)
+        if category is not None:
+            return category
+
+        direction = indicator if indicator in ('Credit', 'Debit') else None
+        pattern = self.patterns[direction]
+        match = pattern.search(information) if information and pattern else None
+        if match:
+            category = self.groups[match.lastgroup]
+        elif code in self.codes and (direction is None
+                                     or (self.codes[code] in INCOME_CATEGORIES) == (direction == 'Credit')):
+            category = self.codes[code]
+        else:
+            category = INCOME_FALLBACK if indicator == 'Credit' else EXPENSE_FALLBACK
+
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = category
+        return category
+
+    def categorize_many(self, rows: Iterable[Tuple[Optional[str], Optional[str], Optional[str]]]) -> List[str]:
+        """Категории пачки (описание, код, направление)"""
+        categorize = self.categorize
+        return [categorize(information, code, indicator) for information, code, indicator in rows]
+
+
+_categorizer = None
+
+
+def get_categorizer() -> TransactionCategorizer:
+    """Общий категоризатор процесса (правила компилируются один раз)"""
+    global _categorizer
+    if _categorizer is None:
+        _categorizer = TransactionCategorizer()
+    return _categorizer
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Категоризация транзакций')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('reclassify', help='Пересчитать категории всех транзакций')
+
+    test_parser = subparsers.add_parser('test', help='Категория для описания')
+    test_parser.add_argument('information', help='Описание транзакции')
+    test_parser.add_argument('--code', help='Код операции')
+    test_parser.add_argument('--indicator', default='Debit', help='Credit или Debit')
+    args = parser.parse_args()
+
+    if args.command == 'test':
+        print(get_categorizer().categorize(args.information, args.code, args.indicator))
+        return
+
+    from app_logging import setup_logging
+    from database import db_manager
+
+    setup_logging()
+    updated = db_manager.reclassify_transactions()
+    print(f"✅ Категории пересчитаны: {updated} транзакций")
+
+
+if __name__ == "__main__":
+    main()
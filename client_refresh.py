@@ -0,0 +1,128 @@
+# client_refresh.py
+"""
+Обновление одного клиента из банка по запросу менеджера
+(POST /api/clients/<id>/refresh)
+- параллельные запросы на одного клиента получают один и тот же Future:
+  в банк уходит одна загрузка, остальные ждут её результата
+- клиента можно обновлять не чаще CLIENT_REFRESH_MIN_INTERVAL секунд,
+  одновременно идёт не больше CLIENT_REFRESH_MAX_CONCURRENT загрузок
+Объединение запросов работает внутри процесса (воркера gunicorn)
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from config import Config
+from base import DirectAPIToSQLite
+from sync_scheduler import incremental_since
+
+
+class RefreshRateLimited(Exception):
+    """Обновление отклонено ограничением частоты"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientRefresher:
+    """Загрузка данных одного клиента банка через DirectAPIToSQLite.refresh_client"""
+
+    def __init__(self, db_file: str = None, min_interval: float = None,
+                 max_concurrent: int = None,
+                 importer_factory: Callable[[], DirectAPIToSQLite] = None):
+        self.db_file = db_file or Config.DATABASE_FILE
+        self.min_interval = Config.CLIENT_REFRESH_MIN_INTERVAL if min_interval is None else min_interval
+        self.max_concurrent = max_concurrent or Config.CLIENT_REFRESH_MAX_CONCURRENT
+        self.importer_factory = importer_factory or (lambda: DirectAPIToSQLite(self.db_file))
+
+        # (client_id, bank_code) -> Future идущей загрузки
+        self._inflight = {}
+        # (client_id, bank_code) -> time.monotonic() окончания последней загрузки
+        self._finished_at = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='refresh')
+
+    def submit(self, client_id: str, bank_code: str) -> Tuple[Future, bool]:
+        """Запустить обновление клиента или присоединиться к идущему
+
+        Returns:
+            (Future с результатом refresh, True — если загрузка уже шла)
+        Raises:
+            RefreshRateLimited: клиент обновлялся недавно или занят лимит загрузок
+        """
+        key = (client_id, bank_code)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, True
+
+            finished_at = self._finished_at.get(key)
+            if finished_at is not None:
+                retry_after = self.min_interval - (time.monotonic() - finished_at)
+                if retry_after > 0:
+                    raise RefreshRateLimited('Клиент недавно обновлялся', retry_after)
+
+            if len(self._inflight) >= self.max_concurrent:
+                raise RefreshRateLimited('Слишком много обновлений одновременно', 1)
+
+            # Копия контекста: записи загрузки получают correlation_id запроса, который её начал
+            future = self.executor.submit(contextvars.copy_context().run, self._refresh, client_id, bank_code)
+            self._inflight[key] = future
+
+        # Вне блокировки: готовый Future вызывает callback сразу в этом потоке
+        future.add_done_callback(lambda _: self._done(key))
+        return future, False
+
+    def _done(self, key: Tuple[str, str]):
+        now = time.monotonic()
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._finished_at[key] = now
+            # Старые отметки больше не ограничивают — не копим их
+            for stale in [k for k, t in self._finished_at.items() if now - t >= self.min_interval]:
+                del self._finished_at[stale]
+
+    def _refresh(self, client_id: str, bank_code: str) -> Dict:
+        started = time.perf_counter()
+        importer = self.importer_factory()
+        importer.since = incremental_since(bank_code)
+
+        success = importer.refresh_client(client_id, bank_code)
+        stats = importer.stats
+        return {
+            'success': success,
+            'accounts': stats['accounts'],
+            'balances': stats['balances'],
+            'transactions': stats['transactions'],
+            'duration_ms': int((time.perf_counter() - started) * 1000)
+        }
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_client_refresher() -> ClientRefresher:
+    """Общий ClientRefresher процесса (создаётся при первом обращении)"""
+    global _refresher
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = ClientRefresher()
+    return _refresher
+
+
+def set_client_refresher(refresher: Optional[ClientRefresher]) -> Optional[ClientRefresher]:
+    """Подменить ClientRefresher; None — снова создавать при первом обращении
+
+    Возвращает предыдущий
+    """
+    global _refresher
+    with _refresher_lock:
+        previous = _refresher
+        _refresher = refresher
+    return previous
@@ -1,30 +1,411 @@
 # database.py
 """
-Модуль для работы с базой данных SQLite
+Модуль для работы с базой данных SQLite (или PostgreSQL, см. storage.py)
 Совместимость со старой структурой из base.py
+
+Раздельный режим (DB_SHARD_DIR): банковские таблицы каждого банка в своём
+файле <bank_code>.db, AI диалоги, анализы и история синхронизаций — в
+DATABASE_FILE. Запрос по клиенту идёт в файл его банка, общие запросы —
+параллельно во все файлы (ShardedDatabaseManager)
 """
 
 import sqlite3
 import os
-from typing import Optional
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from contextlib import contextmanager
 from config import Config
+from app_logging import get_logger
+from storage import SQLiteBackend, create_backend
+from categorizer import get_categorizer
+
+
+# execute_query(..., shard=ALL_SHARDS) — запрос во все БД банков, строки объединяются
+ALL_SHARDS = '*'
+
+# Таблицы, которые в раздельном режиме лежат в файле банка
+SHARDED_TABLES = ('banks', 'clients', 'accounts', 'balances', 'transactions', 'products',
+                  'transaction_rollups', 'transaction_anomalies')
+
+# Счётчик версии данных (DataVersionRepository): вставки видны по MAX(id)
+# таблиц, а правки и удаления сдвигают счётчик в той же транзакции
+DATA_VERSION_BUMP = 'UPDATE data_version SET version = version + 1'
+
+# Помесячные итоги транзакций клиента по направлению и категории: таймлайн
+# читает десятки строк вместо всей истории. Новые транзакции добавляются
+# через ROLLUP_UPSERT (импортёр, TransactionRepository.create), при создании
+# таблица заполняется из transactions (ROLLUP_BACKFILL). В CRM структуре bank_code = ''
+ROLLUP_TABLE = '''
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        client_id TEXT NOT NULL,
+        bank_code TEXT NOT NULL,
+        month TEXT NOT NULL,
+        direction TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        transaction_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(client_id, bank_code, month, direction, category)
+    )
+'''
+
+ROLLUP_UPSERT = '''
+    INSERT INTO transaction_rollups
+    (client_id, bank_code, month, direction, category, total, transaction_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(client_id, bank_code, month, direction, category) DO UPDATE SET
+        total = transaction_rollups.total + excluded.total,
+        transaction_count = transaction_rollups.transaction_count + excluded.transaction_count
+'''
+
+# Категория (categorizer.py) и направление — как в TransactionRepository; транзакции без даты
+# и с неизвестным направлением в итоги не входят
+ROLLUP_BACKFILL = {
+    'banking': '''
+        INSERT INTO transaction_rollups
+        (client_id, bank_code, month, direction, category, total, transaction_count)
+        SELECT
+            client_id,
+            bank_code,
+            substr(CAST(booking_date_time AS TEXT), 1, 7),
+            CASE credit_debit_indicator WHEN 'Credit' THEN 'income' ELSE 'expense' END,
+            COALESCE(category, 'Без категории'),
+            COALESCE(SUM(amount), 0),
+            COUNT(*)
+        FROM transactions
+        WHERE credit_debit_indicator IN ('Credit', 'Debit') AND booking_date_time IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    ''',
+    'crm': '''
+        INSERT INTO transaction_rollups
+        (client_id, bank_code, month, direction, category, total, transaction_count)
+        SELECT
+            CAST(client_id AS TEXT),
+            '',
+            substr(CAST(transaction_date AS TEXT), 1, 7),
+            direction,
+            category,
+            COALESCE(SUM(amount), 0),
+            COUNT(*)
+        FROM transactions
+        WHERE transaction_date IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    '''
+}
+
+# Необычные транзакции клиентов (anomalies.py): пересчитываются по банку
+# после синхронизации, API и контекст AI читают готовый результат
+ANOMALY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS transaction_anomalies (
+        client_id TEXT NOT NULL,
+        bank_code TEXT NOT NULL,
+        transaction_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        category TEXT,
+        direction TEXT,
+        amount REAL,
+        booking_date TEXT,
+        description TEXT,
+        score REAL NOT NULL,
+        baseline REAL,
+        detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(bank_code, transaction_id, kind)
+    )
+'''
+
+# Полнотекстовый поиск по описанию и коду операции банковских транзакций.
+# SQLite: FTS5 с внешним содержимым (сам текст хранится только в transactions),
+# индекс ведут триггеры. Правка категории (reclassify) триггер не запускает
+SEARCH_TABLE = 'transactions_fts'
+
+SEARCH_FTS = '''
+    CREATE VIRTUAL TABLE transactions_fts USING fts5(
+        transaction_information,
+        transaction_code,
+        content='transactions',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+
+SEARCH_TRIGGERS = {
+    'transactions_fts_insert': '''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts (rowid, transaction_information, transaction_code)
+            VALUES (new.id, new.transaction_information, new.transaction_code);
+        END
+    ''',
+    'transactions_fts_delete': '''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, transaction_information, transaction_code)
+            VALUES ('delete', old.id, old.transaction_information, old.transaction_code);
+        END
+    ''',
+    'transactions_fts_update': '''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_update
+        AFTER UPDATE OF transaction_information, transaction_code ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, transaction_information, transaction_code)
+            VALUES ('delete', old.id, old.transaction_information, old.transaction_code);
+            INSERT INTO transactions_fts (rowid, transaction_information, transaction_code)
+            VALUES (new.id, new.transaction_information, new.transaction_code);
+        END
+    ''',
+}
+
+# PostgreSQL: тот же поиск через tsvector с GIN индексом по выражению
+SEARCH_VECTOR = "to_tsvector('simple', COALESCE(transaction_information, '') || ' ' || COALESCE(transaction_code, ''))"
+
+# Поиск по истории AI диалогов (AIConversationRepository.search) — так же,
+# как по транзакциям: FTS5 с внешним содержимым и триггерами, в PostgreSQL — GIN
+CONVERSATION_SEARCH_TABLE = 'ai_conversations_fts'
+
+CONVERSATION_SEARCH_FTS = '''
+    CREATE VIRTUAL TABLE ai_conversations_fts USING fts5(
+        question,
+        answer,
+        content='ai_conversations',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+
+CONVERSATION_SEARCH_TRIGGERS = {
+    'ai_conversations_fts_insert': '''
+        CREATE TRIGGER IF NOT EXISTS ai_conversations_fts_insert AFTER INSERT ON ai_conversations BEGIN
+            INSERT INTO ai_conversations_fts (rowid, question, answer)
+            VALUES (new.id, new.question, new.answer);
+        END
+    ''',
+    'ai_conversations_fts_delete': '''
+        CREATE TRIGGER IF NOT EXISTS ai_conversations_fts_delete AFTER DELETE ON ai_conversations BEGIN
+            INSERT INTO ai_conversations_fts (ai_conversations_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, old.answer);
+        END
+    ''',
+    'ai_conversations_fts_update': '''
+        CREATE TRIGGER IF NOT EXISTS ai_conversations_fts_update
+        AFTER UPDATE OF question, answer ON ai_conversations BEGIN
+            INSERT INTO ai_conversations_fts (ai_conversations_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, old.answer);
+            INSERT INTO ai_conversations_fts (rowid, question, answer)
+            VALUES (new.id, new.question, new.answer);
+        END
+    ''',
+}
+
+CONVERSATION_SEARCH_VECTOR = "to_tsvector('simple', question || ' ' || answer)"
+
+# Код банка становится именем файла
+_SHARD_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+logger = get_logger('database')
+
+
+def ensure_rollup_table(backend, cursor, structure: str) -> bool:
+    """Создать transaction_rollups и заполнить из transactions
+    
+    Общая для DatabaseManager и импортёра: таблица, созданная пустой поверх
+    существующих транзакций, дала бы неверный таймлайн. True — таблица создана
+    """
+    if 'transaction_rollups' in backend.tables(cursor):
+        return False
+    cursor.execute(ROLLUP_TABLE)
+    cursor.execute(ROLLUP_BACKFILL[structure])
+    return True
+
+
+def ensure_anomaly_table(cursor):
+    """Создать transaction_anomalies с индексами под карточку клиента
+    и список последних аномалий"""
+    cursor.execute(ANOMALY_TABLE)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_anomalies_client
+        ON transaction_anomalies(client_id, bank_code, booking_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_anomalies_date
+        ON transaction_anomalies(booking_date)
+    ''')
+
+
+def _ensure_fts(backend, cursor, table: str, fts: str, triggers: Dict[str, str]) -> bool:
+    """FTS5 таблица с внешним содержимым и её триггеры
+    
+    True — таблица только что создана и заполнена. Без FTS5 в сборке
+    SQLite таблицы нет, поиск идёт через LIKE
+    """
+    created = table not in backend.tables(cursor)
+    if created:
+        try:
+            cursor.execute(fts)
+        except backend.Error as e:
+            logger.warning("⚠️ Полнотекстовый поиск %s недоступен (%s): поиск через LIKE", table, e)
+            return False
+    for trigger in triggers.values():
+        cursor.execute(trigger)
+    if created:
+        cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+    return created
+
+
+def ensure_transaction_search(backend, cursor) -> bool:
+    """Полнотекстовый индекс банковских транзакций (TransactionRepository.search)
+    
+    True — индекс только что создан и заполнен из transactions
+    """
+    if backend.name == 'postgresql':
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_transactions_search ON transactions USING GIN ({SEARCH_VECTOR})")
+        return False
+    return _ensure_fts(backend, cursor, SEARCH_TABLE, SEARCH_FTS, SEARCH_TRIGGERS)
+
+
+def ensure_conversation_search(backend, cursor) -> bool:
+    """Индексы истории AI диалогов: (client_id, created_at) и (created_at) под
+    постраничную выдачу, полнотекстовый — под AIConversationRepository.search
+    
+    True — полнотекстовый индекс только что создан и заполнен
+    """
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_client_created
+        ON ai_conversations(client_id, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_created
+        ON ai_conversations(created_at)
+    ''')
+    # Составной индекс покрывает и прежний индекс по client_id
+    cursor.execute('DROP INDEX IF EXISTS idx_conversations_client')
+    if backend.name == 'postgresql':
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_conversations_search ON ai_conversations USING GIN ({CONVERSATION_SEARCH_VECTOR})")
+        return False
+    return _ensure_fts(backend, cursor, CONVERSATION_SEARCH_TABLE, CONVERSATION_SEARCH_FTS,
+                       CONVERSATION_SEARCH_TRIGGERS)
+
+
+def drop_search_triggers(cursor):
+    """Снять триггеры поиска на время массовой загрузки: индекс затем
+    строится одним rebuild_transaction_search (ensure_transaction_search
+    возвращает триггеры)"""
+    for name in SEARCH_TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def rebuild_transaction_search(cursor):
+    """Перестроить FTS5 индекс по всей таблице transactions"""
+    cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def ensure_category_column(backend, cursor) -> bool:
+    """Колонка transactions.category (categorizer.py) с индексом в банковской БД
+    
+    True — колонка только что добавлена, категории нужно посчитать
+    (reclassify_transactions)
+    """
+    cursor.execute('PRAGMA table_info(transactions)')
+    added = 'category' not in {row['name'] for row in cursor.fetchall()}
+    if added:
+        cursor.execute('ALTER TABLE transactions ADD COLUMN category TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_category
+        ON transactions(category, credit_debit_indicator)
+    ''')
+    return added
+
+
+def reclassify_transactions(backend, cursor) -> int:
+    """Пересчитать transactions.category всей таблицы одним UPDATE
+    
+    Категория зависит только от (описание, код, направление): каждое сочетание
+    категоризируется один раз, UPDATE берёт результат из временной таблицы.
+    Итоги месяцев (transaction_rollups) пересобираются по новым категориям.
+    Возвращает число обновлённых транзакций
+    """
+    cursor.execute('''
+        SELECT DISTINCT
+            COALESCE(transaction_information, ''),
+            COALESCE(transaction_code, ''),
+            COALESCE(credit_debit_indicator, '')
+        FROM transactions
+    ''')
+    keys = [tuple(row) for row in cursor.fetchall()]
+    categories = get_categorizer().categorize_many(keys)
+    
+    cursor.execute('''
+        CREATE TEMP TABLE category_map (
+            information TEXT,
+            code TEXT,
+            indicator TEXT,
+            category TEXT,
+            PRIMARY KEY(information, code, indicator)
+        )
+    ''')
+    try:
+        cursor.executemany(
+            'INSERT OR IGNORE INTO category_map (information, code, indicator, category) VALUES (?, ?, ?, ?)',
+            [key + (category,) for key, category in zip(keys, categories)]
+        )
+        cursor.execute('''
+            UPDATE transactions SET category = (
+                SELECT m.category FROM category_map m
+                WHERE m.information = COALESCE(transactions.transaction_information, '')
+                  AND m.code = COALESCE(transactions.transaction_code, '')
+                  AND m.indicator = COALESCE(transactions.credit_debit_indicator, '')
+            )
+        ''')
+        updated = cursor.rowcount
+    finally:
+        cursor.execute('DROP TABLE category_map')
+    
+    if 'transaction_rollups' in backend.tables(cursor):
+        cursor.execute('DELETE FROM transaction_rollups')
+        cursor.execute(ROLLUP_BACKFILL['banking'])
+    return updated
+
+
+def shard_file(shard_dir: str, bank_code: str) -> str:
+    """Путь к файлу БД банка в раздельном режиме"""
+    if not _SHARD_NAME_PATTERN.match(str(bank_code)):
+        raise ValueError(f"Недопустимый код банка: {bank_code}")
+    return os.path.join(shard_dir, f"{bank_code}.db")
 
 
 class DatabaseManager:
     """Менеджер базы данных"""
     
-    def __init__(self, db_file: str = None):
-        """Инициализация менеджера БД"""
-        self.db_file = db_file or Config.DATABASE_FILE
-        self.db_exists = os.path.exists(self.db_file)
+    # Все таблицы в одном файле; аргумент shard запросов не используется
+    sharded = False
+    
+    def __init__(self, db_file: str = None, backend=None):
+        """Инициализация менеджера БД
+        
+        db_file=':memory:' — БД в памяти (для тестов)
+        backend — хранилище из storage.py (по умолчанию SQLite с db_file),
+        например PostgresBackend()
+        """
+        self.backend = backend or SQLiteBackend(db_file)
+        self.db_file = self.backend.location
+        self.in_memory = self.backend.in_memory
+        self.db_exists = self.backend.exists()
+        
+        # Реестр схемы: таблица -> список колонок (PRAGMA table_info один раз)
+        self._schema = {}
+        self._schema_lock = threading.Lock()
+        # Открытые снимки чтения (snapshot) по потокам
+        self._local = threading.local()
         self.init_database()
     
+    def close(self):
+        """Освободить БД в памяти или пул подключений (для файловой БД ничего не делает)"""
+        self.backend.close()
+    
+    def _connect(self, check_same_thread: bool = True):
+        return self.backend.connect(check_same_thread)
+    
     @contextmanager
     def get_connection(self):
         """Контекстный менеджер для работы с подключением к БД"""
-        conn = sqlite3.connect(self.db_file)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         try:
             yield conn
             conn.commit()
@@ -32,7 +413,7 @@ class DatabaseManager:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            self.backend.release(conn)
     
     def check_existing_structure(self):
         """Проверить структуру существующей БД"""
@@ -40,19 +421,15 @@ class DatabaseManager:
             return None
             
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self.backend.cursor(conn)
             
             # Получаем список таблиц
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table'
-            """)
-            tables = {row[0] for row in cursor.fetchall()}
+            tables = set(self.backend.tables(cursor))
             
             # Если есть старая структура (банковская)
             if 'banks' in tables and 'accounts' in tables:
                 cursor.execute("PRAGMA table_info(transactions)")
-                columns = {row[1] for row in cursor.fetchall()}
+                columns = {row['name'] for row in cursor.fetchall()}
                 return {
                     'type': 'banking',
                     'tables': tables,
@@ -62,7 +439,7 @@ class DatabaseManager:
             # Если есть новая структура (CRM)
             if 'clients' in tables:
                 cursor.execute("PRAGMA table_info(clients)")
-                columns = {row[1] for row in cursor.fetchall()}
+                columns = {row['name'] for row in cursor.fetchall()}
                 
                 # Определяем тип по колонкам
                 if 'email' in columns and 'phone' in columns:
@@ -80,34 +457,122 @@ class DatabaseManager:
             
             return None
     
+    @contextmanager
+    def snapshot(self):
+        """Снимок для чтения: все execute_query внутри блока в этом потоке
+        идут через одно подключение в одной транзакции и видят согласованные
+        данные, даже если импорт пишет в БД параллельно (в WAL запись не
+        блокирует снимок). Вложенные snapshot используют внешний
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            yield
+            return
+        
+        conn = self._connect()
+        self.backend.begin_snapshot(conn)
+        self._local.conn = conn
+        try:
+            yield
+        finally:
+            self._local.conn = None
+            conn.rollback()
+            self.backend.release(conn)
+    
+    def _enable_journal_mode(self):
+        """Включить режим журнала из Config (WAL сохраняется в файле БД)"""
+        if not Config.DB_JOURNAL_MODE:
+            return
+        with self.get_connection() as conn:
+            mode = self.backend.set_journal_mode(conn, Config.DB_JOURNAL_MODE)
+        if mode is not None and mode.lower() != Config.DB_JOURNAL_MODE.lower():
+            logger.warning("⚠️ Режим журнала %s не включён, текущий: %s", Config.DB_JOURNAL_MODE, mode)
+    
     def init_database(self):
         """Инициализация базы данных"""
+        self._enable_journal_mode()
         structure = self.check_existing_structure()
         
         if structure:
             if structure['type'] == 'banking':
-                print(f"✅ Обнаружена банковская БД: {self.db_file}")
-                print(f"📊 Таблицы: {', '.join(structure['tables'])}")
+                logger.info("✅ Обнаружена банковская БД: %s", self.db_file)
+                logger.debug("📊 Таблицы: %s", ', '.join(structure['tables']))
                 self._add_ai_conversations_table()
+                self._ensure_banking_indexes()
+                self._ensure_transaction_search()
+                self._ensure_transaction_categories()
+                self._add_transaction_rollups_table('banking')
             elif structure['type'] == 'crm':
-                print(f"✅ Обнаружена CRM БД: {self.db_file}")
+                logger.info("✅ Обнаружена CRM БД: %s", self.db_file)
                 self._ensure_crm_structure()
+                self._add_transaction_rollups_table('crm')
         else:
-            print(f"🆕 Создается новая CRM база данных: {self.db_file}")
+            logger.info("🆕 Создается новая CRM база данных: %s", self.db_file)
             self._create_crm_database()
+            self._add_transaction_rollups_table('crm')
+        
+        self._add_transaction_anomalies_table()
+        self._ensure_conversation_search()
+        self._add_ai_analyses_table()
+        self._add_sync_runs_table()
+        self._add_data_version_table()
+        self.invalidate_schema()
+    
+    def get_columns(self, table: str) -> list:
+        """Колонки таблицы из реестра схемы
+        
+        Репозитории определяют структуру БД (banking/crm) на каждом запросе,
+        поэтому PRAGMA table_info выполняется один раз на таблицу.
+        Отсутствующая таблица не кэшируется
+        """
+        columns = self._schema.get(table)
+        if columns is None:
+            columns = [row['name'] for row in self.execute_query(f"PRAGMA table_info({table})")]
+            if columns:
+                with self._schema_lock:
+                    self._schema[table] = columns
+        return columns
+    
+    def invalidate_schema(self):
+        """Сбросить реестр схемы (после изменения структуры таблиц)"""
+        with self._schema_lock:
+            self._schema = {}
+    
+    def warm_up(self) -> dict:
+        """Заполнить реестр схемы всеми таблицами БД
+        
+        Вызывается до форка воркеров gunicorn (preload_app), чтобы воркеры
+        получили готовый реестр
+        """
+        return {table: self.get_columns(table) for table in self.list_tables()}
+    
+    def list_tables(self) -> List[str]:
+        """Таблицы БД (внутри snapshot — из его транзакции)"""
+        snapshot_conn = getattr(self._local, 'conn', None)
+        if snapshot_conn is not None:
+            return self.backend.tables(self.backend.cursor(snapshot_conn))
+        with self.get_connection() as conn:
+            return self.backend.tables(self.backend.cursor(conn))
+    
+    def ping(self) -> bool:
+        """Проверить, что БД доступна для чтения
+        
+        Файл проверяется отдельно: sqlite3.connect молча создал бы пустую БД
+        """
+        if not self.in_memory and self.backend.name == 'sqlite' and not self.backend.exists():
+            return False
+        try:
+            self.execute_query('SELECT 1')
+            return True
+        except self.backend.Error:
+            return False
     
     def _add_ai_conversations_table(self):
         """Добавить таблицу AI диалогов в существующую БД"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='ai_conversations'
-            """)
+            cursor = self.backend.cursor(conn)
             
-            if not cursor.fetchone():
-                print("➕ Добавление таблицы ai_conversations")
+            if 'ai_conversations' not in self.backend.tables(cursor):
+                logger.info("➕ Добавление таблицы ai_conversations")
                 cursor.execute('''
                     CREATE TABLE ai_conversations (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -118,24 +583,150 @@ class DatabaseManager:
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 ''')
+                logger.info("✅ Таблица ai_conversations создана")
+    
+    def _ensure_banking_indexes(self):
+        """Индексы банковской БД под карточку клиента
+        
+        (client_id, bank_code, booking_date_time) отдаёт последние N транзакций
+        клиента в банке без сортировки всей истории
+        """
+        with self.get_connection() as conn:
+            cursor = self.backend.cursor(conn)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transactions_client_bank_date
+                ON transactions(client_id, bank_code, booking_date_time)
+            ''')
+    
+    def _ensure_transaction_search(self):
+        """Полнотекстовый поиск по транзакциям; в старой БД индекс строится по всей таблице"""
+        with self.get_connection() as conn:
+            if ensure_transaction_search(self.backend, self.backend.cursor(conn)):
+                logger.info("✅ Полнотекстовый индекс транзакций построен")
+    
+    def _ensure_conversation_search(self):
+        """Индексы истории AI диалогов; в старой БД полнотекстовый строится по всей таблице"""
+        with self.get_connection() as conn:
+            if ensure_conversation_search(self.backend, self.backend.cursor(conn)):
+                logger.info("✅ Полнотекстовый индекс AI диалогов построен")
+    
+    def _ensure_transaction_categories(self):
+        """Колонка категорий банковских транзакций; в старой БД — с пересчётом"""
+        with self.get_connection() as conn:
+            cursor = self.backend.cursor(conn)
+            if ensure_category_column(self.backend, cursor):
+                updated = reclassify_transactions(self.backend, cursor)
+                logger.info("✅ Категории транзакций посчитаны: %d", updated)
+    
+    def reclassify_transactions(self) -> int:
+        """Пересчитать категории всех транзакций (после изменения правил
+        categorizer.py); в CRM структуре категории вводятся вручную — 0"""
+        structure = self.check_existing_structure()
+        if not structure or structure['type'] != 'banking':
+            return 0
+        with self.get_connection() as conn:
+            return reclassify_transactions(self.backend, self.backend.cursor(conn))
+    
+    def _add_transaction_rollups_table(self, structure: str):
+        """Добавить помесячные итоги транзакций (таймлайн клиента)"""
+        with self.get_connection() as conn:
+            cursor = self.backend.cursor(conn)
+            if ensure_rollup_table(self.backend, cursor, structure):
+                logger.info("✅ Таблица transaction_rollups создана из transactions")
+    
+    def _add_transaction_anomalies_table(self):
+        """Добавить таблицу необычных транзакций (anomalies.py)"""
+        with self.get_connection() as conn:
+            ensure_anomaly_table(self.backend.cursor(conn))
+    
+    def _add_ai_analyses_table(self):
+        """Добавить таблицу результатов пакетного AI анализа"""
+        with self.get_connection() as conn:
+            cursor = self.backend.cursor(conn)
+            
+            if 'ai_client_analyses' not in self.backend.tables(cursor):
+                logger.info("➕ Добавление таблицы ai_client_analyses")
+                cursor.execute('''
+                    CREATE TABLE ai_client_analyses (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        batch_id TEXT NOT NULL,
+                        client_id TEXT NOT NULL,
+                        question TEXT NOT NULL,
+                        answer TEXT,
+                        model TEXT,
+                        status TEXT NOT NULL CHECK(status IN ('success', 'error')),
+                        error TEXT,
+                        total_income REAL DEFAULT 0,
+                        total_expense REAL DEFAULT 0,
+                        balance REAL DEFAULT 0,
+                        transaction_count INTEGER DEFAULT 0,
+                        duration_ms INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
                 
                 cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_conversations_client 
-                    ON ai_conversations(client_id)
+                    CREATE INDEX IF NOT EXISTS idx_analyses_client 
+                    ON ai_client_analyses(client_id, id)
                 ''')
-                print("✅ Таблица ai_conversations создана")
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_analyses_batch 
+                    ON ai_client_analyses(batch_id)
+                ''')
+                logger.info("✅ Таблица ai_client_analyses создана")
+    
+    def _add_sync_runs_table(self):
+        """Добавить таблицу истории синхронизаций с банками (sync_scheduler.py)"""
+        with self.get_connection() as conn:
+            cursor = self.backend.cursor(conn)
+            
+            if 'sync_runs' not in self.backend.tables(cursor):
+                logger.info("➕ Добавление таблицы sync_runs")
+                cursor.execute('''
+                    CREATE TABLE sync_runs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        bank_code TEXT NOT NULL,
+                        status TEXT NOT NULL CHECK(status IN ('running', 'success', 'error')),
+                        since TEXT,
+                        clients INTEGER DEFAULT 0,
+                        failed_clients INTEGER DEFAULT 0,
+                        rows INTEGER DEFAULT 0,
+                        error TEXT,
+                        duration_ms INTEGER,
+                        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP
+                    )
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_sync_runs_bank 
+                    ON sync_runs(bank_code, id)
+                ''')
+                logger.info("✅ Таблица sync_runs создана")
+    
+    def _add_data_version_table(self):
+        """Добавить счётчик версии данных (одна строка, DATA_VERSION_BUMP)"""
+        with self.get_connection() as conn:
+            cursor = self.backend.cursor(conn)
+            
+            if 'data_version' not in self.backend.tables(cursor):
+                cursor.execute('''
+                    CREATE TABLE data_version (
+                        id INTEGER PRIMARY KEY CHECK(id = 1),
+                        version INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                cursor.execute('INSERT INTO data_version (id, version) VALUES (1, 0)')
+                logger.info("✅ Таблица data_version создана")
     
     def _ensure_crm_structure(self):
         """Проверить и дополнить CRM структуру"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self.backend.cursor(conn)
             
             # Проверяем наличие необходимых таблиц
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name IN ('clients', 'ai_conversations')
-            """)
-            existing_tables = {row[0] for row in cursor.fetchall()}
+            existing_tables = set(self.backend.tables(cursor))
             
             if 'ai_conversations' not in existing_tables:
                 self._add_ai_conversations_table()
@@ -143,7 +734,7 @@ class DatabaseManager:
     def _create_crm_database(self):
         """Создать новую CRM базу данных"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self.backend.cursor(conn)
             
             # Таблица клиентов (простая CRM структура)
             cursor.execute('''
@@ -157,7 +748,7 @@ class DatabaseManager:
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            print("✅ Создана таблица clients")
+            logger.info("✅ Создана таблица clients")
             
             # Таблица транзакций (простая CRM структура)
             cursor.execute('''
@@ -173,7 +764,7 @@ class DatabaseManager:
                     FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
                 )
             ''')
-            print("✅ Создана таблица transactions")
+            logger.info("✅ Создана таблица transactions")
             
             # Таблица AI диалогов
             cursor.execute('''
@@ -187,7 +778,7 @@ class DatabaseManager:
                     FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
                 )
             ''')
-            print("✅ Создана таблица ai_conversations")
+            logger.info("✅ Создана таблица ai_conversations")
             
             # Индексы
             cursor.execute('''
@@ -200,44 +791,43 @@ class DatabaseManager:
                 ON transactions(transaction_date)
             ''')
             
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_conversations_client 
-                ON ai_conversations(client_id)
-            ''')
-            
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_clients_status 
                 ON clients(status)
             ''')
-            print("✅ Созданы индексы")
+            logger.info("✅ Созданы индексы")
     
-    def execute_query(self, query: str, params: tuple = ()) -> list:
-        """Выполнить SELECT запрос"""
+    def execute_query(self, query: str, params: tuple = (), shard: Optional[str] = None) -> list:
+        """Выполнить SELECT запрос (внутри snapshot — в его транзакции)
+        
+        shard — код банка или ALL_SHARDS для ShardedDatabaseManager;
+        в одном файле запрос выполняется как есть
+        """
+        snapshot_conn = getattr(self._local, 'conn', None)
+        if snapshot_conn is not None:
+            cursor = self.backend.cursor(snapshot_conn)
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+        
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self.backend.cursor(conn)
             cursor.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
     
-    def execute_update(self, query: str, params: tuple = ()) -> int:
-        """Выполнить INSERT/UPDATE/DELETE запрос"""
+    def execute_update(self, query: str, params: tuple = (), shard: Optional[str] = None) -> int:
+        """Выполнить INSERT/UPDATE/DELETE запрос (shard — как в execute_query)"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return cursor.lastrowid if cursor.lastrowid else cursor.rowcount
+            return self.backend.execute_update(self.backend.cursor(conn), query, params)
     
     def get_table_stats(self) -> dict:
         """Получить статистику по таблицам"""
         stats = {}
         
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self.backend.cursor(conn)
             
             # Получаем список всех таблиц
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name NOT LIKE 'sqlite_%'
-            """)
-            tables = [row[0] for row in cursor.fetchall()]
+            tables = self.backend.tables(cursor)
             
             for table in tables:
                 try:
@@ -251,10 +841,323 @@ class DatabaseManager:
     def clear_table(self, table_name: str):
         """Очистить таблицу"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
+            cursor = self.backend.cursor(conn)
             cursor.execute(f'DELETE FROM {table_name}')
-            cursor.execute(f'DELETE FROM sqlite_sequence WHERE name="{table_name}"')
+            self.backend.reset_sequence(cursor, table_name)
+            tables = self.backend.tables(cursor)
+            # Итоги и аномалии считаются по транзакциям — очищаются вместе с ними
+            if table_name == 'transactions':
+                for derived in ('transaction_rollups', 'transaction_anomalies'):
+                    if derived in tables:
+                        cursor.execute(f'DELETE FROM {derived}')
+            if 'data_version' in tables:
+                cursor.execute(DATA_VERSION_BUMP)
+    
+    def vacuum(self) -> int:
+        """Сжать файл SQLite (VACUUM); вернуть размер файла после, байт"""
+        with self.get_connection() as conn:
+            conn.execute('VACUUM')
+        return 0 if self.in_memory else os.path.getsize(self.db_file)
+
+
+class BankShard(DatabaseManager):
+    """Файл одного банка в раздельном режиме: только банковские таблицы
+    
+    Схему создаёт импортёр (base.py), здесь — режим журнала и индексы
+    """
+    
+    def __init__(self, db_file: str, bank_code: str):
+        self.bank_code = bank_code
+        super().__init__(db_file)
+    
+    def init_database(self):
+        self._enable_journal_mode()
+        if self.check_existing_structure():
+            self._ensure_banking_indexes()
+            self._ensure_transaction_search()
+            self._ensure_transaction_categories()
+            self._add_transaction_rollups_table('banking')
+            self._add_transaction_anomalies_table()
+        self.invalidate_schema()
+
+
+class ShardedDatabaseManager(DatabaseManager):
+    """Раздельные БД по банкам
+    
+    DATABASE_FILE хранит таблицы CRM (ai_conversations, ai_client_analyses,
+    sync_runs), банковские таблицы (SHARDED_TABLES) — в <shard_dir>/<bank_code>.db.
+    Импорт, блокировки записи и VACUUM одного банка не задевают остальные
+    
+    execute_query(query, params, shard=...):
+        None       — DATABASE_FILE
+        'abank'    — файл банка (нет файла — пустой результат)
+        ALL_SHARDS — параллельно во все файлы банков, строки объединяются;
+                     агрегаты (COUNT, SUM) репозиторий досчитывает сам
+    """
+    
+    sharded = True
+    
+    def __init__(self, db_file: str = None, shard_dir: str = None, workers: int = None):
+        self.shard_dir = shard_dir or Config.DB_SHARD_DIR
+        os.makedirs(self.shard_dir, exist_ok=True)
+        
+        # bank_code -> BankShard; новые файлы подхватываются при обращении
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers or Config.DB_SHARD_WORKERS,
+                                           thread_name_prefix='shard')
+        super().__init__(db_file)
+    
+    def init_database(self):
+        """DATABASE_FILE: только таблицы CRM"""
+        self._enable_journal_mode()
+        logger.info("✅ Раздельная БД: %s, банки в %s", self.db_file, self.shard_dir)
+        self._add_ai_conversations_table()
+        self._ensure_conversation_search()
+        self._add_ai_analyses_table()
+        self._add_sync_runs_table()
+        self._add_data_version_table()
+        self.invalidate_schema()
+    
+    def close(self):
+        super().close()
+        self.executor.shutdown(wait=False)
+    
+    # ---------- файлы банков ----------
+    
+    def shard_file(self, bank_code: str) -> str:
+        return shard_file(self.shard_dir, bank_code)
+    
+    def discover_shards(self) -> List[str]:
+        """Синхронизировать список банков с файлами каталога; вернуть коды по порядку"""
+        codes = {
+            name[:-3] for name in os.listdir(self.shard_dir)
+            if name.endswith('.db') and _SHARD_NAME_PATTERN.match(name[:-3])
+        }
+        with self._shards_lock:
+            for code in codes - set(self._shards):
+                self._shards[code] = BankShard(self.shard_file(code), code)
+                logger.debug("➕ БД банка %s", code)
+            for code in set(self._shards) - codes:
+                self._shards.pop(code).close()
+            return sorted(self._shards)
+    
+    def shard_codes(self) -> List[str]:
+        return self.discover_shards()
+    
+    def get_shard(self, bank_code: str) -> Optional[BankShard]:
+        """БД банка или None, если файла нет"""
+        shard = self._shards.get(bank_code)
+        if shard is None and os.path.exists(self.shard_file(bank_code)):
+            self.discover_shards()
+            shard = self._shards.get(bank_code)
+        return shard
+    
+    def create_shard(self, bank_code: str) -> BankShard:
+        """Создать файл банка со схемой существующего (для записей в новый банк,
+        например клиентов MANUAL, созданных вручную)"""
+        shard = self.get_shard(bank_code)
+        if shard is not None:
+            return shard
+        
+        codes = self.shard_codes()
+        if not codes:
+            raise ValueError(f"Нет БД банков в {self.shard_dir}: сначала импорт (base.py)")
+        # Служебные таблицы FTS5 (transactions_fts_data, ...) создаёт сама виртуальная таблица,
+        # триггеры — после таблиц
+        schema = self._shards[codes[0]].execute_query(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            f"AND name NOT LIKE '{SEARCH_TABLE}_%' "
+            "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END"
+        )
+        conn = sqlite3.connect(self.shard_file(bank_code), timeout=Config.DB_BUSY_TIMEOUT)
+        try:
+            for row in schema:
+                conn.execute(row['sql'])
+            conn.commit()
+        finally:
+            conn.close()
+        logger.info("🆕 Создана БД банка %s", bank_code)
+        return self.get_shard(bank_code)
+    
+    # ---------- запросы ----------
+    
+    @contextmanager
+    def snapshot(self):
+        """Снимок DATABASE_FILE и всех файлов банков: данные каждого файла
+        согласованы (между банками общей транзакции нет). Подключения
+        снимка используют потоки параллельных запросов — по одному на файл
+        """
+        if getattr(self._local, 'shard_conns', None) is not None:
+            yield
+            return
+        
+        conns = {}
+        try:
+            for code in self.shard_codes():
+                conn = self._shards[code]._connect(check_same_thread=False)
+                conn.execute('BEGIN')
+                conns[code] = conn
+            self._local.shard_conns = conns
+            with super().snapshot():
+                yield
+        finally:
+            self._local.shard_conns = None
+            for conn in conns.values():
+                conn.rollback()
+                conn.close()
+    
+    def _query_shard(self, bank_code: str, query: str, params: tuple, conns: Optional[Dict]) -> list:
+        conn = (conns or {}).get(bank_code)
+        if conn is not None:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+        shard = self.get_shard(bank_code)
+        return shard.execute_query(query, params) if shard is not None else []
+    
+    def fan_out(self, query: str, params: tuple = ()) -> Dict[str, list]:
+        """Запрос во все БД банков параллельно: {bank_code: строки}"""
+        conns = getattr(self._local, 'shard_conns', None)
+        codes = sorted(conns) if conns is not None else self.shard_codes()
+        if len(codes) <= 1:
+            return {code: self._query_shard(code, query, params, conns) for code in codes}
+        
+        futures = {
+            code: self.executor.submit(self._query_shard, code, query, params, conns)
+            for code in codes
+        }
+        return {code: future.result() for code, future in futures.items()}
+    
+    def execute_query(self, query: str, params: tuple = (), shard: Optional[str] = None) -> list:
+        if shard is None:
+            return super().execute_query(query, params)
+        if shard == ALL_SHARDS:
+            return [row for rows in self.fan_out(query, params).values() for row in rows]
+        return self._query_shard(shard, query, params, getattr(self._local, 'shard_conns', None))
+    
+    def execute_update(self, query: str, params: tuple = (), shard: Optional[str] = None) -> int:
+        if shard is None:
+            return super().execute_update(query, params)
+        if shard == ALL_SHARDS:
+            return sum(self._shards[code].execute_update(query, params) for code in self.shard_codes())
+        return self.create_shard(shard).execute_update(query, params)
+    
+    # ---------- схема и обслуживание ----------
+    
+    def get_columns(self, table: str) -> list:
+        """Колонки банковских таблиц — из первой БД банка (схема у всех одна)"""
+        if table not in SHARDED_TABLES:
+            return super().get_columns(table)
+        for code in self.shard_codes():
+            columns = self._shards[code].get_columns(table)
+            if columns:
+                return columns
+        return []
+    
+    def invalidate_schema(self):
+        super().invalidate_schema()
+        for shard in list(getattr(self, '_shards', {}).values()):
+            shard.invalidate_schema()
+    
+    def warm_up(self) -> dict:
+        tables = super().warm_up()
+        for code in self.shard_codes():
+            tables.update(self._shards[code].warm_up())
+        return tables
+    
+    def list_tables(self) -> List[str]:
+        """Таблицы DATABASE_FILE и БД банков"""
+        tables = set(super().list_tables())
+        for code in self.shard_codes():
+            tables.update(self._shards[code].list_tables())
+        return sorted(tables)
+    
+    def ping(self) -> bool:
+        return super().ping() and all(self._shards[code].ping() for code in self.shard_codes())
+    
+    def get_table_stats(self) -> dict:
+        stats = super().get_table_stats()
+        for code in self.shard_codes():
+            for table, count in self._shards[code].get_table_stats().items():
+                stats[table] = stats.get(table, 0) + count
+        return stats
+    
+    def clear_table(self, table_name: str):
+        if table_name not in SHARDED_TABLES:
+            return super().clear_table(table_name)
+        for code in self.shard_codes():
+            self._shards[code].clear_table(table_name)
+        self.execute_update(DATA_VERSION_BUMP)
+    
+    def reclassify_transactions(self) -> int:
+        """Пересчитать категории параллельно во всех БД банков"""
+        shards = [self._shards[code] for code in self.shard_codes()]
+        return sum(self.executor.map(lambda shard: shard.reclassify_transactions(), shards))
+    
+    def vacuum(self, bank_code: Optional[str] = None) -> Dict[str, int]:
+        """VACUUM файла одного банка (или всех); {bank_code: размер после, байт}
+        
+        Блокирует запись только в файл этого банка
+        """
+        codes = [bank_code] if bank_code else self.shard_codes()
+        sizes = {}
+        for code in codes:
+            shard = self.get_shard(code)
+            if shard is None:
+                raise ValueError(f"Нет БД банка: {code}")
+            sizes[code] = shard.vacuum()
+            logger.info("🧹 VACUUM %s: %.1f MB", code, sizes[code] / (1024 * 1024))
+        return sizes
+
+
+# ============ ЕДИНСТВЕННЫЙ ЭКЗЕМПЛЯР ============
+# Создаётся при первом обращении, а не при импорте: CLI скрипты и воркеры не
+# открывают БД заранее, а тесты могут подставить свой менеджер (set_db_manager)
+
+_db_manager = None
+_db_manager_lock = threading.Lock()
+
+
+def get_db_manager() -> DatabaseManager:
+    """Менеджер БД (создаётся при первом вызове по Config.DATABASE_FILE;
+    с DB_SHARD_DIR — раздельные БД по банкам, с DB_BACKEND=postgresql — PostgreSQL)"""
+    global _db_manager
+    if _db_manager is None:
+        with _db_manager_lock:
+            if _db_manager is None:
+                if Config.DB_BACKEND == 'postgresql':
+                    # Раздельные файлы по банкам — только для SQLite
+                    _db_manager = DatabaseManager(backend=create_backend())
+                elif Config.DB_SHARD_DIR:
+                    _db_manager = ShardedDatabaseManager()
+                else:
+                    _db_manager = DatabaseManager()
+    return _db_manager
+
+
+def set_db_manager(manager: Optional[DatabaseManager]) -> Optional[DatabaseManager]:
+    """Подменить менеджер БД; None — снова создавать при первом обращении
+    
+    Возвращает предыдущий менеджер
+    """
+    global _db_manager
+    with _db_manager_lock:
+        previous = _db_manager
+        _db_manager = manager
+    return previous
+
+
+class _LazyDatabaseManager:
+    """Прокси к get_db_manager(): `from database import db_manager` работает
+    как раньше, но БД открывается только при первом обращении"""
+    
+    def __getattr__(self, name):
+        return getattr(get_db_manager(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(get_db_manager(), name, value)
+    
+    def __repr__(self):
+        return f"<lazy {get_db_manager()!r}>" if _db_manager is not None else '<lazy DatabaseManager (не создан)>'
 
 
-# Создаем единственный экземпляр менеджера БД
-db_manager = DatabaseManager()
+db_manager = _LazyDatabaseManager()
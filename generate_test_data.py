@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# generate_test_data.py
+"""
+Генератор синтетических банковских данных для нагрузочного тестирования CRM
+Заполняет схему из DirectAPIToSQLite.create_database (банки, клиенты, счета,
+балансы, транзакции, продукты) детерминированно по seed.
+Суммы и категории повторяют распределения из multibank_real.db,
+вставка идёт пачками через executemany в одной транзакции
+
+Пример (≈ 4 млн транзакций):
+    python3 generate_test_data.py --clients 100000 --accounts 2 --transactions 20
+"""
+
+import argparse
+import bisect
+import itertools
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from base import DirectAPIToSQLite
+from database import (drop_search_triggers, ensure_transaction_search, rebuild_transaction_search,
+                      reclassify_transactions)
+
+
+# Категории: (описание, направление, код, медиана суммы, sigma логнормального разброса, раз в месяц)
+CATEGORY_PROFILES = [
+    ("💼 Зарплата", "Credit", "ReceivedCreditTransfer", 110000, 0.20, 1.0),
+    ("💰 Подработка/Бонус", "Credit", "ReceivedCreditTransfer", 18000, 0.35, 0.7),
+    ("🏠 ЖКХ/Аренда", "Debit", "IssuedDebitTransfer", 22000, 0.20, 1.0),
+    ("🏪 Продукты", "Debit", "IssuedDebitTransfer", 8500, 0.35, 6.0),
+    ("🚌 Транспорт", "Debit", "IssuedDebitTransfer", 3300, 0.30, 4.0),
+    ("🎬 Развлечения/Покупки", "Debit", "IssuedDebitTransfer", 7000, 0.50, 3.0),
+]
+
+# Первые два банка совпадают с реальными, остальные — синтетические
+# (bank_code без дефиса: составной ID клиента разбирается по последнему '-')
+KNOWN_BANKS = [
+    ("abank", "Awesome Bank", "https://abank.open.bankingapi.ru"),
+    ("vbank", "Virtual Bank", "https://vbank.open.bankingapi.ru"),
+]
+
+PRODUCT_TEMPLATES = [
+    ("deposit", "Вклад Надёжный", 8.5, 10000, 5000000, 12),
+    ("deposit", "Накопительный счёт", 7.0, 0, 10000000, None),
+    ("card", "Кредитная карта Кэшбэк", 29.9, 0, 500000, None),
+    ("loan", "Потребительский кредит", 19.5, 50000, 3000000, 60),
+]
+
+CHUNK_SIZE = 50000
+
+
+class SyntheticDataGenerator:
+    """Детерминированная генерация банковских данных в SQLite"""
+
+    def __init__(self, db_file: str, banks: int = 2, clients: int = 1000,
+                 accounts: int = 2, transactions: int = 50, days: int = 365,
+                 banks_per_client: int = 2, seed: int = 42,
+                 end_date: str = '2025-11-01', client_prefix: str = 'synth'):
+        self.db_file = db_file
+        self.banks = self._make_banks(banks)
+        self.clients = clients
+        self.accounts = accounts
+        self.transactions = transactions
+        self.days = days
+        self.banks_per_client = max(1, min(banks_per_client, len(self.banks)))
+        self.seed = seed
+        self.end_date = datetime.strptime(end_date, '%Y-%m-%d')
+        self.client_prefix = client_prefix
+        self.random = random.Random(seed)
+
+        # Веса категорий пропорциональны частоте в месяц
+        self.category_weights = [profile[5] for profile in CATEGORY_PROFILES]
+
+        self.stats = {
+            'banks': 0,
+            'products': 0,
+            'clients': 0,
+            'accounts': 0,
+            'balances': 0,
+            'transactions': 0
+        }
+
+    @staticmethod
+    def _make_banks(count: int) -> List[Tuple[str, str, str]]:
+        banks = list(KNOWN_BANKS[:count])
+        for i in range(len(banks) + 1, count + 1):
+            banks.append((f"bank{i}", f"Synthetic Bank {i}", f"https://bank{i}.example.test"))
+        return banks
+
+    # ==================== ГЕНЕРАЦИЯ СТРОК ====================
+
+    def _amount(self, median: float, sigma: float) -> float:
+        """Логнормальная сумма вокруг медианы"""
+        return round(median * math.exp(self.random.gauss(0, sigma)), 2)
+
+    def _prepare_calendar(self):
+        """
+        Предрасчёт дат истории: strftime на каждую строку слишком дорог
+        self.day_strings — все дни истории, self.weekend_days — индексы выходных,
+        self.month_start_days — индексы 1-7 числа (зарплата, аренда)
+        """
+        days = [self.end_date - timedelta(days=offset) for offset in range(self.days)]
+        self.day_strings = [day.strftime('%Y-%m-%d') for day in days]
+        self.weekend_days = [i for i, day in enumerate(days) if day.weekday() >= 5] or [0]
+        self.month_start_days = [i for i, day in enumerate(days) if day.day <= 7] or [0]
+
+    def _booking_time(self, monthly: bool) -> str:
+        """Дата операции: зарплата и аренда в начале месяца, остальное — чаще в выходные"""
+        rnd = self.random.random
+        if monthly:
+            day = self.month_start_days[int(rnd() * len(self.month_start_days))]
+        elif rnd() < 0.3:
+            day = self.weekend_days[int(rnd() * len(self.weekend_days))]
+        else:
+            day = int(rnd() * self.days)
+
+        # Время суток 08:00-23:00 с микросекундами из одного случайного числа
+        micros = int(rnd() * 54000000000)
+        seconds, micros = divmod(micros, 1000000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{self.day_strings[day]}T{8 + hours:02d}:{minutes:02d}:{seconds:02d}.{micros:06d}Z"
+
+    def _client_rows(self) -> Iterator[Tuple[int, str, str]]:
+        """(номер клиента, client_id, bank_code) для всех пар клиент-банк"""
+        bank_codes = [bank[0] for bank in self.banks]
+        for i in range(1, self.clients + 1):
+            count = self.random.randint(1, self.banks_per_client)
+            for bank_code in self.random.sample(bank_codes, count):
+                yield i, f"{self.client_prefix}-{i}", bank_code
+
+    def generate_rows(self):
+        """
+        Генератор строк по типам: ('clients'|'accounts'|'balances'|'transactions', tuple)
+        Порядок и значения детерминированы seed
+        """
+        self._prepare_calendar()
+        rnd = self.random.random
+        gauss = self.random.gauss
+        exp = math.exp
+
+        total_weight = sum(self.category_weights)
+        cumulative = list(itertools.accumulate(w / total_weight for w in self.category_weights))
+        profiles = [(p[0], p[1], p[2], p[3], p[4], p[5] == 1.0) for p in CATEGORY_PROFILES]
+
+        created_at = self.end_date.strftime('%Y-%m-%d %H:%M:%S')
+        balance_time = self.end_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        account_seq = 0
+        tx_seq = 0
+
+        for number, client_id, bank_code in self._client_rows():
+            yield 'clients', (client_id, bank_code, created_at)
+
+            account_count = self.random.randint(1, max(1, 2 * self.accounts - 1))
+            for _ in range(account_count):
+                account_seq += 1
+                account_id = f"acc-{account_seq}"
+                opening = self.end_date - timedelta(days=self.days + self.random.randrange(1000))
+
+                yield 'accounts', (
+                    account_id, client_id, bank_code, 'Enabled', 'RUB', 'Personal',
+                    self.random.choice(['Checking', 'Savings', 'CurrentAccount']),
+                    'Checking счет', opening.strftime('%Y-%m-%d'), 'RU.CBR.PAN',
+                    f"40817810{account_seq:012d}", f"Клиент {number}", created_at
+                )
+
+                tx_count = self.random.randint(self.transactions // 2, max(1, self.transactions * 3 // 2))
+                balance = self._amount(50000, 1.0)
+
+                for _ in range(tx_count):
+                    tx_seq += 1
+                    info, direction, code, median, sigma, monthly = profiles[
+                        min(bisect.bisect(cumulative, rnd()), len(profiles) - 1)
+                    ]
+                    amount = round(median * exp(gauss(0, sigma)), 2)
+                    booked = self._booking_time(monthly)
+                    balance += amount if direction == 'Credit' else -amount
+
+                    yield 'transactions', (
+                        f"tx-{bank_code}-{tx_seq}", account_id, client_id, bank_code,
+                        amount, 'RUB', direction, 'Booked', booked, booked,
+                        code, info, created_at
+                    )
+
+                for balance_type in ('InterimAvailable', 'InterimBooked'):
+                    yield 'balances', (
+                        account_id, client_id, bank_code, balance_type, round(abs(balance), 2),
+                        'RUB', balance_time, 'Credit' if balance >= 0 else 'Debit', created_at
+                    )
+
+    # ==================== ЗАПИСЬ В БД ====================
+
+    INSERT_SQL = {
+        'clients': '''
+            INSERT OR IGNORE INTO clients (client_id, bank_code, created_at) VALUES (?, ?, ?)
+        ''',
+        'accounts': '''
+            INSERT OR REPLACE INTO accounts
+            (account_id, client_id, bank_code, status, currency,
+             account_type, account_subtype, nickname, opening_date,
+             scheme_name, account_number, account_holder_name, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        'balances': '''
+            INSERT OR REPLACE INTO balances
+            (account_id, client_id, bank_code, balance_type, amount, currency,
+             date_time, credit_debit_indicator, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        'transactions': '''
+            INSERT OR IGNORE INTO transactions
+            (transaction_id, account_id, client_id, bank_code, amount,
+             currency, credit_debit_indicator, status,
+             booking_date_time, value_date_time, transaction_code, transaction_information, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+    }
+
+    def _flush(self, cursor, buffers):
+        for table, rows in buffers.items():
+            if rows:
+                cursor.executemany(self.INSERT_SQL[table], rows)
+                self.stats[table] += len(rows)
+                rows.clear()
+
+    def run(self) -> dict:
+        """Сгенерировать БД"""
+        started = time.monotonic()
+
+        importer = DirectAPIToSQLite(self.db_file)
+        importer.create_database()
+        conn, cursor = importer.conn, importer.cursor
+
+        # Bulk-режим: без журнала и fsync, файл используется только генератором
+        cursor.execute('PRAGMA journal_mode = OFF')
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA cache_size = -262144')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+        # Полнотекстовый индекс строится после загрузки, а не триггером на каждую строку
+        drop_search_triggers(cursor)
+
+        try:
+            cursor.executemany(
+                'INSERT OR REPLACE INTO banks (code, name, url) VALUES (?, ?, ?)',
+                self.banks
+            )
+            self.stats['banks'] = len(self.banks)
+
+            products = [
+                (f"prod-{bank[0]}-{i}", p[0], p[1], '', p[2], p[3], p[4], p[5], bank[0])
+                for bank in self.banks
+                for i, p in enumerate(PRODUCT_TEMPLATES, start=1)
+            ]
+            cursor.executemany('''
+                INSERT OR REPLACE INTO products
+                (product_id, product_type, product_name, description,
+                 interest_rate, min_amount, max_amount, term_months, bank_code)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', products)
+            self.stats['products'] = len(products)
+
+            buffers = {table: [] for table in self.INSERT_SQL}
+            pending = 0
+            next_report = 1000000
+
+            for table, row in self.generate_rows():
+                buffers[table].append(row)
+                pending += 1
+
+                if pending >= CHUNK_SIZE:
+                    self._flush(cursor, buffers)
+                    pending = 0
+
+                    if self.stats['transactions'] >= next_report:
+                        print(f"  ⏳ Транзакций: {self.stats['transactions']:,}")
+                        next_report += 1000000
+
+            self._flush(cursor, buffers)
+
+            # Индекс как в рабочей БД — строится после загрузки, так быстрее
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_client ON transactions(client_id)')
+            # Категории и итоги по месяцам (таймлайн) — одним проходом после загрузки
+            reclassify_transactions(importer.backend, cursor)
+            ensure_transaction_search(importer.backend, cursor)
+            rebuild_transaction_search(cursor)
+            conn.commit()
+        finally:
+            importer.close()
+
+        self.stats['duration_sec'] = round(time.monotonic() - started, 2)
+        return self.stats
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Генератор синтетических банковских данных')
+    parser.add_argument('--output', default='synthetic_multibank.db', help='Файл БД')
+    parser.add_argument('--banks', type=int, default=2, help='Количество банков')
+    parser.add_argument('--clients', type=int, default=1000, help='Количество клиентов')
+    parser.add_argument('--banks-per-client', type=int, default=2, help='Максимум банков у клиента')
+    parser.add_argument('--accounts', type=int, default=2, help='Среднее число счетов клиента в банке')
+    parser.add_argument('--transactions', type=int, default=50, help='Среднее число транзакций на счёт')
+    parser.add_argument('--days', type=int, default=365, help='Глубина истории в днях')
+    parser.add_argument('--end-date', default='2025-11-01', help='Дата последней операции (YYYY-MM-DD)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help='Перезаписать существующий файл')
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        if not args.force:
+            parser.error(f"{args.output} уже существует (используйте --force)")
+        os.remove(args.output)
+
+    generator = SyntheticDataGenerator(
+        db_file=args.output,
+        banks=args.banks,
+        clients=args.clients,
+        accounts=args.accounts,
+        transactions=args.transactions,
+        days=args.days,
+        banks_per_client=args.banks_per_client,
+        seed=args.seed,
+        end_date=args.end_date
+    )
+    stats = generator.run()
+
+    print(f"\n✅ Готово за {stats['duration_sec']} сек: {args.output}")
+    for name in ('banks', 'products', 'clients', 'accounts', 'balances', 'transactions'):
+        print(f"  • {name}: {stats[name]:,}")
+
+
+if __name__ == "__main__":
+    main()
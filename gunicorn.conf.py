@@ -0,0 +1,80 @@
+# gunicorn.conf.py
+"""
+Production-конфигурация gunicorn
+    gunicorn -c gunicorn.conf.py
+
+Нагрузка — в основном ожидание: запросы к LLM (до AI_TIMEOUT секунд) и
+короткие чтения SQLite. Поэтому воркеры gthread: несколько процессов по
+ядрам и потоки внутри каждого, чтобы долгий /api/ai/ask не занимал процесс целиком.
+
+Приложение загружается в мастере до форка (preload_app): db_manager проверяет
+схему и заполняет реестр колонок один раз, воркеры получают готовое состояние.
+Соединения SQLite открываются на каждый запрос, поэтому наследовать после
+форка нечего.
+
+Плавный перезапуск воркеров: kill -HUP <pid мастера> — новые воркеры стартуют,
+старые дорабатывают текущие запросы graceful_timeout секунд. Код загружен
+в мастере, поэтому новая версия подхватывается только с новым мастером:
+kill -USR2 <pid мастера> (старт нового мастера рядом со старым),
+затем kill -TERM <pid старого мастера>.
+"""
+
+import multiprocessing
+import os
+
+from config import Config
+
+wsgi_app = 'app:app'
+
+bind = os.getenv('GUNICORN_BIND', f"{Config.FLASK_HOST}:{Config.FLASK_PORT}")
+
+# Процессы по ядрам, потоки — на ожидание ответа LLM
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Запрос к AI может идти до AI_TIMEOUT секунд — воркер не должен считаться зависшим раньше
+timeout = int(os.getenv('GUNICORN_TIMEOUT', Config.AI_TIMEOUT + 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', Config.AI_TIMEOUT + 10))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Перезапуск воркеров после N запросов (с разбросом, чтобы не одновременно)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+preload_app = True
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """Мастер загрузил приложение: прогреваем реестр схемы до форка воркеров"""
+    from database import db_manager
+
+    tables = db_manager.warm_up()
+    server.log.info("Реестр схемы прогрет: %d таблиц, БД %s", len(tables), db_manager.db_file)
+
+    if not db_manager.ping():
+        server.log.error("БД недоступна: %s", db_manager.db_file)
+
+
+def post_fork(server, worker):
+    server.log.info("Воркер запущен (pid: %s)", worker.pid)
+
+    # Планировщик синхронизации стартует в каждом воркере, но работает только
+    # в одном — взявшем файловую блокировку; остальные ждут её освобождения
+    if Config.SYNC_ENABLED:
+        from sync_scheduler import start_scheduler
+        start_scheduler()
+
+
+def worker_exit(server, worker):
+    if Config.SYNC_ENABLED:
+        from sync_scheduler import stop_scheduler
+        stop_scheduler()
+
+
+def worker_int(worker):
+    worker.log.info("Воркер прерван (pid: %s)", worker.pid)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# mock_bank_server.py
+"""
+Локальная заглушка Open Banking API для воспроизводимых замеров импорта
+Эндпоинты: /auth/bank-token, /products, /account-consents/request,
+/accounts, /accounts/{id}/balances, /accounts/{id}/transactions
+Настраиваются задержка, размер страницы, объём данных и инъекция 429/5xx.
+Данные детерминированы seed и не зависят от порядка запросов
+
+Запуск: python3 mock_bank_server.py --port 8090 --accounts 2 --transactions 300
+Импорт: в DirectAPIToSQLite.banks указать url http://127.0.0.1:8090
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from generate_test_data import CATEGORY_PROFILES
+
+
+class MockBankSettings:
+    """Параметры поведения заглушки банка"""
+
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 5,
+                 page_size: int = 100, accounts_per_client: int = 2,
+                 transactions_per_account: int = 100, rate_limit_rate: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.page_size = page_size                            # максимум транзакций на странице
+        self.accounts_per_client = accounts_per_client
+        self.transactions_per_account = transactions_per_account
+        self.rate_limit_rate = rate_limit_rate                # доля ответов 429
+        self.error_rate = error_rate                          # доля ответов 5xx
+        self.error_status = error_status
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        # Счётчики запросов по эндпоинтам (для отчёта бенчмарка)
+        self.requests = {}
+
+    def roll(self, rate: float) -> bool:
+        """Случайное событие с заданной вероятностью"""
+        with self.lock:
+            return self.random.random() < rate
+
+    def delay(self) -> float:
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+
+class MockBankData:
+    """Детерминированные данные банка: одинаковы для любого порядка запросов"""
+
+    def __init__(self, settings: MockBankSettings, bank_code: str = 'mock'):
+        self.settings = settings
+        self.bank_code = bank_code
+        self.end_date = datetime(2025, 11, 1)
+        self.transactions = lru_cache(maxsize=4096)(self._transactions)
+
+    def _rng(self, key: str) -> random.Random:
+        return random.Random(f"{self.settings.seed}:{self.bank_code}:{key}")
+
+    def products(self) -> list:
+        return [
+            {'productId': f'prod-{self.bank_code}-{i}', 'productType': kind, 'productName': name,
+             'description': '', 'interestRate': rate, 'minAmount': 0, 'maxAmount': 1000000,
+             'termMonths': 12}
+            for i, (kind, name, rate) in enumerate([
+                ('deposit', 'Вклад Базовый', 8.0),
+                ('card', 'Дебетовая карта', 0.0),
+                ('loan', 'Кредит наличными', 19.9),
+            ], start=1)
+        ]
+
+    def accounts(self, client_id: str) -> list:
+        accounts = []
+        for n in range(1, self.settings.accounts_per_client + 1):
+            account_id = f"acc-{client_id}-{n}"
+            accounts.append({
+                'accountId': account_id,
+                'status': 'Enabled',
+                'currency': 'RUB',
+                'accountType': 'Personal',
+                'accountSubType': 'Checking',
+                'nickname': 'Checking счет',
+                'openingDate': '2024-10-30',
+                'account': [{
+                    'schemeName': 'RU.CBR.PAN',
+                    'identification': f"40817810{zlib.crc32(account_id.encode()) % 10**12:012d}",
+                    'name': f"Клиент {client_id}"
+                }]
+            })
+        return accounts
+
+    def _transactions(self, account_id: str) -> list:
+        rng = self._rng(account_id)
+        weights = [profile[5] for profile in CATEGORY_PROFILES]
+        transactions = []
+
+        for i in range(self.settings.transactions_per_account):
+            info, direction, code, median, sigma, _ = rng.choices(CATEGORY_PROFILES, weights=weights)[0]
+            booked = (self.end_date - timedelta(seconds=rng.randrange(365 * 86400))).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            transactions.append({
+                'transactionId': f"tx-{account_id}-{i}",
+                'accountId': account_id,
+                'amount': {'amount': f"{median * rng.lognormvariate(0, sigma):.2f}", 'currency': 'RUB'},
+                'creditDebitIndicator': direction,
+                'status': 'Booked',
+                'bookingDateTime': booked,
+                'valueDateTime': booked,
+                'transactionInformation': info,
+                'bankTransactionCode': {'code': code}
+            })
+
+        transactions.sort(key=lambda tx: tx['bookingDateTime'], reverse=True)
+        return transactions
+
+    def balances(self, account_id: str) -> list:
+        total = sum(
+            float(tx['amount']['amount']) * (1 if tx['creditDebitIndicator'] == 'Credit' else -1)
+            for tx in self.transactions(account_id)
+        )
+        return [
+            {'accountId': account_id, 'type': balance_type,
+             'amount': {'amount': f"{abs(total):.2f}", 'currency': 'RUB'},
+             'creditDebitIndicator': 'Credit' if total >= 0 else 'Debit',
+             'dateTime': self.end_date.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+            for balance_type in ('InterimAvailable', 'InterimBooked')
+        ]
+
+
+class MockBankHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов Open Banking API"""
+
+    settings: MockBankSettings = None
+    data: MockBankData = None
+    protocol_version = 'HTTP/1.1'
+
+    ACCOUNT_PATH = re.compile(r'^/accounts/([^/]+)/(balances|transactions)$')
+
+    def log_message(self, format, *args):
+        """Без логирования каждого запроса в stderr"""
+        pass
+
+    def _send_json(self, status: int, data, headers: dict = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_failure(self) -> bool:
+        """Инъекция 429/5xx; True — ответ с ошибкой уже отправлен"""
+        if self.settings.roll(self.settings.rate_limit_rate):
+            self._send_json(429, {'error': 'Too Many Requests'}, {'Retry-After': '1'})
+            return True
+        if self.settings.roll(self.settings.error_rate):
+            self._send_json(self.settings.error_status, {'error': 'Injected server error'})
+            return True
+        return False
+
+    def _handle(self, method: str):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = url.path.rstrip('/') or '/'
+
+        # Тело запроса нужно вычитать даже если оно не используется (keep-alive)
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+
+        if path == '/__stats':
+            # Служебный эндпоинт: счётчики запросов (без задержек и ошибок)
+            self._send_json(200, {'requests': self.settings.requests})
+            return
+
+        match = self.ACCOUNT_PATH.match(path)
+        endpoint = f"/accounts/{{id}}/{match.group(2)}" if match else path
+        self.settings.count(endpoint)
+
+        time.sleep(self.settings.delay())
+        if self._inject_failure():
+            return
+
+        if method == 'POST' and path == '/auth/bank-token':
+            self._send_json(200, {'access_token': uuid.uuid4().hex, 'token_type': 'bearer', 'expires_in': 86400})
+        elif method == 'GET' and path == '/products':
+            self._send_json(200, {'data': {'product': self.data.products()}})
+        elif method == 'POST' and path == '/account-consents/request':
+            self._send_json(200, {'consent_id': f"consent-{uuid.uuid4().hex[:12]}", 'status': 'approved'})
+        elif method == 'GET' and path == '/accounts':
+            client_id = query.get('client_id', [''])[0]
+            self._send_json(200, {'data': {'account': self.data.accounts(client_id)}})
+        elif method == 'GET' and match and match.group(2) == 'balances':
+            self._send_json(200, {'data': {'balance': self.data.balances(match.group(1))}})
+        elif method == 'GET' and match:
+            self._send_transactions_page(match.group(1), query)
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def _send_transactions_page(self, account_id: str, query: dict):
+        transactions = self.data.transactions(account_id)
+        # Инкрементальная загрузка: только транзакции не раньше from_booking_date_time
+        since = query.get('from_booking_date_time', [None])[0]
+        if since:
+            transactions = [tx for tx in transactions if tx['bookingDateTime'][:19] >= since[:19]]
+        limit = min(int(query.get('limit', [self.settings.page_size])[0]), self.settings.page_size)
+        page = max(1, int(query.get('page', ['1'])[0]))
+        total_pages = max(1, -(-len(transactions) // limit))
+
+        response = {
+            'data': {'transaction': transactions[(page - 1) * limit:page * limit]},
+            'links': {'self': f"/accounts/{account_id}/transactions?page={page}&limit={limit}"},
+            'meta': {'totalPages': total_pages, 'totalRecords': len(transactions)}
+        }
+        if page < total_pages:
+            response['links']['next'] = f"/accounts/{account_id}/transactions?page={page + 1}&limit={limit}"
+
+        self._send_json(200, response)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class MockBankServer:
+    """Заглушка банка в фоновом потоке (для использования из бенчмарков)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 settings: MockBankSettings = None, bank_code: str = 'mock'):
+        self.settings = settings or MockBankSettings()
+        handler = type('ConfiguredMockBankHandler', (MockBankHandler,), {
+            'settings': self.settings,
+            'data': MockBankData(self.settings, bank_code)
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockBankServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Локальная заглушка Open Banking API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--bank-code', default='mock', help='Код банка (влияет на данные)')
+    parser.add_argument('--latency', type=float, default=20, help='Задержка ответа, мс')
+    parser.add_argument('--jitter', type=float, default=5, help='Разброс задержки, мс')
+    parser.add_argument('--page-size', type=int, default=100, help='Максимум транзакций на странице')
+    parser.add_argument('--accounts', type=int, default=2, help='Счетов на клиента')
+    parser.add_argument('--transactions', type=int, default=100, help='Транзакций на счёт')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Доля ответов 429 (0..1)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 5xx (0..1)')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    settings = MockBankSettings(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        page_size=args.page_size,
+        accounts_per_client=args.accounts,
+        transactions_per_account=args.transactions,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed
+    )
+    server = MockBankServer(args.host, args.port, settings, args.bank_code)
+
+    print(f"🏦 Mock Open Banking сервер: {server.url} ({args.bank_code})")
+    print(f"  📦 {args.accounts} счёта на клиента, {args.transactions} транзакций на счёт, страница {args.page_size}")
+    print(f"  💥 429: {args.rate_limit_rate:.0%}, {args.error_status}: {args.error_rate:.0%}")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Остановка")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# mock_llm_server.py
+"""
+Локальная заглушка OpenAI-совместимого API (/v1/chat/completions)
+Нужна для нагрузочного тестирования /api/ai/ask без обращения к OpenRouter:
+настраиваемая задержка, скорость генерации токенов, стриминг (SSE)
+и инъекция ошибок
+
+Запуск: python3 mock_llm_server.py --port 8085 --latency 300 --tokens-per-sec 200
+Затем в .env: AI_API_URL=http://127.0.0.1:8085/v1/chat/completions
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockLLMSettings:
+    """Параметры поведения заглушки"""
+
+    def __init__(self, latency_ms: float = 300, jitter_ms: float = 50,
+                 tokens_per_sec: float = 0, completion_tokens: int = 200,
+                 error_rate: float = 0.0, error_status: int = 500,
+                 timeout_rate: float = 0.0, seed: int = None):
+        self.latency_ms = latency_ms                # задержка до первого токена
+        self.jitter_ms = jitter_ms                  # разброс задержки (±)
+        self.tokens_per_sec = tokens_per_sec        # 0 — ответ целиком сразу
+        self.completion_tokens = completion_tokens  # длина ответа в "токенах"
+        self.error_rate = error_rate                # доля ответов с ошибкой
+        self.error_status = error_status            # HTTP статус ошибки (429, 500, 503...)
+        self.timeout_rate = timeout_rate            # доля "зависших" запросов
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self, rate: float) -> bool:
+        """Случайное событие с заданной вероятностью"""
+        with self.lock:
+            return self.random.random() < rate
+
+    def first_token_delay(self) -> float:
+        """Задержка до первого токена в секундах"""
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+
+# Текст, из которого собирается ответ заглушки
+FILLER_WORDS = (
+    "Клиент стабильно получает доход и регулярно оплачивает основные расходы. "
+    "Рекомендуется предложить накопительный счёт и кредитную карту с кэшбэком. "
+).split()
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов OpenAI-совместимого API"""
+
+    settings: MockLLMSettings = MockLLMSettings()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        """Без логирования каждого запроса в stderr"""
+        pass
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Список моделей и проверка работоспособности"""
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock-model', 'object': 'model'}]})
+        elif self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        """Эмуляция /v1/chat/completions"""
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON'}})
+            return
+
+        settings = self.settings
+
+        if settings.roll(settings.timeout_rate):
+            # Имитируем зависший апстрим: клиент должен отвалиться по таймауту
+            time.sleep(3600)
+            return
+
+        time.sleep(settings.first_token_delay())
+
+        if settings.roll(settings.error_rate):
+            self._send_json(settings.error_status, {
+                'error': {'message': f'Injected error {settings.error_status}', 'code': settings.error_status}
+            })
+            return
+
+        model = payload.get('model', 'mock-model')
+        max_tokens = payload.get('max_tokens') or settings.completion_tokens
+        tokens = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(min(max_tokens, settings.completion_tokens))]
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in payload.get('messages', []))
+
+        if payload.get('stream'):
+            self._stream(model, tokens)
+        else:
+            if settings.tokens_per_sec > 0:
+                time.sleep(len(tokens) / settings.tokens_per_sec)
+            self._send_json(200, {
+                'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ' '.join(tokens)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': len(tokens),
+                    'total_tokens': prompt_tokens + len(tokens)
+                }
+            })
+
+    def _stream(self, model: str, tokens: list):
+        """Ответ в формате Server-Sent Events, токен за токеном"""
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        delay = 1 / self.settings.tokens_per_sec if self.settings.tokens_per_sec > 0 else 0
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        def send_chunk(delta: dict, finish_reason=None):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            send_chunk({'role': 'assistant'})
+            for i, token in enumerate(tokens):
+                send_chunk({'content': token if i == 0 else ' ' + token})
+                if delay:
+                    time.sleep(delay)
+            send_chunk({}, finish_reason='stop')
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+class MockLLMServer:
+    """Заглушка LLM в фоновом потоке (для использования из бенчмарков)"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, settings: MockLLMSettings = None):
+        handler = type('ConfiguredMockLLMHandler', (MockLLMHandler,), {
+            'settings': settings or MockLLMSettings()
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """URL эндпоинта chat completions"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self) -> 'MockLLMServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Локальная заглушка OpenAI-совместимого API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--latency', type=float, default=300, help='Задержка до первого токена, мс')
+    parser.add_argument('--jitter', type=float, default=50, help='Разброс задержки, мс')
+    parser.add_argument('--tokens-per-sec', type=float, default=0, help='Скорость генерации (0 — мгновенно)')
+    parser.add_argument('--completion-tokens', type=int, default=200, help='Длина ответа в токенах')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов с ошибкой (0..1)')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP статус инъецируемой ошибки')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Доля зависших запросов (0..1)')
+    parser.add_argument('--seed', type=int, help='Seed для воспроизводимости')
+    args = parser.parse_args()
+
+    settings = MockLLMSettings(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed
+    )
+    server = MockLLMServer(args.host, args.port, settings)
+
+    print(f"🤖 Mock LLM сервер: {server.url}")
+    print(f"  ⏱ Задержка: {args.latency}±{args.jitter} мс, {args.tokens_per_sec or '∞'} токенов/сек")
+    print(f"  💥 Ошибки: {args.error_rate:.0%} (HTTP {args.error_status}), зависания: {args.timeout_rate:.0%}")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Остановка")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,98 @@
 РАЗДЕЛЕНИЕ ПО БАНКАМ: каждая комбинация client_id + bank_code = отдельный клиент
 """
 
-from typing import List, Optional, Dict
+import re
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime, timedelta
-from database import db_manager
+from database import (db_manager, ALL_SHARDS, SHARDED_TABLES, ROLLUP_UPSERT, SEARCH_TABLE, SEARCH_VECTOR,
+                      CONVERSATION_SEARCH_TABLE, CONVERSATION_SEARCH_VECTOR, DATA_VERSION_BUMP)
 from config import Config
+from app_logging import get_logger
+from anomalies import ANOMALY_KINDS
+
+logger = get_logger('repositories')
+
+
+def _split_client_id(client_id) -> Tuple[Optional[str], Optional[str]]:
+    """Разобрать составной ID клиента банка client_id-bank_code
+    
+    Возвращает (client_id, bank_code); без банка в ID — (client_id, None).
+    Банк — часть после последнего '-': сам client_id может содержать '-'
+    """
+    if client_id and '-' in str(client_id):
+        client_id_part, bank_code = str(client_id).rsplit('-', 1)
+        return client_id_part, bank_code
+    return client_id, None
+
+
+def _bank_shard(bank_code: Optional[str]) -> str:
+    """БД банка клиента (в раздельном режиме); без банка — все БД"""
+    return bank_code or ALL_SHARDS
+
+
+def _update_and_bump(query: str, params: tuple = ()) -> int:
+    """execute_update и сдвиг версии данных (DataVersionRepository) одной транзакцией"""
+    with db_manager.get_connection() as conn:
+        cursor = db_manager.backend.cursor(conn)
+        result = db_manager.backend.execute_update(cursor, query, params)
+        cursor.execute(DATA_VERSION_BUMP)
+    return result
+
+
+# Слова поискового запроса (TransactionRepository.search): синтаксис FTS5
+# и tsquery из ввода пользователя не передаётся, кроме * на конце слова
+SEARCH_WORDS = re.compile(r'(\w+)(\*?)')
+# Сколько последних совпадений ранжируется при поиске по всей базе
+SEARCH_WINDOW = 1000
+
+
+def _search_words(text: str) -> list:
+    """Слова поискового запроса [(слово, '*' или '')]"""
+    words = SEARCH_WORDS.findall(text or '')
+    if not words:
+        raise ValueError("Пустой поисковый запрос")
+    return words
+
+
+def _fts5_query(words: list) -> str:
+    """Запрос FTS5: все слова, слово со * — по началу"""
+    return ' '.join(f'"{word}"' + prefix for word, prefix in words)
+
+
+def _tsquery(words: list) -> str:
+    """То же для to_tsquery в PostgreSQL"""
+    return ' & '.join(word + (':*' if prefix else '') for word, prefix in words)
+
+
+def _parse_date(value: str, name: str) -> datetime:
+    """Дата ГГГГ-ММ-ДД из параметра запроса; ValueError — неверный формат"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"{name}: ожидается ГГГГ-ММ-ДД")
+
+
+def _parse_month(value: str, name: str) -> str:
+    """Месяц ГГГГ-ММ из параметра запроса; ValueError — неверный формат"""
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise ValueError(f"{name}: ожидается ГГГГ-ММ")
+
+
+# Период таймлайна по месяцу ГГГГ-ММ (TransactionRepository.get_timeline)
+TIMELINE_PERIODS = {
+    'month': lambda month: month,
+    'quarter': lambda month: f"{month[:4]}-Q{(int(month[5:7]) - 1) // 3 + 1}",
+    'year': lambda month: month[:4],
+}
+
+
+def _merge_page(rows: List[Dict], key, offset: int, limit: Optional[int], reverse: bool = False) -> List[Dict]:
+    """Страница из строк нескольких БД банков: каждая БД отдала первые
+    offset + limit строк, общий порядок восстанавливается здесь"""
+    rows = sorted(rows, key=key, reverse=reverse)
+    return rows[offset:offset + limit] if limit else rows[offset:]
 
 
 class ClientRepository:
@@ -18,18 +106,19 @@ class ClientRepository:
     def _detect_structure():
         """Определить структуру таблицы clients"""
         try:
-            columns = [row['name'] for row in db_manager.execute_query("PRAGMA table_info(clients)")]
+            columns = db_manager.get_columns('clients')
             result = 'banking' if 'bank_code' in columns else 'crm'
             return result
         except Exception as e:
-            print(f"❌ Ошибка _detect_structure: {e}")
+            logger.error("❌ Ошибка _detect_structure: %s", e)
             return 'crm'
     
     @staticmethod
-    def _assign_mock_contacts(clients: List[Dict]) -> List[Dict]:
+    def _assign_mock_contacts(clients: List[Dict], start: int = 0) -> List[Dict]:
         """
         Присваивает рандомные email и phone из .env клиентам
         Если клиентов больше чем контактов - циклически повторяет контакты
+        start - позиция первого клиента в общем списке (для постраничной выдачи)
         """
         mock_contacts = Config.get_mock_contacts()
         
@@ -48,7 +137,7 @@ class ClientRepository:
             
             if not has_email or not has_phone:
                 # Циклически выбираем контакт (если клиентов больше - повторяем)
-                contact_idx = idx % len(mock_contacts)
+                contact_idx = (start + idx) % len(mock_contacts)
                 email, phone = mock_contacts[contact_idx]
                 
                 if not has_email:
@@ -61,10 +150,17 @@ class ClientRepository:
         return clients_with_contacts
     
     @staticmethod
-    def get_all(status: Optional[str] = None) -> List[Dict]:
-        """Получить всех клиентов"""
+    def get_all(status: Optional[str] = None, limit: Optional[int] = None,
+                offset: int = 0) -> List[Dict]:
+        """Получить всех клиентов (limit/offset - постраничная выдача)"""
         structure = ClientRepository._detect_structure()
         
+        page_sql = ''
+        page_params = ()
+        if limit:
+            page_sql = ' LIMIT ? OFFSET ?'
+            page_params = (int(limit), int(offset))
+        
         if structure == 'banking':
             # РАЗДЕЛЕНИЕ: каждая комбинация client_id + bank_code = отдельный клиент
             query = '''
@@ -74,18 +170,29 @@ class ClientRepository:
                     c.client_id as client_id_original,
                     c.bank_code as bank_code,
                     'active' as status,
-                    c.created_at as created_at,
-                    c.created_at as updated_at,
+                    MIN(c.created_at) as created_at,
+                    MIN(c.created_at) as updated_at,
                     NULL as email,
                     NULL as phone
                 FROM clients c
                 GROUP BY c.client_id, c.bank_code
                 ORDER BY c.bank_code, c.client_id
             '''
-            clients = db_manager.execute_query(query)
+            if db_manager.sharded:
+                # Каждая БД банка отдаёт первые offset + limit, страница собирается здесь
+                if limit:
+                    query += ' LIMIT ?'
+                    page_params = (int(limit) + int(offset),)
+                clients = _merge_page(
+                    db_manager.execute_query(query, page_params, shard=ALL_SHARDS),
+                    lambda c: (c['bank_code'], c['client_id_original']),
+                    int(offset) if limit else 0, limit
+                )
+            else:
+                clients = db_manager.execute_query(query + page_sql, page_params)
             
             # Добавляем мок-контакты
-            clients = ClientRepository._assign_mock_contacts(clients)
+            clients = ClientRepository._assign_mock_contacts(clients, start=int(offset) if limit else 0)
             
             return clients
             
@@ -97,15 +204,15 @@ class ClientRepository:
                     FROM clients 
                     WHERE status = ?
                     ORDER BY id DESC
-                '''
-                return db_manager.execute_query(query, (status,))
+                ''' + page_sql
+                return db_manager.execute_query(query, (status,) + page_params)
             else:
                 query = '''
                     SELECT id, name, email, phone, status, created_at, updated_at
                     FROM clients 
                     ORDER BY id DESC
-                '''
-                return db_manager.execute_query(query)
+                ''' + page_sql
+                return db_manager.execute_query(query, page_params)
     
     @staticmethod
     def get_by_id(client_id: str) -> Optional[Dict]:
@@ -113,17 +220,7 @@ class ClientRepository:
         structure = ClientRepository._detect_structure()
         
         if structure == 'banking':
-            # Разбираем составной ID: client_id-bank_code
-            if '-' in str(client_id):
-                parts = str(client_id).rsplit('-', 1)
-                if len(parts) == 2:
-                    client_id_part, bank_code = parts
-                else:
-                    client_id_part = client_id
-                    bank_code = None
-            else:
-                client_id_part = client_id
-                bank_code = None
+            client_id_part, bank_code = _split_client_id(client_id)
             
             if bank_code:
                 query = '''
@@ -141,7 +238,7 @@ class ClientRepository:
                     WHERE c.client_id = ? AND c.bank_code = ?
                     LIMIT 1
                 '''
-                results = db_manager.execute_query(query, (client_id_part, bank_code))
+                results = db_manager.execute_query(query, (client_id_part, bank_code), shard=bank_code)
             else:
                 query = '''
                     SELECT 
@@ -156,9 +253,11 @@ class ClientRepository:
                         NULL as phone
                     FROM clients c
                     WHERE c.client_id = ?
+                    ORDER BY c.bank_code
                     LIMIT 1
                 '''
-                results = db_manager.execute_query(query, (client_id_part,))
+                results = db_manager.execute_query(query, (client_id_part,), shard=ALL_SHARDS)
+                results = sorted(results, key=lambda c: c['bank_code'])[:1]
             
             # Добавляем мок-контакты для одного клиента
             if results:
@@ -192,7 +291,7 @@ class ClientRepository:
             # Генерируем простой UUID-подобный id
             import uuid
             new_id = str(uuid.uuid4())[:8]
-            db_manager.execute_update(query, (new_id, 'MANUAL'))
+            db_manager.execute_update(query, (new_id, 'MANUAL'), shard='MANUAL')
             
             # Возвращаем составной id в формате, который понимает фронтенд
             return f"{new_id}-MANUAL"
@@ -245,7 +344,7 @@ class ClientRepository:
             SET {', '.join(updates)}
             WHERE id = ?
         '''
-        return db_manager.execute_update(query, tuple(params))
+        return _update_and_bump(query, tuple(params))
     
     @staticmethod
     def delete(client_id: int) -> int:
@@ -256,7 +355,7 @@ class ClientRepository:
             return 0
         
         query = 'DELETE FROM clients WHERE id = ?'
-        return db_manager.execute_update(query, (client_id,))
+        return _update_and_bump(query, (client_id,))
     
     @staticmethod
     def get_count(status: Optional[str] = None) -> int:
@@ -266,8 +365,8 @@ class ClientRepository:
         if structure == 'banking':
             # Считаем уникальные комбинации client_id + bank_code
             query = 'SELECT COUNT(*) as count FROM (SELECT DISTINCT client_id, bank_code FROM clients)'
-            result = db_manager.execute_query(query)
-            return result[0]['count'] if result else 0
+            result = db_manager.execute_query(query, shard=ALL_SHARDS)
+            return sum(row['count'] for row in result)
         else:
             if status:
                 query = 'SELECT COUNT(*) as count FROM clients WHERE status = ?'
@@ -279,6 +378,60 @@ class ClientRepository:
             return result[0]['count'] if result else 0
 
 
+class CustomerRepository:
+    """Клиент целиком по всем банкам (банковская БД)
+    
+    ClientRepository считает клиентом пару client_id + bank_code; здесь один
+    client_id объединяет его записи во всех банках
+    """
+    
+    @staticmethod
+    def get_by_id(client_id: str) -> Optional[Dict]:
+        """Сводка клиента по банкам и итог одним сгруппированным запросом
+        
+        Итоги берутся из transaction_rollups: и clients, и итоги месяцев
+        ищутся по индексу с client_id в начале, без условия на банк.
+        В раздельном режиме каждая БД банка отдаёт свою строку
+        """
+        query = '''
+            SELECT 
+                c.client_id || '-' || c.bank_code as id,
+                c.bank_code as bank_code,
+                MIN(c.created_at) as created_at,
+                COALESCE(SUM(CASE WHEN r.direction = 'income' THEN r.total ELSE 0 END), 0) as total_income,
+                COALESCE(SUM(CASE WHEN r.direction = 'expense' THEN r.total ELSE 0 END), 0) as total_expense,
+                COALESCE(SUM(r.transaction_count), 0) as transaction_count,
+                MIN(r.month) as first_month,
+                MAX(r.month) as last_month
+            FROM clients c
+            LEFT JOIN transaction_rollups r ON r.client_id = c.client_id AND r.bank_code = c.bank_code
+            WHERE c.client_id = ?
+            GROUP BY c.client_id, c.bank_code
+        '''
+        banks = sorted(
+            db_manager.execute_query(query, (str(client_id),), shard=ALL_SHARDS),
+            key=lambda row: row['bank_code']
+        )
+        if not banks:
+            return None
+        
+        for bank in banks:
+            bank['balance'] = bank['total_income'] - bank['total_expense']
+        
+        totals = {
+            key: sum(bank[key] for bank in banks)
+            for key in ('total_income', 'total_expense', 'balance', 'transaction_count')
+        }
+        months = [month for bank in banks for month in (bank['first_month'], bank['last_month']) if month]
+        return {
+            'client_id': str(client_id),
+            'banks': banks,
+            'totals': dict(totals, bank_count=len(banks)),
+            'first_month': min(months) if months else None,
+            'last_month': max(months) if months else None
+        }
+
+
 class TransactionRepository:
     """Репозиторий для работы с транзакциями"""
     
@@ -286,19 +439,18 @@ class TransactionRepository:
     def _detect_structure():
         """Определить структуру таблицы transactions"""
         try:
-            columns = [row['name'] for row in db_manager.execute_query("PRAGMA table_info(transactions)")]
+            columns = db_manager.get_columns('transactions')
             result = 'banking' if ('credit_debit_indicator' in columns or 'transaction_id' in columns) else 'crm'
             return result
         except:
             return 'crm'
     
     @staticmethod
-    def get_by_client(client_id: str, limit: Optional[int] = None) -> List[Dict]:
+    def get_by_client(client_id: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
         """Получить транзакции клиента (с учетом банка)"""
         try:
             # Получаем колонки
-            all_columns = db_manager.execute_query("PRAGMA table_info(transactions)")
-            column_names = [col['name'] for col in all_columns]
+            column_names = db_manager.get_columns('transactions')
             
             # Определяем колонку даты
             if 'booking_date_time' in column_names:
@@ -310,17 +462,7 @@ class TransactionRepository:
             else:
                 date_col = 'id'
             
-            # Разбираем составной ID (client_id-bank_code)
-            if '-' in str(client_id):
-                parts = str(client_id).rsplit('-', 1)
-                if len(parts) == 2:
-                    client_id_part, bank_code = parts
-                else:
-                    client_id_part = client_id
-                    bank_code = None
-            else:
-                client_id_part = client_id
-                bank_code = None
+            client_id_part, bank_code = _split_client_id(client_id)
             
             # Если есть банковские колонки
             if 'transaction_id' in column_names and 'client_id' in column_names:
@@ -332,7 +474,7 @@ class TransactionRepository:
                             t.client_id as client_id,
                             t.bank_code,
                             t.amount,
-                            COALESCE(t.transaction_information, 'Без категории') as category,
+                            COALESCE(t.category, 'Без категории') as category,
                             t.credit_debit_indicator as direction,
                             COALESCE(t.transaction_information, '') as description,
                             DATE(t.{date_col}) as transaction_date,
@@ -350,7 +492,7 @@ class TransactionRepository:
                             t.client_id as client_id,
                             t.bank_code,
                             t.amount,
-                            COALESCE(t.transaction_information, 'Без категории') as category,
+                            COALESCE(t.category, 'Без категории') as category,
                             t.credit_debit_indicator as direction,
                             COALESCE(t.transaction_information, '') as description,
                             DATE(t.{date_col}) as transaction_date,
@@ -360,6 +502,14 @@ class TransactionRepository:
                         ORDER BY t.{date_col} DESC
                     '''
                     params = (client_id_part,)
+                
+                if db_manager.sharded and not bank_code:
+                    # Все БД банков: каждая отдаёт первые offset + limit
+                    if limit:
+                        query += f' LIMIT {int(limit) + int(offset)}'
+                    rows = db_manager.execute_query(query, params, shard=ALL_SHARDS)
+                    return _merge_page(rows, lambda t: t['transaction_date'] or '', int(offset) if limit else 0,
+                                       limit, reverse=True)
             else:
                 # CRM структура
                 query = '''
@@ -372,17 +522,177 @@ class TransactionRepository:
                 params = (str(client_id),)
             
             if limit:
-                query += f' LIMIT {limit}'
+                query += f' LIMIT {int(limit)} OFFSET {int(offset)}'
             
-            result = db_manager.execute_query(query, params)
+            result = db_manager.execute_query(query, params, shard=_bank_shard(bank_code))
             return result
             
         except Exception as e:
-            print(f"❌ Ошибка get_by_client: {e}")
+            logger.error("❌ Ошибка get_by_client: %s", e)
             import traceback
             traceback.print_exc()
             return []
     
+    @staticmethod
+    def search(text: str, client_id: Optional[str] = None, bank_code: Optional[str] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Полнотекстовый поиск транзакций по описанию и коду операции
+        
+        Слова запроса ищутся целиком, все одновременно; слово со * на конце —
+        по началу слова. По всей базе результаты упорядочены по релевантности
+        среди SEARCH_WINDOW последних совпадений, по клиенту — все совпадения
+        по дате. client_id — как в get_by_client (составной ID задаёт и банк),
+        date_from/date_to — ГГГГ-ММ-ДД включительно
+        """
+        words = _search_words(text)
+        
+        date_to_next = None
+        if date_from:
+            date_from = _parse_date(date_from, 'from').strftime('%Y-%m-%d')
+        if date_to:
+            date_to_next = (_parse_date(date_to, 'to') + timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        limit, offset = int(limit), int(offset)
+        structure = TransactionRepository._detect_structure()
+        
+        # Составной ID задаёт и банк
+        client_id_part, client_bank = _split_client_id(client_id)
+        bank_code = client_bank or bank_code
+        
+        if structure != 'banking':
+            # CRM: таблица небольшая, поиск по описанию и категории
+            conditions = []
+            params = []
+            casefold = db_manager.backend.casefold
+            for word, _ in words:
+                conditions.append(f"({casefold}(description) LIKE ? OR {casefold}(category) LIKE ?)")
+                params += [f"%{word.casefold()}%"] * 2
+            if client_id:
+                conditions.append('client_id = ?')
+                params.append(str(client_id))
+            if date_from:
+                conditions.append('transaction_date >= ?')
+                params.append(date_from)
+            if date_to_next:
+                conditions.append('transaction_date < ?')
+                params.append(date_to_next)
+            query = f'''
+                SELECT id, client_id, amount, category, direction,
+                       description, transaction_date, created_at
+                FROM transactions
+                WHERE {' AND '.join(conditions)}
+                ORDER BY transaction_date DESC, id DESC
+                LIMIT ? OFFSET ?
+            '''
+            return db_manager.execute_query(query, tuple(params) + (limit, offset))
+        
+        conditions = []
+        params = []
+        if client_id:
+            conditions.append('t.client_id = ?')
+            params.append(client_id_part)
+        if bank_code:
+            conditions.append('t.bank_code = ?')
+            params.append(bank_code)
+        if date_from:
+            conditions.append('t.booking_date_time >= ?')
+            params.append(date_from)
+        if date_to_next:
+            conditions.append('t.booking_date_time < ?')
+            params.append(date_to_next)
+        
+        columns = '''
+            t.transaction_id as id,
+            t.client_id as client_id,
+            t.bank_code,
+            t.amount,
+            COALESCE(t.category, 'Без категории') as category,
+            t.credit_debit_indicator as direction,
+            COALESCE(t.transaction_information, '') as description,
+            DATE(t.booking_date_time) as transaction_date,
+            t.created_at as created_at
+        '''
+        # По клиенту строк немного: берём их по индексу клиента и проверяем
+        # совпадение, без ранжирования
+        ranked = not client_id
+        
+        if db_manager.backend.name == 'postgresql':
+            # tsvector + GIN индекс (ensure_transaction_search); rank — чем меньше, тем выше
+            tsquery = _tsquery(words)
+            match = f"{SEARCH_VECTOR} @@ to_tsquery('simple', ?)"
+            rank = f"-ts_rank({SEARCH_VECTOR}, to_tsquery('simple', ?))"
+            source = 'transactions t'
+            newest = 't.id'
+            match_params = [tsquery]
+            rank_params = [tsquery]
+        elif db_manager.get_columns(SEARCH_TABLE):
+            # FTS5: bm25 (rank) отрицательный, лучшие совпадения — первыми.
+            # rank считается по всему списку совпадений слова, поэтому по клиенту
+            # совпадение проверяется построчно (rowid = t.id), без rank
+            fts_query = _fts5_query(words)
+            if not ranked and any(prefix for _, prefix in words):
+                # Совпадения по началу слова собираются целиком — один раз на запрос
+                match = f"t.id IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ?)"
+                source = 'transactions t'
+            elif not ranked:
+                match = f"EXISTS (SELECT 1 FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ? AND rowid = t.id)"
+                source = 'transactions t'
+            else:
+                match = f'{SEARCH_TABLE} MATCH ?'
+                source = f'{SEARCH_TABLE} CROSS JOIN transactions t ON t.id = {SEARCH_TABLE}.rowid'
+            rank = f'{SEARCH_TABLE}.rank'
+            newest = f'{SEARCH_TABLE}.rowid'
+            match_params = [fts_query]
+            rank_params = []
+        else:
+            # SQLite без FTS5: полный просмотр
+            match = ' AND '.join(
+                "casefold(COALESCE(t.transaction_information, '') || ' ' || COALESCE(t.transaction_code, '')) LIKE ?"
+                for _ in words
+            )
+            source = 'transactions t'
+            match_params = [f"%{word.casefold()}%" for word, _ in words]
+            ranked = False
+        
+        where = ' AND '.join([match] + conditions)
+        if not ranked:
+            query = f'''
+                SELECT {columns},
+                    0 as rank
+                FROM {source}
+                WHERE {where}
+                ORDER BY t.booking_date_time DESC, t.id DESC
+            '''
+            params = match_params + params
+            key = lambda t: (t['transaction_date'] or '', t['id'])
+            reverse = True
+        else:
+            # Последние SEARCH_WINDOW совпадений (по id, без rank), затем по релевантности
+            query = f'''
+                SELECT * FROM (
+                    SELECT {columns},
+                        {rank} as rank
+                    FROM {source}
+                    WHERE {where}
+                    ORDER BY {newest} DESC
+                    LIMIT {SEARCH_WINDOW}
+                ) window_matches
+                ORDER BY rank, transaction_date DESC, id
+            '''
+            params = rank_params + match_params + params
+            key = lambda t: t['rank']
+            reverse = False
+        
+        shard = _bank_shard(bank_code)
+        if db_manager.sharded and shard == ALL_SHARDS:
+            # Все БД банков: каждая отдаёт первые offset + limit, порядок сравним между ними
+            rows = db_manager.execute_query(query + f' LIMIT {limit + offset}', tuple(params), shard=ALL_SHARDS)
+            return _merge_page(rows, key, offset, limit, reverse)
+        
+        query += ' LIMIT ? OFFSET ?'
+        return db_manager.execute_query(query, tuple(params) + (limit, offset), shard=shard)
+    
     @staticmethod
     def create(client_id: int, amount: float, category: str, 
                direction: str, description: str = None,
@@ -408,24 +718,56 @@ class TransactionRepository:
             '''
             params = (client_id, amount, category, direction, description)
         
-        return db_manager.execute_update(query, params)
+        # Итоги месяца для таймлайна — в той же транзакции БД, что и вставка;
+        # без даты транзакция получает CURRENT_DATE (UTC)
+        month = (transaction_date or datetime.utcnow().strftime('%Y-%m-%d'))[:7]
+        with db_manager.get_connection() as conn:
+            cursor = db_manager.backend.cursor(conn)
+            transaction_id = db_manager.backend.execute_update(cursor, query, params)
+            cursor.execute(ROLLUP_UPSERT, (str(client_id), '', month, direction, category, amount, 1))
+        return transaction_id
+    
+    @staticmethod
+    def create_many(rows: List[tuple]) -> int:
+        """Создать пачку транзакций одной транзакцией БД (только для CRM)
+        
+        rows — (client_id, amount, category, direction, description, transaction_date),
+        дата обязательна. Итоги месяцев обновляются одним executemany на
+        сочетание клиент/месяц/направление/категория. Возвращает число строк
+        """
+        structure = TransactionRepository._detect_structure()
+        
+        if structure == 'banking':
+            raise Exception("Используйте банковский API для создания транзакций")
+        if not rows:
+            return 0
+        
+        # (client_id, month, direction, category) -> [сумма, количество]
+        deltas = {}
+        for client_id, amount, category, direction, _, transaction_date in rows:
+            delta = deltas.setdefault((str(client_id), transaction_date[:7], direction, category), [0, 0])
+            delta[0] += amount
+            delta[1] += 1
+        
+        with db_manager.get_connection() as conn:
+            cursor = db_manager.backend.cursor(conn)
+            cursor.executemany('''
+                INSERT INTO transactions 
+                (client_id, amount, category, direction, description, transaction_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.executemany(ROLLUP_UPSERT, [
+                (client_id, '', month, direction, category, total, count)
+                for (client_id, month, direction, category), (total, count) in deltas.items()
+            ])
+        return len(rows)
     
     @staticmethod
     def get_summary(client_id: str) -> Dict:
         """Получить финансовую сводку клиента (с учетом банка)"""
         structure = TransactionRepository._detect_structure()
         
-        # Разбираем составной ID
-        if '-' in str(client_id):
-            parts = str(client_id).rsplit('-', 1)
-            if len(parts) == 2:
-                client_id_part, bank_code = parts
-            else:
-                client_id_part = client_id
-                bank_code = None
-        else:
-            client_id_part = client_id
-            bank_code = None
+        client_id_part, bank_code = _split_client_id(client_id)
         
         if structure == 'banking':
             if bank_code:
@@ -437,7 +779,7 @@ class TransactionRepository:
                     FROM transactions
                     WHERE client_id = ? AND bank_code = ?
                 '''
-                result = db_manager.execute_query(query, (client_id_part, bank_code))
+                result = db_manager.execute_query(query, (client_id_part, bank_code), shard=bank_code)
             else:
                 query = '''
                     SELECT 
@@ -447,7 +789,9 @@ class TransactionRepository:
                     FROM transactions
                     WHERE client_id = ?
                 '''
-                result = db_manager.execute_query(query, (client_id_part,))
+                result = TransactionRepository._sum_rows(
+                    db_manager.execute_query(query, (client_id_part,), shard=ALL_SHARDS)
+                )
         else:
             query = '''
                 SELECT 
@@ -476,49 +820,100 @@ class TransactionRepository:
         }
     
     @staticmethod
-    def get_by_category(client_id: str) -> List[Dict]:
-        """Получить статистику по категориям (с учетом банка)"""
+    def _sum_rows(rows: List[Dict]) -> List[Dict]:
+        """Сложить одну строку агрегатов (SUM, COUNT) из нескольких БД банков"""
+        if not rows:
+            return rows
+        return [{key: sum(row[key] or 0 for row in rows) for key in rows[0]}]
+    
+    @staticmethod
+    def get_totals() -> Dict:
+        """Доходы, расходы и число транзакций всех клиентов (для /api/stats)
+        
+        Один агрегат вместо get_summary на каждого клиента; в раздельном
+        режиме считается параллельно в БД банков и складывается
+        """
         structure = TransactionRepository._detect_structure()
         
-        # Разбираем составной ID
-        if '-' in str(client_id):
-            parts = str(client_id).rsplit('-', 1)
-            if len(parts) == 2:
-                client_id_part, bank_code = parts
-            else:
-                client_id_part = client_id
-                bank_code = None
+        if structure == 'banking':
+            query = '''
+                SELECT 
+                    SUM(CASE WHEN t.credit_debit_indicator = 'Credit' THEN t.amount ELSE 0 END) as total_income,
+                    SUM(CASE WHEN t.credit_debit_indicator = 'Debit' THEN t.amount ELSE 0 END) as total_expense,
+                    COUNT(*) as transaction_count
+                FROM transactions t
+                JOIN (SELECT DISTINCT client_id, bank_code FROM clients) c
+                    ON c.client_id = t.client_id AND c.bank_code = t.bank_code
+            '''
         else:
-            client_id_part = client_id
-            bank_code = None
+            query = '''
+                SELECT 
+                    SUM(CASE WHEN t.direction = 'income' THEN t.amount ELSE 0 END) as total_income,
+                    SUM(CASE WHEN t.direction = 'expense' THEN t.amount ELSE 0 END) as total_expense,
+                    COUNT(*) as transaction_count
+                FROM transactions t
+                JOIN clients c ON c.id = t.client_id
+            '''
+        
+        result = TransactionRepository._sum_rows(db_manager.execute_query(query, shard=ALL_SHARDS))
+        data = result[0] if result else {}
+        total_income = data.get('total_income') or 0
+        total_expense = data.get('total_expense') or 0
+        return {
+            'total_income': total_income,
+            'total_expense': total_expense,
+            'balance': total_income - total_expense,
+            'transaction_count': data.get('transaction_count') or 0
+        }
+    
+    @staticmethod
+    def get_by_category(client_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Получить статистику по категориям (с учетом банка)
+        
+        limit — вернуть только top-N категорий по сумме
+        """
+        structure = TransactionRepository._detect_structure()
+        limit_sql = ' LIMIT ?' if limit else ''
+        limit_params = (int(limit),) if limit else ()
+        
+        client_id_part, bank_code = _split_client_id(client_id)
         
         if structure == 'banking':
             if bank_code:
                 query = '''
                     SELECT 
-                        COALESCE(transaction_information, 'Без категории') as category,
+                        COALESCE(category, 'Без категории') as category,
                         credit_debit_indicator as direction,
                         SUM(amount) as total,
                         COUNT(*) as count
                     FROM transactions
                     WHERE client_id = ? AND bank_code = ?
-                    GROUP BY transaction_information, credit_debit_indicator
+                    GROUP BY category, credit_debit_indicator
                     ORDER BY total DESC
-                '''
-                return db_manager.execute_query(query, (client_id_part, bank_code))
+                ''' + limit_sql
+                return db_manager.execute_query(query, (client_id_part, bank_code) + limit_params, shard=bank_code)
             else:
                 query = '''
                     SELECT 
-                        COALESCE(transaction_information, 'Без категории') as category,
+                        COALESCE(category, 'Без категории') as category,
                         credit_debit_indicator as direction,
                         SUM(amount) as total,
                         COUNT(*) as count
                     FROM transactions
                     WHERE client_id = ?
-                    GROUP BY transaction_information, credit_debit_indicator
+                    GROUP BY category, credit_debit_indicator
                     ORDER BY total DESC
                 '''
-                return db_manager.execute_query(query, (client_id_part,))
+                if not db_manager.sharded:
+                    return db_manager.execute_query(query + limit_sql, (client_id_part,) + limit_params)
+                
+                # Одна категория может быть в нескольких банках — складываем группы
+                groups = {}
+                for row in db_manager.execute_query(query, (client_id_part,), shard=ALL_SHARDS):
+                    group = groups.setdefault((row['category'], row['direction']), dict(row, total=0, count=0))
+                    group['total'] += row['total'] or 0
+                    group['count'] += row['count']
+                return _merge_page(list(groups.values()), lambda g: g['total'], 0, limit, reverse=True)
         else:
             query = '''
                 SELECT 
@@ -530,93 +925,312 @@ class TransactionRepository:
                 WHERE client_id = ?
                 GROUP BY category, direction
                 ORDER BY total DESC
+            ''' + limit_sql
+            return db_manager.execute_query(query, (str(client_id),) + limit_params)
+    
+    @staticmethod
+    def get_timeline(client_id: str, granularity: str = 'month',
+                     month_from: Optional[str] = None, month_to: Optional[str] = None) -> List[Dict]:
+        """Движение денег клиента по периодам из transaction_rollups
+        
+        granularity — month, quarter или year; month_from/month_to — ГГГГ-ММ
+        включительно. Читаются итоги месяцев (строка на месяц, направление и
+        категорию), а не история транзакций
+        """
+        if granularity not in TIMELINE_PERIODS:
+            raise ValueError(f"granularity: {', '.join(TIMELINE_PERIODS)}")
+        structure = TransactionRepository._detect_structure()
+        
+        client_id_part, bank_code = _split_client_id(client_id)
+        
+        if structure == 'banking':
+            conditions = ['client_id = ?']
+            params = [client_id_part]
+            if bank_code:
+                conditions.append('bank_code = ?')
+                params.append(bank_code)
+            shard = _bank_shard(bank_code)
+        else:
+            conditions = ['client_id = ?', "bank_code = ''"]
+            params = [str(client_id)]
+            shard = None
+        
+        if month_from:
+            conditions.append('month >= ?')
+            params.append(_parse_month(month_from, 'from'))
+        if month_to:
+            conditions.append('month <= ?')
+            params.append(_parse_month(month_to, 'to'))
+        
+        query = f'''
+            SELECT month, direction, category, total, transaction_count
+            FROM transaction_rollups
+            WHERE {' AND '.join(conditions)}
+            ORDER BY month
+        '''
+        
+        # Периоды и категории складываются здесь: строк — десятки,
+        # и клиент без банка может быть в нескольких БД банков
+        period_of = TIMELINE_PERIODS[granularity]
+        periods = {}
+        for row in db_manager.execute_query(query, tuple(params), shard=shard):
+            key = period_of(row['month'])
+            period = periods.setdefault(key, {
+                'period': key,
+                'total_income': 0,
+                'total_expense': 0,
+                'transaction_count': 0,
+                'categories': {}
+            })
+            total = row['total'] or 0
+            period['total_income' if row['direction'] == 'income' else 'total_expense'] += total
+            period['transaction_count'] += row['transaction_count']
+            
+            category = period['categories'].setdefault(
+                (row['category'], row['direction']),
+                {'category': row['category'], 'direction': row['direction'], 'total': 0, 'count': 0}
+            )
+            category['total'] += total
+            category['count'] += row['transaction_count']
+        
+        timeline = []
+        for key in sorted(periods):
+            period = periods[key]
+            period['balance'] = period['total_income'] - period['total_expense']
+            period['categories'] = sorted(period['categories'].values(), key=lambda c: c['total'], reverse=True)
+            timeline.append(period)
+        return timeline
+    
+    @staticmethod
+    def get_balances(client_ids: Optional[List[str]] = None) -> Dict[str, float]:
+        """Балансы клиентов одним запросом: {id клиента: баланс}
+        
+        Клиенты без транзакций попадают в результат с балансом 0,
+        как в get_summary. client_ids — только эти клиенты (страница
+        списка): их транзакции берутся по индексу клиента, без
+        агрегата по всей таблице
+        """
+        if client_ids is not None:
+            return TransactionRepository._get_balances_of(client_ids)
+        
+        structure = TransactionRepository._detect_structure()
+        
+        # Сначала агрегируем транзакции по клиенту, потом присоединяем к списку
+        # клиентов: один проход по индексу вместо поиска по каждому клиенту
+        if structure == 'banking':
+            query = '''
+                SELECT 
+                    c.client_id || '-' || c.bank_code as id,
+                    COALESCE(t.balance, 0) as balance
+                FROM (SELECT DISTINCT client_id, bank_code FROM clients) c
+                LEFT JOIN (
+                    SELECT 
+                        client_id, 
+                        bank_code,
+                        SUM(CASE credit_debit_indicator 
+                                WHEN 'Credit' THEN amount 
+                                WHEN 'Debit' THEN -amount 
+                                ELSE 0 END) as balance
+                    FROM transactions
+                    GROUP BY client_id, bank_code
+                ) t ON t.client_id = c.client_id AND t.bank_code = c.bank_code
             '''
-            return db_manager.execute_query(query, (str(client_id),))
+        else:
+            query = '''
+                SELECT 
+                    c.id as id,
+                    COALESCE(t.balance, 0) as balance
+                FROM clients c
+                LEFT JOIN (
+                    SELECT 
+                        client_id,
+                        SUM(CASE direction 
+                                WHEN 'income' THEN amount 
+                                WHEN 'expense' THEN -amount 
+                                ELSE 0 END) as balance
+                    FROM transactions
+                    GROUP BY client_id
+                ) t ON t.client_id = c.id
+            '''
+        
+        # id включает bank_code: строки разных БД банков не пересекаются
+        rows = db_manager.execute_query(query, shard=ALL_SHARDS)
+        return {str(row['id']): row['balance'] or 0 for row in rows}
+    
+    @staticmethod
+    def _get_balances_of(client_ids: List[str]) -> Dict[str, float]:
+        """Балансы перечисленных клиентов (get_balances с client_ids)"""
+        balances = {str(client_id): 0 for client_id in client_ids}
+        if not balances:
+            return balances
+        
+        if TransactionRepository._detect_structure() == 'banking':
+            # Составные ID по банкам: запрос в БД банка по индексу клиента
+            by_bank = {}
+            for client_id in balances:
+                client_id_part, bank_code = _split_client_id(client_id)
+                by_bank.setdefault(bank_code, []).append(client_id_part)
+            for bank_code, ids in by_bank.items():
+                query = f'''
+                    SELECT 
+                        client_id || '-' || bank_code as id,
+                        SUM(CASE credit_debit_indicator 
+                                WHEN 'Credit' THEN amount 
+                                WHEN 'Debit' THEN -amount 
+                                ELSE 0 END) as balance
+                    FROM transactions
+                    WHERE bank_code = ? AND client_id IN ({','.join('?' * len(ids))})
+                    GROUP BY client_id, bank_code
+                '''
+                for row in db_manager.execute_query(query, (bank_code, *ids), shard=_bank_shard(bank_code)):
+                    balances[str(row['id'])] = row['balance'] or 0
+        else:
+            query = f'''
+                SELECT 
+                    client_id as id,
+                    SUM(CASE direction 
+                            WHEN 'income' THEN amount 
+                            WHEN 'expense' THEN -amount 
+                            ELSE 0 END) as balance
+                FROM transactions
+                WHERE client_id IN ({','.join('?' * len(balances))})
+                GROUP BY client_id
+            '''
+            for row in db_manager.execute_query(query, tuple(balances)):
+                balances[str(row['id'])] = row['balance'] or 0
+        return balances
+    
+    # (версия данных, статистика) последнего get_balance_stats по всей базе
+    _balance_stats_cache = (None, None)
+    
+    @staticmethod
+    def get_balance_stats(balances: Optional[Dict[str, float]] = None) -> Dict:
+        """Максимальный и средний баланс по всем клиентам (для рейтинга)
+        
+        Без balances статистика считается по всей базе один раз на версию
+        данных (DataVersionRepository) и дальше берётся из кэша
+        """
+        if balances is None:
+            version = DataVersionRepository.get_version()
+            cached_version, stats = TransactionRepository._balance_stats_cache
+            if stats is not None and cached_version == version:
+                return stats
+            stats = TransactionRepository.get_balance_stats(TransactionRepository.get_balances())
+            TransactionRepository._balance_stats_cache = (version, stats)
+            return stats
+        
+        if not balances:
+            return {'max_balance': 0.0, 'avg_balance': 0.0, 'count': 0}
+        
+        values = list(balances.values())
+        return {
+            'max_balance': max(values),
+            'avg_balance': sum(values) / len(values),
+            'count': len(values)
+        }
+    
     @staticmethod
     def get_average_balance() -> float:
         """Получить средний баланс всех клиентов"""
         try:
-            clients = ClientRepository.get_all()
-            if not clients:
-                return 0.0
-            
-            balances = []
-            for client in clients:
-                summary = TransactionRepository.get_summary(client['id'])
-                balances.append(summary['balance'])
-            
-            avg = sum(balances) / len(balances) if balances else 0.0
-            return avg
+            return TransactionRepository.get_balance_stats()['avg_balance']
         except Exception as e:
-            print(f"❌ Ошибка get_average_balance: {e}")
+            logger.error("❌ Ошибка get_average_balance: %s", e)
             return 0.0
 
     @staticmethod
-    def calculate_client_rating(client_id: str) -> float:
+    def rating_from_balance(client_balance: float, balance_stats: Dict) -> float:
         """
-        Расчет рейтинга клиента (формула на квадратном корне для более мягкого распределения)
-        Рейтинг от 1.0 до 5.0 на основе баланса относительно других клиентов
+        Рейтинг по балансу клиента и статистике балансов (get_balance_stats)
+        Формула на квадратном корне для более мягкого распределения
         """
         import math
         
+        max_balance = balance_stats['max_balance']
+        avg_balance = balance_stats['avg_balance']
+        
+        # Защита от деления на ноль
+        if not balance_stats['count'] or max_balance <= 0 or avg_balance <= 0:
+            return 3.0
+        
+        ratio = math.sqrt(max(0, client_balance) / avg_balance)
+        max_ratio = math.sqrt(max_balance / avg_balance)
+        
+        if max_ratio == 0:
+            return 3.0
+        
+        rating = 1 + 4 * (ratio / max_ratio)
+        
+        # Ограничиваем от 1.0 до 5.0
+        rating = max(1.0, min(5.0, rating))
+        
+        return round(rating, 1)
+
+    @staticmethod
+    def calculate_client_rating(client_id: str, balance_stats: Optional[Dict] = None) -> float:
+        """
+        Расчет рейтинга клиента (формула на квадратном корне для более мягкого распределения)
+        Рейтинг от 1.0 до 5.0 на основе баланса относительно других клиентов
+        
+        balance_stats можно передать заранее, чтобы при расчете рейтинга
+        для списка клиентов не агрегировать транзакции на каждого
+        """
         try:
             # Получаем баланс клиента
             summary = TransactionRepository.get_summary(client_id)
-            client_balance = summary['balance']
-            
-            # Получаем балансы всех клиентов
-            clients = ClientRepository.get_all()
-            if not clients or len(clients) == 0:
-                return 3.0
-            
-            balances = []
-            for client in clients:
-                client_summary = TransactionRepository.get_summary(client['id'])
-                balances.append(client_summary['balance'])
-            
-            if not balances:
-                return 3.0
-            
-            max_balance = max(balances)
-            avg_balance = sum(balances) / len(balances)
-            
-            # Защита от деления на ноль
-            if max_balance <= 0 or avg_balance <= 0:
-                return 3.0
-            
-            # Формула на квадратном корне для более мягкого распределения
-            ratio = math.sqrt(max(0, client_balance) / avg_balance)
-            max_ratio = math.sqrt(max_balance / avg_balance)
             
-            if max_ratio == 0:
-                return 3.0
+            if balance_stats is None:
+                balance_stats = TransactionRepository.get_balance_stats()
             
-            rating = 1 + 4 * (ratio / max_ratio)
-            
-            # Ограничиваем от 1.0 до 5.0
-            rating = max(1.0, min(5.0, rating))
-            
-            return round(rating, 1)
+            return TransactionRepository.rating_from_balance(summary['balance'], balance_stats)
         except Exception as e:
-            print(f"❌ Ошибка calculate_client_rating для {client_id}: {e}")
+            logger.error("❌ Ошибка calculate_client_rating для %s: %s", client_id, e)
             return 3.0
 
 
 
+class DataVersionRepository:
+    """Версия данных для инвалидации кэша на клиенте"""
+    
+    # MAX(id) — вставки (INSERT OR REPLACE импортёра SQLite даёт новый id);
+    # правки и удаления клиентов, очистка таблиц и завершение синхронизации
+    # сдвигают счётчик data_version (DATA_VERSION_BUMP)
+    TABLES = ('clients', 'transactions', 'balances', 'sync_runs')
+    
+    @staticmethod
+    def get_version() -> str:
+        """Версия данных: меняется при добавлении, удалении и изменении клиентов,
+        транзакций и балансов
+        
+        Только MAX(id) по первичному ключу и одна строка счётчика — без
+        просмотра таблиц, опрос дёшев на любой истории
+        """
+        # В раздельном режиме — таблицы и DATABASE_FILE, и БД банков
+        existing = set(db_manager.list_tables())
+        
+        parts = []
+        for table in DataVersionRepository.TABLES:
+            if table not in existing:
+                continue
+            shard = ALL_SHARDS if table in SHARDED_TABLES else None
+            # По строке на каждую БД банка (в одном файле — одна строка)
+            for row in db_manager.execute_query(f'SELECT MAX(id) as max_id FROM {table}', shard=shard):
+                parts.append(str(row['max_id'] or 0))
+        
+        if 'data_version' in existing:
+            row = db_manager.execute_query('SELECT version FROM data_version WHERE id = 1')[0]
+            parts.append(str(row['version']))
+        
+        return '-'.join(parts)
+
+
 class AIConversationRepository:
     """Репозиторий для работы с AI диалогами"""
     
     @staticmethod
     def get_by_client(client_id: int, limit: int = 10) -> List[Dict]:
         """Получить историю диалогов клиента"""
-        query = '''
-            SELECT id, client_id, question, answer, context_data, created_at
-            FROM ai_conversations
-            WHERE client_id = ?
-            ORDER BY created_at DESC
-            LIMIT ?
-        '''
-        return db_manager.execute_query(query, (str(client_id), limit))
+        return AIConversationRepository.get_page(client_id=client_id, limit=limit)
     
     @staticmethod
     def create(client_id: Optional[int], question: str, 
@@ -631,12 +1245,291 @@ class AIConversationRepository:
     @staticmethod
     def get_recent_global(limit: int = 20) -> List[Dict]:
         """Получить последние диалоги по всем клиентам"""
-        query = '''
+        return AIConversationRepository.get_page(limit=limit)
+    
+    @staticmethod
+    def get_page(client_id: Optional[str] = None, text: Optional[str] = None,
+                 before: Optional[int] = None, limit: int = 20) -> List[Dict]:
+        """Страница истории диалогов, новые первыми
+        
+        before — id последнего диалога предыдущей страницы: следующая
+        страница читается по индексу (client_id, created_at) или (created_at)
+        с этого места, без OFFSET. text — поиск по вопросу и ответу (слова
+        целиком, слово со * — по началу)
+        """
+        conditions = []
+        params = []
+        if client_id:
+            conditions.append('c.client_id = ?')
+            params.append(str(client_id))
+        if text:
+            words = _search_words(text)
+            if db_manager.backend.name == 'postgresql':
+                conditions.append(f"{CONVERSATION_SEARCH_VECTOR} @@ to_tsquery('simple', ?)")
+                params.append(_tsquery(words))
+            elif db_manager.get_columns(CONVERSATION_SEARCH_TABLE):
+                if client_id and not any(prefix for _, prefix in words):
+                    # Диалогов клиента немного: проверяем каждый по rowid
+                    conditions.append(
+                        f'EXISTS (SELECT 1 FROM {CONVERSATION_SEARCH_TABLE} '
+                        f'WHERE {CONVERSATION_SEARCH_TABLE} MATCH ? AND rowid = c.id)'
+                    )
+                else:
+                    conditions.append(
+                        f'c.id IN (SELECT rowid FROM {CONVERSATION_SEARCH_TABLE} WHERE {CONVERSATION_SEARCH_TABLE} MATCH ?)'
+                    )
+                params.append(_fts5_query(words))
+            else:
+                # SQLite без FTS5: полный просмотр
+                for word, _ in words:
+                    conditions.append("casefold(c.question || ' ' || c.answer) LIKE ?")
+                    params.append(f"%{word.casefold()}%")
+        if before:
+            conditions.append('(c.created_at, c.id) < (SELECT created_at, id FROM ai_conversations WHERE id = ?)')
+            params.append(int(before))
+        
+        query = f'''
             SELECT 
-                c.id, c.client_id, c.question, c.answer, c.created_at,
+                c.id, c.client_id, c.question, c.answer, c.context_data, c.created_at,
                 c.client_id as client_name
             FROM ai_conversations c
-            ORDER BY c.created_at DESC
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY c.created_at DESC, c.id DESC
+            LIMIT ?
+        '''
+        return db_manager.execute_query(query, tuple(params) + (int(limit),))
+
+
+class AIAnalysisRepository:
+    """Репозиторий для результатов пакетного AI анализа"""
+    
+    @staticmethod
+    def create(batch_id: str, client_id: str, question: str, status: str,
+               answer: str = None, model: str = None, error: str = None,
+               summary: Optional[Dict] = None, duration_ms: int = None) -> int:
+        """Сохранить результат анализа клиента"""
+        summary = summary or {}
+        query = '''
+            INSERT INTO ai_client_analyses
+            (batch_id, client_id, question, answer, model, status, error,
+             total_income, total_expense, balance, transaction_count, duration_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        return db_manager.execute_update(query, (
+            batch_id,
+            str(client_id),
+            question,
+            answer,
+            model,
+            status,
+            error,
+            summary.get('total_income', 0),
+            summary.get('total_expense', 0),
+            summary.get('balance', 0),
+            summary.get('transaction_count', 0),
+            duration_ms
+        ))
+    
+    @staticmethod
+    def get_latest(limit: int = 50, order_by: str = 'turnover') -> List[Dict]:
+        """
+        Получить последний успешный анализ по каждому клиенту
+        order_by: 'turnover' (доходы + расходы), 'balance' или 'created_at'
+        """
+        order_columns = {
+            'turnover': '(a.total_income + a.total_expense) DESC',
+            'balance': 'a.balance DESC',
+            'created_at': 'a.id DESC'
+        }
+        order_sql = order_columns.get(order_by, order_columns['turnover'])
+        
+        query = f'''
+            SELECT 
+                a.id, a.batch_id, a.client_id, a.question, a.answer, a.model,
+                a.total_income, a.total_expense, a.balance, a.transaction_count,
+                a.total_income + a.total_expense as turnover,
+                a.created_at
+            FROM ai_client_analyses a
+            WHERE a.id IN (
+                SELECT MAX(id) FROM ai_client_analyses
+                WHERE status = 'success'
+                GROUP BY client_id
+            )
+            ORDER BY {order_sql}
             LIMIT ?
         '''
         return db_manager.execute_query(query, (limit,))
+    
+    @staticmethod
+    def get_by_client(client_id: str) -> Optional[Dict]:
+        """Получить последний успешный анализ клиента"""
+        query = '''
+            SELECT 
+                id, batch_id, client_id, question, answer, model,
+                total_income, total_expense, balance, transaction_count, created_at
+            FROM ai_client_analyses
+            WHERE client_id = ? AND status = 'success'
+            ORDER BY id DESC
+            LIMIT 1
+        '''
+        results = db_manager.execute_query(query, (str(client_id),))
+        return results[0] if results else None
+    
+    @staticmethod
+    def get_batch_stats(batch_id: str) -> Dict:
+        """Статистика пакетного прогона"""
+        query = '''
+            SELECT 
+                COUNT(*) as total,
+                SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) as success,
+                SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END) as errors,
+                AVG(duration_ms) as avg_duration_ms
+            FROM ai_client_analyses
+            WHERE batch_id = ?
+        '''
+        result = db_manager.execute_query(query, (batch_id,))
+        return result[0] if result else {}
+
+
+class SyncRunRepository:
+    """Репозиторий истории синхронизаций с банками"""
+    
+    @staticmethod
+    def start(bank_code: str, since: Optional[str] = None) -> int:
+        """Записать начало синхронизации банка, вернуть id запуска"""
+        query = '''
+            INSERT INTO sync_runs (bank_code, status, since)
+            VALUES (?, 'running', ?)
+        '''
+        return db_manager.execute_update(query, (bank_code, since))
+    
+    @staticmethod
+    def finish(run_id: int, status: str, clients: int = 0, failed_clients: int = 0,
+               rows: int = 0, error: str = None, duration_ms: int = None) -> int:
+        """Записать итог синхронизации"""
+        query = '''
+            UPDATE sync_runs
+            SET status = ?, clients = ?, failed_clients = ?, rows = ?, error = ?,
+                duration_ms = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        '''
+        # Обновлённые синхронизацией балансы не меняют MAX(id) в PostgreSQL
+        return _update_and_bump(query, (
+            status, clients, failed_clients, rows, error, duration_ms, run_id
+        ))
+    
+    @staticmethod
+    def get_last_success(bank_code: str) -> Optional[Dict]:
+        """Последняя успешная синхронизация банка"""
+        query = '''
+            SELECT id, bank_code, started_at, finished_at, rows
+            FROM sync_runs
+            WHERE bank_code = ? AND status = 'success'
+            ORDER BY id DESC
+            LIMIT 1
+        '''
+        results = db_manager.execute_query(query, (bank_code,))
+        return results[0] if results else None
+    
+    @staticmethod
+    def get_recent(bank_code: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """История синхронизаций, новые первыми"""
+        query = '''
+            SELECT id, bank_code, status, since, clients, failed_clients, rows,
+                   error, duration_ms, started_at, finished_at
+            FROM sync_runs
+        '''
+        params = []
+        if bank_code:
+            query += ' WHERE bank_code = ?'
+            params.append(bank_code)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        return db_manager.execute_query(query, tuple(params))
+    
+    @staticmethod
+    def fail_unfinished() -> int:
+        """Пометить ошибкой запуски, прерванные остановкой процесса"""
+        query = '''
+            UPDATE sync_runs
+            SET status = 'error', error = 'Прервано: процесс остановлен',
+                finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'running'
+        '''
+        return db_manager.execute_update(query)
+
+
+class AnomalyRepository:
+    """Репозиторий необычных транзакций (считает anomalies.py)"""
+    
+    COLUMNS = '''
+        client_id, bank_code, transaction_id, kind, category, direction, amount,
+        booking_date, description, score, baseline, detected_at
+    '''
+    
+    @staticmethod
+    def _with_reason(rows: List[Dict]) -> List[Dict]:
+        for row in rows:
+            row['reason'] = ANOMALY_KINDS.get(row['kind'], row['kind'])
+        return rows
+    
+    @staticmethod
+    def get_by_client(client_id: str, limit: Optional[int] = None) -> List[Dict]:
+        """Аномалии клиента (с учетом банка), новые первыми"""
+        structure = TransactionRepository._detect_structure()
+        
+        client_id_part, bank_code = _split_client_id(client_id)
+        
+        if structure == 'banking':
+            conditions = ['client_id = ?']
+            params = [client_id_part]
+            if bank_code:
+                conditions.append('bank_code = ?')
+                params.append(bank_code)
+            shard = _bank_shard(bank_code)
+        else:
+            conditions = ['client_id = ?', "bank_code = ''"]
+            params = [str(client_id)]
+            shard = None
+        
+        query = f'''
+            SELECT {AnomalyRepository.COLUMNS}
+            FROM transaction_anomalies
+            WHERE {' AND '.join(conditions)}
+            ORDER BY booking_date DESC, score DESC
+        '''
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        
+        rows = db_manager.execute_query(query, tuple(params), shard=shard)
+        if shard == ALL_SHARDS and db_manager.sharded:
+            rows = _merge_page(rows, lambda a: (a['booking_date'] or '', a['score']), 0, limit, reverse=True)
+        return AnomalyRepository._with_reason(rows)
+    
+    @staticmethod
+    def get_recent(kind: Optional[str] = None, bank_code: Optional[str] = None,
+                   limit: int = 50) -> List[Dict]:
+        """Последние аномалии по всем клиентам (kind — из ANOMALY_KINDS)"""
+        if kind and kind not in ANOMALY_KINDS:
+            raise ValueError(f"Недопустимый вид аномалии: {kind} (доступны: {', '.join(ANOMALY_KINDS)})")
+        conditions = []
+        params = []
+        if kind:
+            conditions.append('kind = ?')
+            params.append(kind)
+        if bank_code:
+            conditions.append('bank_code = ?')
+            params.append(bank_code)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        query = f'''
+            SELECT {AnomalyRepository.COLUMNS}
+            FROM transaction_anomalies
+            {where}
+            ORDER BY booking_date DESC, score DESC
+            LIMIT ?
+        '''
+        rows = db_manager.execute_query(query, tuple(params) + (int(limit),), shard=_bank_shard(bank_code))
+        if db_manager.sharded and not bank_code:
+            rows = _merge_page(rows, lambda a: (a['booking_date'] or '', a['score']), 0, limit, reverse=True)
+        return AnomalyRepository._with_reason(rows)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# shard_db.py
+"""
+Раздельные БД по банкам (DB_SHARD_DIR)
+
+    python3 shard_db.py split multibank_real.db shards/   # разложить общую БД по банкам
+    python3 shard_db.py vacuum --bank abank                # сжать БД одного банка
+    python3 shard_db.py stats                              # размеры и строки по банкам
+
+После split: DB_SHARD_DIR=shards/, DATABASE_FILE — общая БД (AI диалоги,
+анализы и история синхронизаций остаются в ней)
+"""
+
+import argparse
+import os
+import sqlite3
+
+from app_logging import get_logger, setup_logging
+from base import DirectAPIToSQLite
+from config import Config
+from database import (SHARDED_TABLES, BankShard, ShardedDatabaseManager, rebuild_transaction_search,
+                      shard_file)
+
+logger = get_logger('shards')
+
+
+def split_database(source: str, shard_dir: str) -> dict:
+    """Скопировать банковские таблицы source в <shard_dir>/<bank_code>.db
+
+    Схему файла банка создаёт импортёр, колонки копируются по пересечению
+    (в source могут быть лишние). Существующие строки заменяются
+    """
+    conn = sqlite3.connect(source)
+    try:
+        tables = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        bank_codes = sorted(
+            row[0] for row in conn.execute(
+                'SELECT code FROM banks UNION SELECT DISTINCT bank_code FROM clients'
+            ) if row[0]
+        )
+    finally:
+        conn.close()
+
+    importer = DirectAPIToSQLite(source)
+    importer.shard_dir = shard_dir
+
+    copied = {}
+    for bank_code in bank_codes:
+        importer.create_database(bank_code)
+        importer.close()
+
+        shard = sqlite3.connect(shard_file(shard_dir, bank_code))
+        try:
+            shard.execute('ATTACH DATABASE ? AS source', (source,))
+            rows = 0
+            for table in SHARDED_TABLES:
+                if table not in tables or table == 'transaction_rollups':
+                    continue
+                target_columns = [row[1] for row in shard.execute(f'PRAGMA main.table_info({table})')]
+                source_columns = {row[1] for row in shard.execute(f'PRAGMA source.table_info({table})')}
+                columns = ', '.join(c for c in target_columns if c in source_columns)
+                bank_column = 'code' if table == 'banks' else 'bank_code'
+                cursor = shard.execute(
+                    f'INSERT OR REPLACE INTO main.{table} ({columns}) '
+                    f'SELECT {columns} FROM source.{table} WHERE {bank_column} = ?',
+                    (bank_code,)
+                )
+                rows += cursor.rowcount
+            # INSERT OR REPLACE заменяет строки без триггеров удаления — индекс поиска заново
+            rebuild_transaction_search(shard)
+            shard.commit()
+            shard.execute('DETACH DATABASE source')
+        finally:
+            shard.close()
+
+        # Категории и итоги месяцев пересчитываются по скопированным транзакциям
+        manager = BankShard(shard_file(shard_dir, bank_code), bank_code)
+        manager.reclassify_transactions()
+        manager.close()
+
+        copied[bank_code] = rows
+        logger.info("✅ %s: %d строк", bank_code, rows)
+
+    return copied
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Раздельные БД по банкам')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    split_parser = subparsers.add_parser('split', help='Разложить общую БД по файлам банков')
+    split_parser.add_argument('source', help='Общая БД (multibank_real.db)')
+    split_parser.add_argument('shard_dir', help='Каталог для файлов <bank_code>.db')
+
+    vacuum_parser = subparsers.add_parser('vacuum', help='VACUUM БД банка (остальные банки не блокируются)')
+    vacuum_parser.add_argument('--bank', help='Код банка (по умолчанию все по очереди)')
+
+    subparsers.add_parser('stats', help='Размеры и строки по банкам')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    if args.command == 'split':
+        copied = split_database(args.source, args.shard_dir)
+        print(f"✅ Банков: {len(copied)}, строк: {sum(copied.values())} → {args.shard_dir}")
+        return
+
+    if not Config.DB_SHARD_DIR:
+        parser.error('DB_SHARD_DIR не задан')
+    manager = ShardedDatabaseManager()
+
+    if args.command == 'vacuum':
+        for bank_code, size in manager.vacuum(args.bank).items():
+            print(f"🧹 {bank_code}: {size / (1024 * 1024):.1f} MB")
+    else:
+        for bank_code in manager.shard_codes():
+            stats = manager.get_shard(bank_code).get_table_stats()
+            size = os.path.getsize(manager.shard_file(bank_code)) / (1024 * 1024)
+            counts = ', '.join(f"{table}: {count}" for table, count in stats.items())
+            print(f"🏦 {bank_code} ({size:.1f} MB): {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -32,11 +32,29 @@ async function fetchWithAuth(url, options = {}) {
 
 // ============ КОНФИГУРАЦИЯ ============
 const API_URL = '/api';
+const RECENT_TRANSACTIONS_LIMIT = 10;  // Сколько транзакций показывает карточка клиента
+const CLIENTS_PAGE_SIZE = 100;  // Клиентов на страницу /api/clients
+const TRANSACTIONS_PAGE_SIZE = 50;  // Транзакций на страницу ленты
+const DATA_VERSION_POLL_INTERVAL = 30000;  // Проверка изменений данных на сервере, мс
 
 // ============ ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ ============
 let selectedClientId = null;
 let currentFilter = 'all';
 
+// Нормализованное хранилище клиентов: выбор работает без запросов к серверу.
+// Список грузится постранично, order[i] — id клиента на позиции i
+const clientStore = {
+    byId: new Map(),  // id -> клиент
+    order: [],        // позиция в списке сервера -> id (с пропусками для незагруженных страниц)
+    total: 0,         // всего клиентов с учётом фильтра
+    generation: 0,    // счётчик перезагрузок: ответы устаревших запросов отбрасываются
+    pendingPages: new Set(),
+    version: null     // версия данных сервера (/api/data-version)
+};
+
+let clientList = null;        // VirtualList списка клиентов
+let transactionFeed = null;   // VirtualList ленты транзакций выбранного клиента
+
 // ============ MARKDOWN PARSER ============
 function parseMarkdown(text) {
     // Экранируем HTML теги для безопасности
@@ -109,6 +127,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // Загружаем данные
     loadStats();
     loadClients();
+    checkDataVersion();
+    setInterval(checkDataVersion, DATA_VERSION_POLL_INTERVAL);
     
     // Настраиваем обработчики событий
     setupEventListeners();
@@ -175,79 +195,278 @@ async function loadStats() {
     }
 }
 
-// ============ РАБОТА С КЛИЕНТАМИ ============
-async function loadClients(status = null) {
-    try {
-        const url = status ? `${API_URL}/clients?status=${status}` : `${API_URL}/clients`;
-        const response = await fetchWithAuth(url);
-        const data = await response.json();
+// ============ ВИРТУАЛЬНЫЙ СПИСОК ============
+// В DOM находятся только видимые строки и небольшой запас (overscan),
+// высоту прокрутки задаёт распорка. Все строки одной высоты — её меряем
+// по первой отрисованной строке. Для незагруженных строк рисуется заглушка,
+// а onMissing(start, end) подгружает нужный диапазон
+class VirtualList {
+    constructor(container, { getItem, renderRow, renderPlaceholder, renderEmpty, onMissing, overscan = 5 }) {
+        this.container = container;
+        this.getItem = getItem;
+        this.renderRow = renderRow;
+        this.renderPlaceholder = renderPlaceholder;
+        this.renderEmpty = renderEmpty;
+        this.onMissing = onMissing;
+        this.overscan = overscan;
+        this.total = 0;
+        this.rowHeight = null;
+        this.range = null;
         
-        const clientsList = document.getElementById('clientsList');
+        container.innerHTML = '';
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'virtual-spacer';
+        this.viewport = document.createElement('div');
+        this.viewport.className = 'virtual-window';
+        this.spacer.appendChild(this.viewport);
+        container.appendChild(this.spacer);
         
-        if (data.clients.length === 0) {
-            clientsList.innerHTML = `
-                <div class="empty-state">
-                    <div class="empty-icon">📭</div>
-                    <p>Клиенты ${status ? `со статусом "${status}"` : ''} не найдены</p>
-                    <button class="btn btn-secondary" onclick="showAddClientModal()">Добавить первого клиента</button>
-                </div>
-            `;
+        this.onScroll = () => this.render();
+        this.onResize = () => {
+            this.rowHeight = null;
+            this.render(true);
+        };
+        container.addEventListener('scroll', this.onScroll, { passive: true });
+        window.addEventListener('resize', this.onResize);
+    }
+    
+    destroy() {
+        this.container.removeEventListener('scroll', this.onScroll);
+        window.removeEventListener('resize', this.onResize);
+    }
+    
+    setTotal(total) {
+        this.total = total;
+        this.render(true);
+    }
+    
+    scrollToTop() {
+        this.container.scrollTop = 0;
+    }
+    
+    renderIndex(index) {
+        const item = this.getItem(index);
+        return item === undefined ? this.renderPlaceholder(index) : this.renderRow(item, index);
+    }
+    
+    measureRowHeight() {
+        this.viewport.style.transform = '';
+        this.viewport.style.removeProperty('--virtual-row-height');
+        this.viewport.innerHTML = this.renderRow(this.getItem(0), 0);
+        const row = this.viewport.firstElementChild;
+        if (!row) {
+            return null;
+        }
+        // Остальные строки и заглушки получают ту же высоту через CSS-переменную
+        this.viewport.style.setProperty('--virtual-row-height', `${row.offsetHeight}px`);
+        const style = getComputedStyle(row);
+        return row.offsetHeight + parseFloat(style.marginTop) + parseFloat(style.marginBottom);
+    }
+    
+    render(force = false) {
+        if (this.total === 0) {
+            this.range = null;
+            this.spacer.style.height = '';
+            this.viewport.style.transform = '';
+            this.viewport.innerHTML = this.renderEmpty ? this.renderEmpty() : '';
             return;
         }
         
-        clientsList.innerHTML = data.clients.map(client => {
-            const clientIdStr = String(client.id);
-            const isSelected = selectedClientId === clientIdStr;
-            const balance = client.balance || 0;
-            const balanceClass = balance >= 0 ? 'balance-positive' : 'balance-negative';
-            
-            // ========== НОВЫЙ КОД: РАСЧЕТ РЕЙТИНГА ==========
-            const rating = client.rating || 3.0;
-            const fullStars = Math.floor(rating);
-            const hasHalfStar = (rating % 1) >= 0.5;
-            const emptyStars = 5 - fullStars - (hasHalfStar ? 1 : 0);
-            
-            let starsHTML = '';
-            for (let i = 0; i < fullStars; i++) {
-                starsHTML += '★';
+        if (!this.rowHeight) {
+            // Высоту меряем по настоящей строке: пока первой нет — грузим начало списка
+            if (this.getItem(0) === undefined) {
+                this.viewport.innerHTML = this.renderPlaceholder(0);
+                if (this.onMissing) {
+                    this.onMissing(0, Math.min(this.total, this.overscan + 1));
+                }
+                return;
             }
-            if (hasHalfStar) {
-                starsHTML += '☆';
+            this.rowHeight = this.measureRowHeight();
+            if (!this.rowHeight) {
+                return;
             }
-            for (let i = 0; i < emptyStars; i++) {
-                starsHTML += '☆';
+            force = true;
+        }
+        
+        this.spacer.style.height = `${this.total * this.rowHeight}px`;
+        
+        const scrollTop = this.container.scrollTop;
+        const viewHeight = this.container.clientHeight || this.rowHeight * 10;
+        const start = Math.max(0, Math.floor(scrollTop / this.rowHeight) - this.overscan);
+        const end = Math.min(this.total, Math.ceil((scrollTop + viewHeight) / this.rowHeight) + this.overscan);
+        
+        if (!force && this.range && this.range.start === start && this.range.end === end) {
+            return;
+        }
+        this.range = { start, end };
+        
+        let html = '';
+        let missingStart = null;
+        let missingEnd = null;
+        for (let i = start; i < end; i++) {
+            if (this.getItem(i) === undefined) {
+                if (missingStart === null) {
+                    missingStart = i;
+                }
+                missingEnd = i + 1;
             }
-            // ========== КОНЕЦ НОВОГО КОДА ==========
-            
-            return `
-                <div class="client-card ${isSelected ? 'selected' : ''}" onclick="selectClient('${escapeHtml(clientIdStr)}')">
-                    <div class="client-header">
-                        <div class="client-info-left">
-                            <div class="client-name">${escapeHtml(client.name)}</div>
-                            <div class="client-info">📧 ${escapeHtml(client.email)}</div>
-                            <div class="client-info">📱 ${escapeHtml(client.phone)}</div>
-                        </div>
-                        <div class="client-balance ${balanceClass}">
-                            <div class="balance-label">Баланс</div>
-                            <div class="balance-value">${formatMoney(balance)}</div>
-                        </div>
-                    </div>
-                    
-                    <div class="client-rating" title="Рейтинг: ${rating}/5">
-                        <span class="rating-stars">${starsHTML}</span>
-                        <span class="rating-value">${rating.toFixed(1)}</span>
+            html += this.renderIndex(i);
+        }
+        
+        this.viewport.style.transform = `translateY(${start * this.rowHeight}px)`;
+        this.viewport.innerHTML = html;
+        
+        if (missingStart !== null && this.onMissing) {
+            this.onMissing(missingStart, missingEnd);
+        }
+    }
+}
+
+function pagesForRange(start, end, pageSize) {
+    const pages = [];
+    for (let page = Math.floor(start / pageSize); page <= Math.floor((end - 1) / pageSize); page++) {
+        pages.push(page);
+    }
+    return pages;
+}
+
+// ============ РАБОТА С КЛИЕНТАМИ ============
+function getClientList() {
+    if (!clientList) {
+        clientList = new VirtualList(document.getElementById('clientsList'), {
+            getItem: index => {
+                const id = clientStore.order[index];
+                return id === undefined ? undefined : clientStore.byId.get(id);
+            },
+            renderRow: renderClientCard,
+            renderPlaceholder: () => '<div class="client-card client-card-placeholder"></div>',
+            renderEmpty: () => {
+                const status = currentFilter === 'all' ? null : currentFilter;
+                return `
+                    <div class="empty-state">
+                        <div class="empty-icon">📭</div>
+                        <p>Клиенты ${status ? `со статусом "${status}"` : ''} не найдены</p>
+                        <button class="btn btn-secondary" onclick="showAddClientModal()">Добавить первого клиента</button>
                     </div>
-                    
-                    <span class="client-status client-status-${client.status}">
-                        ${getStatusLabel(client.status)}
-                    </span>
-                </div>
-            `;
-        }).join('');
+                `;
+            },
+            onMissing: (start, end) => {
+                pagesForRange(start, end, CLIENTS_PAGE_SIZE).forEach(page => loadClientsPage(page));
+            }
+        });
+    }
+    return clientList;
+}
+
+async function loadClients(resetScroll = true) {
+    // Полная перезагрузка списка: при старте, по кнопке «Обновить», при смене
+    // фильтра и когда на сервере изменилась версия данных
+    clientStore.generation++;
+    clientStore.pendingPages.clear();
+    
+    const list = getClientList();
+    const firstPage = resetScroll ? 0 : Math.floor((list.range ? list.range.start : 0) / CLIENTS_PAGE_SIZE);
+    await loadClientsPage(firstPage, true);
+    
+    if (resetScroll) {
+        list.scrollToTop();
+        list.render(true);
+    }
+}
+
+async function loadClientsPage(page, reset = false) {
+    if (clientStore.pendingPages.has(page)) {
+        return;
+    }
+    clientStore.pendingPages.add(page);
+    const generation = clientStore.generation;
+    
+    try {
+        const params = new URLSearchParams({ offset: page * CLIENTS_PAGE_SIZE, limit: CLIENTS_PAGE_SIZE });
+        if (currentFilter !== 'all') {
+            params.set('status', currentFilter);
+        }
+        
+        const response = await fetchWithAuth(`${API_URL}/clients?${params}`);
+        const data = await response.json();
+        
+        // За время запроса список перезагрузили — ответ устарел
+        if (generation !== clientStore.generation) {
+            return;
+        }
+        
+        if (reset) {
+            clientStore.byId.clear();
+            clientStore.order = [];
+        }
+        
+        clientStore.total = data.total;
+        data.clients.forEach((client, index) => {
+            const clientIdStr = String(client.id);
+            clientStore.byId.set(clientIdStr, client);
+            clientStore.order[data.offset + index] = clientIdStr;
+        });
+        
+        getClientList().setTotal(clientStore.total);
         
     } catch (error) {
         console.error('Ошибка загрузки клиентов:', error);
         showNotification('Ошибка загрузки списка клиентов', 'error');
+    } finally {
+        if (generation === clientStore.generation) {
+            clientStore.pendingPages.delete(page);
+        }
+    }
+}
+
+function renderClientCard(client) {
+    const clientIdStr = String(client.id);
+    const isSelected = selectedClientId === clientIdStr;
+    const balance = client.balance || 0;
+    const balanceClass = balance >= 0 ? 'balance-positive' : 'balance-negative';
+    
+    // Рейтинг звёздами
+    const rating = client.rating || 3.0;
+    const fullStars = Math.floor(rating);
+    const hasHalfStar = (rating % 1) >= 0.5;
+    const emptyStars = 5 - fullStars - (hasHalfStar ? 1 : 0);
+    
+    const starsHTML = '★'.repeat(fullStars) + '☆'.repeat(emptyStars + (hasHalfStar ? 1 : 0));
+    
+    return `
+        <div class="client-card ${isSelected ? 'selected' : ''}" data-client-id="${escapeHtml(clientIdStr)}" onclick="selectClient('${escapeHtml(clientIdStr)}')">
+            <div class="client-header">
+                <div class="client-info-left">
+                    <div class="client-name">${escapeHtml(client.name)}</div>
+                    <div class="client-info">📧 ${escapeHtml(client.email)}</div>
+                    <div class="client-info">📱 ${escapeHtml(client.phone)}</div>
+                </div>
+                <div class="client-balance ${balanceClass}">
+                    <div class="balance-label">Баланс</div>
+                    <div class="balance-value">${formatMoney(balance)}</div>
+                </div>
+            </div>
+            
+            <div class="client-rating" title="Рейтинг: ${rating}/5">
+                <span class="rating-stars">${starsHTML}</span>
+                <span class="rating-value">${rating.toFixed(1)}</span>
+            </div>
+            
+            <span class="client-status client-status-${client.status}">
+                ${getStatusLabel(client.status)}
+            </span>
+        </div>
+    `;
+}
+
+function updateSelectionHighlight() {
+    // Переключаем класс только у карточек, без перерисовки списка
+    document.querySelectorAll('.client-card.selected').forEach(card => {
+        card.classList.remove('selected');
+    });
+    if (selectedClientId) {
+        const card = document.querySelector(`.client-card[data-client-id="${CSS.escape(selectedClientId)}"]`);
+        card?.classList.add('selected');
     }
 }
 
@@ -261,16 +480,15 @@ function filterClients(status) {
     document.querySelector(`[data-status="${status}"]`).classList.add('active');
     
     // Загружаем клиентов с фильтром
-    loadClients(status === 'all' ? null : status);
+    loadClients();
 }
 
 async function selectClient(clientId) {
     // Сохраняем ID как строку
     selectedClientId = String(clientId);
     
-    
     // Обновляем визуальное выделение
-    await loadClients(currentFilter === 'all' ? null : currentFilter);
+    updateSelectionHighlight();
     
     // Загружаем детали клиента
     await loadClientDetails(selectedClientId);
@@ -279,11 +497,160 @@ async function selectClient(clientId) {
     clearChat();
     loadSuggestedQuestions(selectedClientId);
 }
+async function refreshClientFromBank(clientId) {
+    // Свежие данные одного клиента из банка без полного импорта
+    const button = document.getElementById('refreshClientBtn');
+    if (button) {
+        button.disabled = true;
+        button.textContent = '⏳ Обновление...';
+    }
+    
+    try {
+        const response = await fetchWithAuth(
+            `${API_URL}/clients/${encodeURIComponent(clientId)}/refresh`,
+            { method: 'POST' }
+        );
+        if (!response) {
+            return;
+        }
+        const data = await response.json();
+        
+        if (response.status === 429) {
+            showNotification(`${data.error}. Повторите через ${data.retry_after} сек.`, 'warning');
+        } else if (response.status === 202) {
+            showNotification('Обновление продолжается, данные появятся автоматически', 'info');
+        } else if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        } else {
+            showNotification(`Обновлено: транзакций ${data.transactions}`, 'success');
+            if (selectedClientId === clientId) {
+                await loadClientDetails(clientId);
+            }
+            await checkDataVersion();
+            return;
+        }
+    } catch (error) {
+        console.error('❌ Ошибка обновления клиента:', error);
+        showNotification('Ошибка обновления из банка: ' + error.message, 'error');
+    }
+    
+    if (button) {
+        button.disabled = false;
+        button.textContent = '🔄 Обновить из банка';
+    }
+}
+
+
+// ============ ВЕРСИЯ ДАННЫХ ============
+async function checkDataVersion() {
+    // Список и статистика перезагружаются, только если данные на сервере изменились
+    try {
+        const response = await fetchWithAuth(`${API_URL}/data-version`);
+        if (!response || !response.ok) {
+            return;
+        }
+        const data = await response.json();
+        
+        if (clientStore.version !== null && clientStore.version !== data.version) {
+            console.log('🔄 Данные на сервере обновились, перезагружаем список');
+            await loadClients(false);
+            await loadStats();
+        }
+        clientStore.version = data.version;
+    } catch (error) {
+        console.error('❌ Ошибка проверки версии данных:', error);
+    }
+}
+
+async function reloadClients() {
+    await loadClients();
+    await loadStats();
+    await checkDataVersion();
+}
+
+function renderTransactionItem(tx) {
+    // Определяем направление транзакции
+    const isIncome = tx.direction === 'income' || tx.direction === 'Credit';
+    const directionClass = isIncome ? 'income' : 'expense';
+    const sign = isIncome ? '+' : '-';
+    
+    return `
+        <div class="transaction-item">
+            <div class="transaction-info">
+                <div class="transaction-category">
+                    ${escapeHtml(tx.category || 'Без категории')}
+                </div>
+                ${tx.description ? `
+                    <div class="transaction-description">
+                        ${escapeHtml(tx.description)}
+                    </div>
+                ` : ''}
+                <div class="transaction-date">
+                    ${formatDate(tx.transaction_date)}
+                </div>
+            </div>
+            <div class="transaction-amount ${directionClass}">
+                ${sign}${formatMoney(Math.abs(tx.amount))}
+            </div>
+        </div>
+    `;
+}
+
+function showTransactionFeed(clientId, total) {
+    // Вся история клиента в виртуальном списке, страницы грузятся при прокрутке
+    const container = document.getElementById('clientTransactions');
+    container.classList.add('transactions-feed');
+    document.getElementById('showAllTransactionsBtn')?.remove();
+    
+    const items = [];
+    const pendingPages = new Set();
+    
+    const feed = new VirtualList(container, {
+        getItem: index => items[index],
+        // Описание всегда есть, чтобы все строки ленты были одной высоты
+        renderRow: tx => renderTransactionItem({ ...tx, description: tx.description || '—' }),
+        renderPlaceholder: () => '<div class="transaction-item transaction-item-placeholder"></div>',
+        onMissing: (start, end) => {
+            pagesForRange(start, end, TRANSACTIONS_PAGE_SIZE).forEach(async page => {
+                if (pendingPages.has(page)) {
+                    return;
+                }
+                pendingPages.add(page);
+                try {
+                    const params = new URLSearchParams({ offset: page * TRANSACTIONS_PAGE_SIZE, limit: TRANSACTIONS_PAGE_SIZE });
+                    const response = await fetchWithAuth(
+                        `${API_URL}/clients/${encodeURIComponent(clientId)}/transactions?${params}`
+                    );
+                    const data = await response.json();
+                    data.transactions.forEach((tx, index) => {
+                        items[data.offset + index] = tx;
+                    });
+                    if (transactionFeed === feed) {
+                        feed.render(true);
+                    }
+                } catch (error) {
+                    console.error('❌ Ошибка загрузки транзакций:', error);
+                } finally {
+                    pendingPages.delete(page);
+                }
+            });
+        }
+    });
+    
+    if (transactionFeed) {
+        transactionFeed.destroy();
+    }
+    transactionFeed = feed;
+    feed.setTotal(total);
+}
 
 async function loadClientDetails(clientId) {
     try {
         
-        const response = await fetchWithAuth(`${API_URL}/clients/${encodeURIComponent(clientId)}`);
+        // Запрашиваем только то, что показывает панель: сводку и 10 последних транзакций
+        const response = await fetchWithAuth(
+            `${API_URL}/clients/${encodeURIComponent(clientId)}?include=summary,recent_tx:${RECENT_TRANSACTIONS_LIMIT}`
+        );
         
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
@@ -322,46 +689,44 @@ async function loadClientDetails(clientId) {
                 📝 Последние транзакции
             </h4>
             
-            <div class="transactions-list">
+            <div class="transactions-list" id="clientTransactions">
                 ${data.transactions.length > 0 ? 
-                    data.transactions.slice(0, 10).map(tx => {
-                        // Определяем направление транзакции
-                        const isIncome = tx.direction === 'income' || tx.direction === 'Credit';
-                        const directionClass = isIncome ? 'income' : 'expense';
-                        const sign = isIncome ? '+' : '-';
-                        
-                        return `
-                            <div class="transaction-item">
-                                <div class="transaction-info">
-                                    <div class="transaction-category">
-                                        ${escapeHtml(tx.category || 'Без категории')}
-                                    </div>
-                                    ${tx.description ? `
-                                        <div class="transaction-description">
-                                            ${escapeHtml(tx.description)}
-                                        </div>
-                                    ` : ''}
-                                    <div class="transaction-date">
-                                        ${formatDate(tx.transaction_date)}
-                                    </div>
-                                </div>
-                                <div class="transaction-amount ${directionClass}">
-                                    ${sign}${formatMoney(Math.abs(tx.amount))}
-                                </div>
-                            </div>
-                        `;
-                    }).join('') 
+                    data.transactions.map(renderTransactionItem).join('') 
                     : '<p style="text-align: center; color: var(--text-secondary); padding: 20px;">Нет транзакций</p>'
                 }
             </div>
             
+            ${data.summary.transaction_count > data.transactions.length ? `
+                <button class="btn btn-secondary" 
+                        id="showAllTransactionsBtn"
+                        style="width: 100%; margin-top: 12px;" 
+                        onclick="showTransactionFeed('${escapeHtml(String(clientId))}', ${data.summary.transaction_count})">
+                    Все транзакции (${data.summary.transaction_count})
+                </button>
+            ` : ''}
+            
             <button class="btn btn-primary" 
                     style="width: 100%; margin-top: 16px;" 
                     onclick="showAddTransactionModal('${escapeHtml(String(clientId))}')">
                 <span>+</span> Добавить транзакцию
             </button>
+            
+            ${data.client.bank_code ? `
+                <button class="btn btn-secondary" 
+                        id="refreshClientBtn"
+                        style="width: 100%; margin-top: 12px;" 
+                        onclick="refreshClientFromBank('${escapeHtml(String(clientId))}')">
+                    🔄 Обновить из банка
+                </button>
+            ` : ''}
         `;
         
+        // Лента предыдущего клиента больше не нужна
+        if (transactionFeed) {
+            transactionFeed.destroy();
+            transactionFeed = null;
+        }
+        
         const detailsContainer = document.getElementById('clientDetails');
         detailsContainer.innerHTML = detailsHtml;
         detailsContainer.style.display = 'block';
@@ -406,8 +771,7 @@ async function addClient(event) {
             const result = await response.json();
             closeModal('addClientModal');
             document.getElementById('addClientForm').reset();
-            await loadClients(currentFilter === 'all' ? null : currentFilter);
-            await loadStats();
+            await reloadClients();
             showNotification('✅ Клиент успешно добавлен', 'success');
             
             // Автоматически выбираем нового клиента
@@ -456,6 +820,7 @@ async function addTransaction(event) {
             // Обновляем данные
             await loadClientDetails(data.client_id);
             await loadStats();
+            await checkDataVersion();
             showNotification('✅ Транзакция добавлена', 'success');
         } else {
             const error = await response.json();
@@ -660,6 +1025,8 @@ function showNotification(message, type = 'info') {
 // ============ ЭКСПОРТ ДЛЯ ГЛОБАЛЬНОГО ИСПОЛЬЗОВАНИЯ ============
 window.loadStats = loadStats;
 window.loadClients = loadClients;
+window.reloadClients = reloadClients;
+window.showTransactionFeed = showTransactionFeed;
 window.filterClients = filterClients;
 window.selectClient = selectClient;
 window.addClient = addClient;
@@ -0,0 +1,442 @@
+# storage.py
+"""
+Хранилища DatabaseManager и импортёра (base.py)
+- SQLiteBackend — файл SQLite (по умолчанию) или БД в памяти
+- PostgresBackend — PostgreSQL (DB_BACKEND=postgresql, DATABASE_URL):
+  пул подключений, несколько воркеров и узлов пишут одновременно
+
+Запросы пишутся на диалекте SQLite, PostgresBackend переводит их (translate):
+- плейсхолдеры ? → %s
+- INSERT OR IGNORE → ON CONFLICT DO NOTHING
+- INSERT OR REPLACE → ON CONFLICT (уникальный ключ таблицы) DO UPDATE
+- PRAGMA table_info(t) → information_schema.columns, остальные PRAGMA пропускаются
+- datetime('now') → CURRENT_TIMESTAMP
+- CREATE TABLE: AUTOINCREMENT → SERIAL, REAL → DOUBLE PRECISION, без FOREIGN KEY
+  (SQLite их не проверяет — импорт и MANUAL клиенты рассчитывают на это)
+Конкатенация || в PostgreSQL работает так же и не переписывается
+
+psycopg2 — необязательная зависимость: нужна только для PostgreSQL
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from config import Config
+from app_logging import get_logger
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:  # pragma: no cover - PostgreSQL не используется
+    psycopg2 = None
+
+logger = get_logger('storage')
+
+MEMORY_DATABASE = ':memory:'
+
+# Формат CURRENT_TIMESTAMP в SQLite: в таком же виде PostgresBackend отдаёт даты
+TIMESTAMP_LENGTH = len('2025-01-01 00:00:00')
+
+_INSERT_OR = re.compile(
+    r'^\s*INSERT\s+OR\s+(REPLACE|IGNORE)\s+INTO\s+(\w+)\s*\(([^)]*)\)(.*?)\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+_INSERT_INTO = re.compile(r'^\s*INSERT\s+INTO\s+(\w+)', re.IGNORECASE)
+_PRAGMA_TABLE_INFO = re.compile(r'^\s*PRAGMA\s+table_info\s*\(\s*(\w+)\s*\)\s*$', re.IGNORECASE)
+_PRAGMA = re.compile(r'^\s*PRAGMA\b', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\b', re.IGNORECASE)
+_FOREIGN_KEY = re.compile(
+    r',\s*FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)(\s+ON\s+(DELETE|UPDATE)\s+(CASCADE|SET\s+NULL|RESTRICT|NO\s+ACTION))*',
+    re.IGNORECASE
+)
+_DATETIME_NOW = re.compile(r"datetime\(\s*'now'\s*\)", re.IGNORECASE)
+# Строковые литералы SQL: плейсхолдеры внутри них не заменяются
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def _casefold(value):
+    """SQL функция casefold: встроенный LOWER SQLite меняет регистр только у ASCII"""
+    return value.casefold() if isinstance(value, str) else value
+
+
+class SQLiteBackend:
+    """Файл SQLite; ':memory:' — БД в памяти с общим кэшем (для тестов)
+
+    Подключения открываются на каждый запрос. БД в памяти держится
+    отдельным подключением, пока жив бэкенд: иначе она исчезла бы
+    вместе с первым закрытым подключением
+    """
+
+    name = 'sqlite'
+    # Поиск без учёта регистра, в том числе кириллицы (регистрируется в connect)
+    casefold = 'casefold'
+    Error = sqlite3.Error
+
+    def __init__(self, db_file: str = None, busy_timeout: float = None):
+        self.db_file = db_file or Config.DATABASE_FILE
+        self.location = self.db_file
+        self.busy_timeout = Config.DB_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+        self.in_memory = self.db_file == MEMORY_DATABASE
+        self._keepalive = None
+
+        if self.in_memory:
+            self._connect_target = f"file:crm_memory_{id(self)}?mode=memory&cache=shared"
+            self._keepalive = sqlite3.connect(self._connect_target, uri=True, check_same_thread=False)
+        else:
+            self._connect_target = self.db_file
+
+    def exists(self) -> bool:
+        """Есть ли уже БД (sqlite3.connect молча создал бы пустой файл)"""
+        return not self.in_memory and os.path.exists(self.db_file)
+
+    def close(self):
+        if self._keepalive is not None:
+            self._keepalive.close()
+            self._keepalive = None
+
+    def connect(self, check_same_thread: bool = True):
+        conn = sqlite3.connect(self._connect_target, uri=self.in_memory, timeout=self.busy_timeout,
+                               check_same_thread=check_same_thread)
+        conn.row_factory = sqlite3.Row
+        conn.create_function('casefold', 1, _casefold, deterministic=True)
+        return conn
+
+    def release(self, conn):
+        conn.close()
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def begin_snapshot(self, conn):
+        conn.execute('BEGIN')
+
+    def set_journal_mode(self, conn, mode: str) -> Optional[str]:
+        """Включить режим журнала; вернуть действующий (None — не применимо)"""
+        if self.in_memory:
+            return None
+        return conn.execute(f'PRAGMA journal_mode={mode}').fetchone()[0]
+
+    def tables(self, cursor) -> List[str]:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+        return [row[0] for row in cursor.fetchall()]
+
+    def execute_update(self, cursor, query: str, params: tuple = ()) -> int:
+        """id вставленной строки или число изменённых строк"""
+        cursor.execute(query, params)
+        return cursor.lastrowid if cursor.lastrowid else cursor.rowcount
+
+    def reset_sequence(self, cursor, table: str):
+        cursor.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+
+
+class PostgresCursor:
+    """Курсор psycopg2 с переводом запросов на диалект PostgreSQL
+
+    Строки — DictRow: доступ и по имени колонки, и по номеру, как у sqlite3.Row
+    """
+
+    def __init__(self, backend: 'PostgresBackend', cursor):
+        self.backend = backend
+        self.raw = cursor
+
+    def execute(self, query: str, params: tuple = ()):
+        sql = self.backend.translate(query, self.raw)
+        if sql is not None:
+            self.raw.execute(sql, tuple(params))
+            if _CREATE_TABLE.match(query):
+                self.backend.invalidate_schema()
+        return self
+
+    def executemany(self, query: str, seq_of_params):
+        sql = self.backend.translate(query, self.raw)
+        if sql is not None:
+            # execute_batch: пачка строк за один запрос к серверу, а не строка за запрос
+            psycopg2.extras.execute_batch(self.raw, sql, [tuple(params) for params in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self.raw.fetchone()
+
+    def fetchall(self):
+        return self.raw.fetchall() if self.raw.description else []
+
+    def fetchmany(self, size: int):
+        return self.raw.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self.raw.description
+
+    @property
+    def rowcount(self) -> int:
+        return self.raw.rowcount
+
+    @property
+    def lastrowid(self):
+        return None
+
+
+def _to_float(value, cursor):
+    return float(value) if value is not None else None
+
+
+def _to_timestamp_text(value, cursor):
+    return value[:TIMESTAMP_LENGTH] if value is not None else None
+
+
+_typecasters_registered = False
+
+
+def _register_typecasters():
+    """Даты строками в формате SQLite, NUMERIC (ROUND, AVG) — float:
+    ответы API и разбор дат (sync_scheduler) не зависят от хранилища"""
+    global _typecasters_registered
+    if _typecasters_registered:
+        return
+    extensions = psycopg2.extensions
+    extensions.register_type(extensions.new_type((1114, 1184), 'CRM_TIMESTAMP', _to_timestamp_text))
+    extensions.register_type(extensions.new_type((1082,), 'CRM_DATE', lambda value, cursor: value))
+    extensions.register_type(extensions.new_type((1700,), 'CRM_NUMERIC', _to_float))
+    _typecasters_registered = True
+
+
+class PostgresBackend:
+    """PostgreSQL через пул подключений psycopg2 (ThreadedConnectionPool)
+
+    Подключение берётся из пула на запрос (или на снимок) и возвращается;
+    при исчерпании пула запрос ждёт до DB_BUSY_TIMEOUT секунд. Пул создаётся
+    при первом подключении и заново после fork (воркеры gunicorn)
+    """
+
+    name = 'postgresql'
+    # LOWER PostgreSQL учитывает локаль БД, не только ASCII
+    casefold = 'LOWER'
+
+    def __init__(self, dsn: str = None, min_size: int = None, max_size: int = None):
+        if psycopg2 is None:
+            raise RuntimeError('Для DB_BACKEND=postgresql установите psycopg2-binary')
+        _register_typecasters()
+        self.Error = psycopg2.Error
+        self.dsn = dsn or Config.DATABASE_URL
+        self.location = re.sub(r'://([^:/@]+):[^@]*@', r'://\1:***@', self.dsn)
+        self.in_memory = False
+        self.min_size = min_size or Config.DB_POOL_MIN
+        self.max_size = max_size or Config.DB_POOL_MAX
+
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        # Пулы родителя после fork: не закрываем (закрытие оборвало бы
+        # подключения родителя), только держим ссылки
+        self._inherited_pools = []
+
+        # Переводы запросов и уникальные ключи / serial id таблиц
+        self._translations = {}
+        self._unique_keys = {}
+        self._serial_tables = {}
+        self._schema_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return True
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is not None and self._pool_pid != os.getpid():
+                    self._inherited_pools.append(self._pool)
+                    self._pool = None
+                    self._slots = threading.BoundedSemaphore(self.max_size)
+                if self._pool is None:
+                    # Время в UTC, как CURRENT_TIMESTAMP в SQLite
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.min_size, self.max_size, self.dsn,
+                        cursor_factory=psycopg2.extras.DictCursor, options='-c TimeZone=UTC'
+                    )
+                    self._pool_pid = os.getpid()
+                    logger.info("🐘 Пул PostgreSQL %s: %d..%d подключений", self.location,
+                                self.min_size, self.max_size)
+        return self._pool
+
+    def connect(self, check_same_thread: bool = True):
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=Config.DB_BUSY_TIMEOUT):
+            raise RuntimeError(f'Нет свободных подключений PostgreSQL за {Config.DB_BUSY_TIMEOUT} с')
+        try:
+            return pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        # Незавершённую транзакцию пул откатывает сам
+        try:
+            self._get_pool().putconn(conn)
+        finally:
+            self._slots.release()
+
+    def cursor(self, conn) -> PostgresCursor:
+        return PostgresCursor(self, conn.cursor())
+
+    def begin_snapshot(self, conn):
+        # psycopg2 открывает транзакцию перед первым запросом — это и есть первый
+        conn.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+
+    def set_journal_mode(self, conn, mode: str) -> Optional[str]:
+        return None
+
+    def tables(self, cursor) -> List[str]:
+        raw = cursor.raw if isinstance(cursor, PostgresCursor) else cursor
+        raw.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = current_schema() AND table_type = 'BASE TABLE'"
+        )
+        return [row[0] for row in raw.fetchall()]
+
+    def execute_update(self, cursor: PostgresCursor, query: str, params: tuple = ()) -> int:
+        """id вставленной строки (RETURNING id для таблиц с serial id) или число строк"""
+        match = _INSERT_OR.match(query)
+        if match:
+            table = match.group(2)
+        else:
+            match = _INSERT_INTO.match(query)
+            table = match.group(1) if match else None
+        sql = self.translate(query, cursor.raw)
+        if table and self._has_serial_id(cursor.raw, table):
+            cursor.raw.execute(sql + ' RETURNING id', tuple(params))
+            row = cursor.raw.fetchone()
+            return row[0] if row else 0
+        cursor.raw.execute(sql, tuple(params))
+        return cursor.raw.rowcount
+
+    def reset_sequence(self, cursor, table: str):
+        raw = cursor.raw if isinstance(cursor, PostgresCursor) else cursor
+        if self._has_serial_id(raw, table):
+            raw.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), 1, false)", (table,))
+
+    # ---------- перевод запросов ----------
+
+    def invalidate_schema(self):
+        """Сбросить кэш ключей таблиц (после CREATE TABLE)"""
+        with self._schema_lock:
+            self._translations = {}
+            self._unique_keys = {}
+            self._serial_tables = {}
+
+    def translate(self, query: str, raw_cursor) -> Optional[str]:
+        """Запрос SQLite → PostgreSQL (None — запрос не нужен, например PRAGMA)"""
+        translated = self._translations.get(query)
+        if translated is None and query not in self._translations:
+            translated = self._translate(query, raw_cursor)
+            with self._schema_lock:
+                self._translations[query] = translated
+        return translated
+
+    def _translate(self, query: str, raw_cursor) -> Optional[str]:
+        match = _PRAGMA_TABLE_INFO.match(query)
+        if match:
+            return (
+                "SELECT column_name AS name, data_type AS type FROM information_schema.columns "
+                f"WHERE table_schema = current_schema() AND table_name = '{match.group(1)}' "
+                "ORDER BY ordinal_position"
+            )
+        if _PRAGMA.match(query):
+            return None
+
+        if _CREATE_TABLE.match(query):
+            query = re.sub(r'INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT', 'SERIAL PRIMARY KEY', query, flags=re.IGNORECASE)
+            query = re.sub(r'\bREAL\b', 'DOUBLE PRECISION', query, flags=re.IGNORECASE)
+            query = _FOREIGN_KEY.sub('', query)
+
+        match = _INSERT_OR.match(query)
+        if match:
+            action, table, columns, rest = match.groups()
+            column_list = [column.strip() for column in columns.split(',')]
+            query = f"INSERT INTO {table} ({columns}){rest}"
+            if action.upper() == 'IGNORE':
+                query += ' ON CONFLICT DO NOTHING'
+            else:
+                query += self._upsert_clause(raw_cursor, table, column_list)
+
+        query = _DATETIME_NOW.sub('CURRENT_TIMESTAMP', query)
+        return self._placeholders(query)
+
+    @staticmethod
+    def _placeholders(query: str) -> str:
+        """? → %s; % экранируется (psycopg2 форматирует запрос через %)"""
+        parts = _STRING_LITERAL.split(query)
+        for i, part in enumerate(parts):
+            part = part.replace('%', '%%')
+            parts[i] = part if i % 2 else part.replace('?', '%s')
+        return ''.join(parts)
+
+    def _upsert_clause(self, raw_cursor, table: str, columns: List[str]) -> str:
+        """INSERT OR REPLACE: конфликт по первому уникальному ключу, все колонки
+        которого есть во вставке (в SQLite REPLACE заменяет строку целиком)"""
+        key = next((key for key in self._table_unique_keys(raw_cursor, table)
+                    if set(key) <= set(columns)), None)
+        if key is None:
+            return ''
+        updates = [f"{column} = EXCLUDED.{column}" for column in columns if column not in key]
+        if not updates:
+            return f" ON CONFLICT ({', '.join(key)}) DO NOTHING"
+        return f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET {', '.join(updates)}"
+
+    def _table_unique_keys(self, raw_cursor, table: str) -> List[Tuple[str, ...]]:
+        keys = self._unique_keys.get(table)
+        if keys is None:
+            raw_cursor.execute('''
+                SELECT array_agg(a.attname::text ORDER BY k.ord)
+                FROM pg_index i
+                JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord) ON true
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+                WHERE i.indrelid = to_regclass(%s) AND i.indisunique
+                GROUP BY i.indexrelid, i.indisprimary
+                ORDER BY i.indisprimary DESC
+            ''', (table,))
+            keys = [tuple(row[0]) for row in raw_cursor.fetchall()]
+            with self._schema_lock:
+                self._unique_keys[table] = keys
+        return keys
+
+    def _has_serial_id(self, raw_cursor, table: str) -> bool:
+        serial = self._serial_tables.get(table)
+        if serial is None:
+            raw_cursor.execute("SELECT pg_get_serial_sequence(%s, 'id') IS NOT NULL "
+                               "FROM information_schema.columns "
+                               "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'id'",
+                               (table, table))
+            row = raw_cursor.fetchone()
+            serial = bool(row and row[0])
+            with self._schema_lock:
+                self._serial_tables[table] = serial
+        return serial
+
+
+_postgres_backend = None
+_postgres_lock = threading.Lock()
+
+
+def create_backend(db_file: str = None, busy_timeout: float = None):
+    """Хранилище по Config.DB_BACKEND: SQLite с файлом db_file или общий
+    на процесс PostgresBackend (один пул на DatabaseManager и импортёр)"""
+    global _postgres_backend
+    if Config.DB_BACKEND != 'postgresql':
+        return SQLiteBackend(db_file, busy_timeout)
+    with _postgres_lock:
+        if _postgres_backend is None:
+            _postgres_backend = PostgresBackend()
+        return _postgres_backend
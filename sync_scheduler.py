@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# sync_scheduler.py
+"""
+Фоновая синхронизация с банками внутри сервиса
+Каждый банк синхронизируется по своему интервалу (SYNC_INTERVAL, SYNC_INTERVALS)
+со случайной добавкой SYNC_JITTER, чтобы банки и перезапуски не били в API
+одновременно. Одновременно идёт не больше SYNC_MAX_CONCURRENCY банков, один
+банк никогда не синхронизируется дважды параллельно. История запусков —
+в таблице sync_runs, после успешного запуска вызываются хуки инвалидации API,
+выгрузки снимка аналитики (ANALYTICS_DIR) и поиска аномалий (ANOMALY_DETECTION)
+
+В gunicorn планировщик запускается в post_fork (SYNC_ENABLED=True), работает
+он только в одном воркере — том, что взял файловую блокировку SYNC_LOCK_FILE.
+
+Разовая синхронизация (cron, первичная загрузка):
+    python3 sync_scheduler.py --once
+    python3 sync_scheduler.py --once --bank abank
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from config import Config
+from app_logging import get_logger, setup_logging, bind_correlation_id, new_correlation_id
+from base import DirectAPIToSQLite
+from database import db_manager
+from repositories import SyncRunRepository
+from analytics import export_after_sync
+from anomalies import detect_after_sync
+
+# Транзакции перезапрашиваются с запасом до прошлой синхронизации:
+# банк может провести операцию задним числом
+INCREMENTAL_OVERLAP = timedelta(days=1)
+
+# Как часто воркер без блокировки проверяет, не освободилась ли она, секунд
+LOCK_RETRY_INTERVAL = 60
+
+# Формат CURRENT_TIMESTAMP в SQLite (UTC)
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+logger = get_logger('sync')
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.strptime(value, SQLITE_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def incremental_since(bank_code: str) -> Optional[str]:
+    """Дата, с которой запрашивать транзакции банка (None — полная загрузка)"""
+    last = SyncRunRepository.get_last_success(bank_code)
+    if not last:
+        return None
+    since = _parse_timestamp(last['started_at']) - INCREMENTAL_OVERLAP
+    return since.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class SyncLock:
+    """Блокировка на файле между процессами (воркерами gunicorn)
+
+    Освобождается и при падении процесса: flock снимается вместе с дескриптором.
+    Без fcntl (Windows) блокировка всегда берётся — там один процесс
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """Взять блокировку без ожидания"""
+        if self.held:
+            return True
+        if fcntl is None:
+            self._file = True
+            return True
+
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None and self._file is not True:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+
+
+class SyncScheduler:
+    """Периодическая инкрементальная синхронизация банков из DirectAPIToSQLite.banks"""
+
+    def __init__(self, db_file: str = None, banks: Optional[List[Dict]] = None,
+                 interval: int = None, intervals: Optional[Dict[str, int]] = None,
+                 jitter: int = None, max_concurrency: int = None, lock_file: str = None,
+                 importer_factory: Callable[[], DirectAPIToSQLite] = None):
+        self.db_file = db_file or Config.DATABASE_FILE
+        self.importer_factory = importer_factory or (lambda: DirectAPIToSQLite(self.db_file))
+        self.banks = banks if banks is not None else self.importer_factory().banks
+        self.interval = interval or Config.SYNC_INTERVAL
+        self.intervals = Config.get_sync_intervals() if intervals is None else intervals
+        self.jitter = Config.SYNC_JITTER if jitter is None else jitter
+        self.max_concurrency = max_concurrency or Config.SYNC_MAX_CONCURRENCY
+        self.lock = SyncLock(lock_file or Config.SYNC_LOCK_FILE or f"{self.db_file}.sync.lock")
+
+        # Один банк — одна синхронизация за раз
+        self.bank_locks = {bank['code']: threading.Lock() for bank in self.banks}
+        # bank_code -> time.monotonic() следующего запуска
+        self.next_run = {}
+        # Хуки после успешной синхронизации: callback(result)
+        self.listeners = []
+
+        self.executor = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def add_listener(self, callback: Callable[[Dict], None]):
+        """Вызывать callback(result) после каждой успешной синхронизации"""
+        self.listeners.append(callback)
+
+    def interval_for(self, bank_code: str) -> int:
+        return self.intervals.get(bank_code, self.interval)
+
+    def prepare_database(self):
+        """Создать банковскую схему, если БД ещё нет
+
+        Иначе первым БД открыл бы db_manager и создал пустую CRM структуру.
+        В раздельном режиме — БД каждого банка
+        """
+        importer = self.importer_factory()
+        bank_codes = [bank['code'] for bank in self.banks] if importer.shard_dir else [None]
+        for bank_code in bank_codes:
+            if not os.path.exists(importer.database_file(bank_code)):
+                importer.create_database(bank_code)
+                importer.close()
+
+    def _schedule_initial(self):
+        """Первый запуск банка: через интервал после прошлой успешной
+        синхронизации (перезапуск сервиса не вызывает внеочередной загрузки)"""
+        now = time.monotonic()
+        utc_now = datetime.now(timezone.utc)
+
+        for bank in self.banks:
+            bank_code = bank['code']
+            delay = 0
+            last = SyncRunRepository.get_last_success(bank_code)
+            if last:
+                age = (utc_now - _parse_timestamp(last['started_at'])).total_seconds()
+                delay = max(0, self.interval_for(bank_code) - age)
+            self.next_run[bank_code] = now + delay + random.uniform(0, self.jitter)
+
+    def _schedule_next(self, bank_code: str):
+        self.next_run[bank_code] = time.monotonic() + self.interval_for(bank_code) + random.uniform(0, self.jitter)
+
+    def sync_bank(self, bank: Dict) -> Optional[Dict]:
+        """Синхронизировать банк; None — синхронизация этого банка уже идёт"""
+        bank_lock = self.bank_locks.setdefault(bank['code'], threading.Lock())
+        if not bank_lock.acquire(blocking=False):
+            logger.info("⏭️ %s: синхронизация уже идёт, пропуск", bank['code'])
+            return None
+        try:
+            # Записи импортёра этого запуска связаны общим correlation_id
+            with bind_correlation_id(f"sync-{bank['code']}-{new_correlation_id()[:8]}"):
+                return self._run_sync(bank)
+        finally:
+            bank_lock.release()
+
+    def _run_sync(self, bank: Dict) -> Dict:
+        bank_code = bank['code']
+        since = incremental_since(bank_code)
+        run_id = SyncRunRepository.start(bank_code, since)
+        logger.info("🔄 Синхронизация %s #%s (%s)", bank_code, run_id, f"с {since}" if since else 'полная')
+
+        result = {
+            'run_id': run_id,
+            'bank_code': bank_code,
+            'status': 'error',
+            'clients': 0,
+            'failed_clients': 0,
+            'rows': 0,
+            'error': None
+        }
+
+        started = time.perf_counter()
+        importer = self.importer_factory()
+        importer.since = since
+        try:
+            successful, failed = importer.sync_bank(bank)
+            stats = importer.stats
+            result['clients'] = successful
+            result['failed_clients'] = failed
+            result['rows'] = stats['accounts'] + stats['balances'] + stats['transactions']
+            if successful > 0:
+                result['status'] = 'success'
+            else:
+                result['error'] = 'Не удалось получить данные ни одного клиента'
+        except Exception as e:
+            result['error'] = str(e) or type(e).__name__
+            logger.exception("❌ Ошибка синхронизации %s", bank_code)
+        result['duration_ms'] = int((time.perf_counter() - started) * 1000)
+
+        SyncRunRepository.finish(
+            run_id, result['status'],
+            clients=result['clients'],
+            failed_clients=result['failed_clients'],
+            rows=result['rows'],
+            error=result['error'],
+            duration_ms=result['duration_ms']
+        )
+
+        if result['status'] == 'success':
+            logger.info("✅ %s: клиентов %d, строк %d, %d мс", bank_code, result['clients'],
+                        result['rows'], result['duration_ms'], extra={'sync': result})
+            self._notify(result)
+        else:
+            logger.error("❌ %s: %s", bank_code, result['error'], extra={'sync': result})
+
+        return result
+
+    def _notify(self, result: Dict):
+        for callback in self.listeners:
+            try:
+                callback(result)
+            except Exception as e:
+                logger.exception("⚠️ Ошибка хука синхронизации: %s", e)
+
+    def run_due(self) -> list:
+        """Поставить в пул банки, у которых подошло время; вернуть futures"""
+        now = time.monotonic()
+        futures = []
+        for bank in self.banks:
+            bank_code = bank['code']
+            if self.next_run.get(bank_code, now) > now:
+                continue
+            if self.bank_locks[bank_code].locked():
+                continue
+            self._schedule_next(bank_code)
+            futures.append(self.executor.submit(self.sync_bank, bank))
+        return futures
+
+    def run_once(self, bank_codes: Optional[List[str]] = None) -> List[Dict]:
+        """Синхронизировать банки сейчас и дождаться результатов"""
+        if not self.lock.acquire():
+            logger.warning("⏭️ Синхронизацию уже ведёт другой процесс (блокировка %s)", self.lock.path)
+            return []
+
+        try:
+            self.prepare_database()
+            banks = [bank for bank in self.banks if not bank_codes or bank['code'] in bank_codes]
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='sync') as executor:
+                results = list(executor.map(self.sync_bank, banks))
+            return [result for result in results if result]
+        finally:
+            self.lock.release()
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            if not self.lock.held:
+                if not self.lock.acquire():
+                    self.stopped.wait(LOCK_RETRY_INTERVAL)
+                    continue
+                logger.info("🗓️ Планировщик синхронизации запущен (pid: %s)", os.getpid())
+                # Запуски, оборванные остановкой прошлого владельца блокировки
+                SyncRunRepository.fail_unfinished()
+                self._schedule_initial()
+
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.exception("❌ Ошибка планировщика синхронизации: %s", e)
+
+            wake_at = min(self.next_run.values(), default=time.monotonic() + self.interval)
+            self.stopped.wait(min(max(1, wake_at - time.monotonic()), LOCK_RETRY_INTERVAL))
+
+    def start(self) -> 'SyncScheduler':
+        """Запустить фоновый поток планировщика"""
+        if self.thread is not None:
+            return self
+        self.prepare_database()
+        self.stopped.clear()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='sync')
+        self.thread = threading.Thread(target=self._loop, name='sync-scheduler', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Остановить планировщик: новые синхронизации не запускаются,
+        идущие дорабатывают в фоне (недоработанные помечает fail_unfinished)"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(5)
+            self.thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.lock.release()
+
+
+def invalidate_api_caches(result: Dict):
+    """Хук после успешной синхронизации: сбросить реестр схемы
+
+    Версию данных (/api/data-version) отдельно сбрасывать не нужно: в неё входит
+    sync_runs, и фронтенд в каждом воркере перечитает клиентов при следующем опросе
+    """
+    db_manager.invalidate_schema()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler() -> SyncScheduler:
+    """Запустить планировщик процесса (один на процесс; между процессами —
+    файловая блокировка)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SyncScheduler()
+            _scheduler.add_listener(invalidate_api_caches)
+            if Config.ANALYTICS_DIR:
+                _scheduler.add_listener(export_after_sync)
+            if Config.ANOMALY_DETECTION:
+                _scheduler.add_listener(detect_after_sync)
+            _scheduler.start()
+        return _scheduler
+
+
+def stop_scheduler():
+    """Остановить планировщик процесса, если он запущен (новый не создаётся)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description='Синхронизация с банками по расписанию')
+    parser.add_argument('--once', action='store_true', help='Синхронизировать один раз и выйти')
+    parser.add_argument('--bank', action='append', help='Код банка (можно несколько раз)')
+    args = parser.parse_args()
+
+    setup_logging()
+    scheduler = SyncScheduler()
+    scheduler.add_listener(invalidate_api_caches)
+    if Config.ANALYTICS_DIR:
+        scheduler.add_listener(export_after_sync)
+    if Config.ANOMALY_DETECTION:
+        scheduler.add_listener(detect_after_sync)
+
+    if args.once:
+        results = scheduler.run_once(args.bank)
+        failed = [result for result in results if result['status'] != 'success']
+        logger.info("🏁 Синхронизировано банков: %d/%d", len(results) - len(failed), len(results))
+        raise SystemExit(1 if failed or not results else 0)
+
+    if args.bank:
+        scheduler.banks = [bank for bank in scheduler.banks if bank['code'] in args.bank]
+
+    scheduler.start()
+    try:
+        while scheduler.thread.is_alive():
+            scheduler.thread.join(1)
+    except KeyboardInterrupt:
+        logger.info("⏹️ Остановка планировщика...")
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
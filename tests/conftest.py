@@ -0,0 +1,36 @@
+# tests/conftest.py
+"""Общие настройки тестов: модули проекта из корня репозитория, БД в памяти
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager, set_db_manager  # noqa: E402
+from storage import MEMORY_DATABASE  # noqa: E402
+
+
+@pytest.fixture
+def memory_db():
+    """CRM БД в памяти вместо Config.DATABASE_FILE на время теста"""
+    manager = DatabaseManager(MEMORY_DATABASE)
+    previous = set_db_manager(manager)
+    yield manager
+    set_db_manager(previous)
+    manager.close()
+
+
+@pytest.fixture
+def api(memory_db):
+    """Тестовый клиент Flask над memory_db с открытой сессией"""
+    from app import create_app
+
+    client = create_app({'TESTING': True}).test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+    return client
@@ -0,0 +1,58 @@
+# tests/test_app.py
+"""create_app(database=..., ai=...): приложение над БД в памяти и заглушкой AI
+
+    python3 -m pytest tests/test_app.py
+"""
+
+import pytest
+
+from ai_service import AIService, get_ai_service, set_ai_service
+from database import DatabaseManager, get_db_manager, set_db_manager
+from repositories import AIConversationRepository
+from storage import MEMORY_DATABASE
+
+
+class StubAI(AIService):
+    """Ответ без обращения к AI API"""
+
+    def ask(self, question, client_id=None, context=None):
+        return {'success': True, 'answer': f'ответ на «{question}»', 'model': 'stub',
+                'has_context': client_id is not None, 'timings': {}}
+
+
+@pytest.fixture
+def app_objects():
+    """Прежние общие объекты процесса возвращаются после теста"""
+    previous_db = set_db_manager(None)
+    previous_ai = set_ai_service(None)
+    database = DatabaseManager(MEMORY_DATABASE)
+    ai = StubAI()
+    yield database, ai
+    set_db_manager(previous_db)
+    set_ai_service(previous_ai)
+    database.close()
+
+
+def test_create_app_over_memory_database(app_objects):
+    from app import create_app
+    database, ai = app_objects
+
+    client = create_app({'TESTING': True}, database=database, ai=ai).test_client()
+    assert get_db_manager() is database
+    assert get_ai_service() is ai
+
+    assert client.get('/api/stats').status_code == 401
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+
+    response = client.post('/api/clients', json={'name': 'anna', 'email': 'anna@example.com'})
+    assert response.status_code == 201
+    response = client.get('/api/stats')
+    assert response.status_code == 200
+    assert response.get_json()['clients']['total'] == 1
+
+    response = client.post('/api/ai/ask', json={'question': 'Баланс?'})
+    assert response.status_code == 200
+    assert response.get_json()['answer'] == 'ответ на «Баланс?»'
+    # Диалог сохранён в БД, переданной create_app
+    assert [c['question'] for c in AIConversationRepository.get_page(limit=10)] == ['Баланс?']
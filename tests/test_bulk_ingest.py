@@ -0,0 +1,187 @@
+# tests/test_bulk_ingest.py
+"""Массовая загрузка транзакций: разбор NDJSON/CSV, пачки, POST /api/transactions/bulk
+
+    python3 -m pytest tests/test_bulk_ingest.py
+"""
+
+import io
+import json
+
+import pytest
+
+from config import Config
+from bulk_ingest import ENCODING_ERROR, BulkIngest
+from repositories import ClientRepository, TransactionRepository
+
+
+@pytest.fixture(autouse=True)
+def no_anomaly_detection(monkeypatch):
+    # Пересчёт аномалий идёт в фоновом потоке и пережил бы БД теста
+    monkeypatch.setattr(Config, 'ANOMALY_DETECTION', False)
+
+
+@pytest.fixture
+def client_ids(memory_db):
+    return [int(ClientRepository.create(name, f'{name}@example.com', '+70000000000', 'active'))
+            for name in ('anna', 'boris')]
+
+
+def ndjson(*lines) -> bytes:
+    return '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode() + b'\n'
+
+
+def row(client_id, amount=100, direction='expense', **fields) -> dict:
+    record = dict(client_id=client_id, amount=amount, direction=direction,
+                  category='Продукты', transaction_date='2026-03-01')
+    record.update(fields)
+    return record
+
+
+def run(body: bytes, fmt: str, **kwargs) -> dict:
+    return BulkIngest(**kwargs).run(io.BytesIO(body), fmt)
+
+
+def stored_count() -> int:
+    return TransactionRepository.get_totals()['transaction_count']
+
+
+def test_ndjson_mixed_rows(client_ids):
+    anna, boris = client_ids
+    report = run(ndjson(
+        row(anna),
+        '{not json',
+        row(anna, amount=-5),
+        '',
+        row(boris, direction='sideways'),
+        '[1, 2]',
+        row(boris, amount='12.50', direction='income', category=None, description='Зарплата за март'),
+    ), 'ndjson')
+
+    assert report['inserted'] == 2
+    assert report['failed'] == 4
+    assert [error['line'] for error in report['errors']] == [2, 3, 5, 6]
+    assert report['errors'][1]['error'].startswith('amount')
+    assert report['errors'][2]['error'].startswith('direction')
+    assert not report['errors_truncated']
+
+    rows = TransactionRepository.get_by_client(boris)
+    assert [(tx['amount'], tx['category']) for tx in rows] == [(12.5, 'Зарплата')]
+
+
+def test_csv_line_numbers(client_ids):
+    anna, _ = client_ids
+    body = (
+        'client_id,amount,direction,category,description,transaction_date\r\n'
+        f'{anna},10,expense,Продукты,,2026-03-01\r\n'
+        f'{anna},20,expense,Продукты,"две\r\nстроки",2026-03-02\r\n'
+        f'{anna},30,expense,Продукты,,2026-02-30\r\n'
+        f'{anna},abc,expense,Продукты,,2026-03-04\r\n'
+    ).encode('utf-8-sig')
+    report = run(body, 'csv')
+
+    assert report['inserted'] == 2
+    # Запись в кавычках на строках 3-4 сдвигает номера следующих
+    assert [error['line'] for error in report['errors']] == [5, 6]
+    assert report['errors'][0]['error'].startswith('transaction_date')
+
+
+def test_unknown_client(client_ids):
+    anna, _ = client_ids
+    report = run(ndjson(row(anna), row(9999), row(anna)), 'ndjson')
+
+    assert report['inserted'] == 2
+    assert report['errors'] == [{'line': 2, 'error': 'client_id: клиент 9999 не найден'}]
+
+
+@pytest.mark.parametrize('rows, chunks', [
+    (4, [2, 2]),
+    (5, [2, 2, 1]),
+    (1, [1]),
+])
+def test_chunk_boundaries(client_ids, monkeypatch, rows, chunks):
+    anna, _ = client_ids
+    sizes = []
+    create_many = TransactionRepository.create_many
+
+    def counting_create_many(batch):
+        sizes.append(len(batch))
+        return create_many(batch)
+
+    monkeypatch.setattr(TransactionRepository, 'create_many', staticmethod(counting_create_many))
+    report = run(ndjson(*[row(anna, amount=i + 1) for i in range(rows)]), 'ndjson', chunk_size=2)
+
+    assert sizes == chunks
+    assert report['inserted'] == rows == stored_count()
+
+
+def test_unknown_client_does_not_shift_chunk(client_ids):
+    anna, _ = client_ids
+    report = run(ndjson(row(anna), row(anna), row(9999), row(anna)), 'ndjson', chunk_size=2)
+
+    assert report['inserted'] == 3
+    assert [error['line'] for error in report['errors']] == [3]
+
+
+def test_errors_truncated(client_ids):
+    report = run(ndjson(*['{bad'] * 5), 'ndjson', max_errors=2)
+
+    assert report['failed'] == 5
+    assert len(report['errors']) == 2
+    assert report['errors_truncated']
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_non_utf8_line_is_reported(client_ids, fmt):
+    anna, _ = client_ids
+    if fmt == 'ndjson':
+        body = (ndjson(row(anna))
+                + json.dumps(row(anna, description='Оплата'), ensure_ascii=False).encode('cp1251') + b'\n'
+                + ndjson(row(anna)))
+    else:
+        body = (
+            b'client_id,amount,direction,category,description,transaction_date\n'
+            + f'{anna},10,expense,Продукты,,2026-03-01\n'.encode()
+            + f'{anna},20,expense,Продукты,Оплата,2026-03-02\n'.encode('cp1251')
+            + f'{anna},30,expense,Продукты,,2026-03-03\n'.encode()
+        )
+    report = run(body, fmt)
+
+    # Строка в другой кодировке пропускается, соседние загружаются
+    assert report['inserted'] == 2
+    assert report['errors'] == [{'line': 2 if fmt == 'ndjson' else 3, 'error': ENCODING_ERROR}]
+
+
+def test_endpoint_created(api, client_ids):
+    anna, _ = client_ids
+    response = api.post('/api/transactions/bulk', data=ndjson(row(anna), '{bad'),
+                        content_type='application/x-ndjson')
+
+    assert response.status_code == 201
+    assert response.get_json()['inserted'] == 1
+    assert [error['line'] for error in response.get_json()['errors']] == [2]
+
+
+def test_endpoint_csv_upload(api, client_ids):
+    anna, _ = client_ids
+    body = f'client_id,amount,direction\n{anna},10,income\n'.encode()
+    response = api.post('/api/transactions/bulk', data={'file': (io.BytesIO(body), 'history.csv')},
+                        content_type='multipart/form-data')
+
+    assert response.status_code == 201
+    assert response.get_json()['inserted'] == 1
+
+
+def test_endpoint_nothing_inserted(api, client_ids):
+    response = api.post('/api/transactions/bulk', data=ndjson(row(9999), '{bad'),
+                        content_type='application/x-ndjson')
+
+    assert response.status_code == 400
+    assert response.get_json()['inserted'] == 0
+    assert response.get_json()['failed'] == 2
+
+
+def test_endpoint_unknown_format(api, client_ids):
+    response = api.post('/api/transactions/bulk', data=b'{}', content_type='application/octet-stream')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,48 @@
+# tests/test_categorizer.py
+"""Правила categorizer.py: направление транзакции и короткие основы слов
+
+    python3 -m pytest tests/test_categorizer.py
+"""
+
+import pytest
+
+from categorizer import TransactionCategorizer
+
+
+@pytest.fixture(scope='module')
+def categorizer():
+    return TransactionCategorizer()
+
+
+@pytest.mark.parametrize('information, indicator, expected', [
+    # Ключевые слова доходов не действуют на списания и наоборот
+    ('Оплата по счету №15 за поставку', 'Debit', 'Другие расходы'),
+    ('Оплата по счету №15 за поставку', 'Credit', 'Продажи'),
+    ('Возврат займа', 'Debit', 'Другие расходы'),
+    ('Зарплата за октябрь', 'Credit', 'Зарплата'),
+    ('Зарплата за октябрь', 'Debit', 'Другие расходы'),
+    ('Оплата в Пятёрочка', 'Debit', 'Продукты'),
+    ('Оплата в Пятёрочка', 'Credit', 'Другие доходы'),
+    # Короткие основы не ловят посторонние слова
+    ('Конвертация по курсу ЦБ', 'Debit', 'Другие расходы'),
+    ('Анализ рынка, консультация', 'Debit', 'Другие расходы'),
+    ('Школьная форма', 'Debit', 'Другие расходы'),
+    ('Возврат займа', 'Credit', 'Другие доходы'),
+    # и по-прежнему находят свои
+    ('Курсы английского языка', 'Debit', 'Образование'),
+    ('Оплата: частная школа', 'Debit', 'Образование'),
+    ('Анализы в лаборатории', 'Debit', 'Здоровье'),
+    ('Возврат покупки', 'Credit', 'Другие доходы'),
+])
+def test_categorize(categorizer, information, indicator, expected):
+    assert categorizer.categorize(information, None, indicator) == expected
+
+
+def test_code_respects_direction(categorizer):
+    assert categorizer.categorize(None, 'Salary', 'Credit') == 'Зарплата'
+    assert categorizer.categorize(None, 'Refund', 'Debit') == 'Другие расходы'
+
+
+def test_without_direction_uses_all_categories(categorizer):
+    assert categorizer.categorize('Оплата по счету №15', None, None) == 'Продажи'
+    assert categorizer.categorize('Такси', None, None) == 'Транспорт'
@@ -0,0 +1,171 @@
+# tests/test_client_refresh.py
+"""Обновление клиента по запросу: общий Future, ограничение частоты,
+POST /api/clients/<id>/refresh (200, 202, 429)
+
+    python3 -m pytest tests/test_client_refresh.py
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import client_refresh
+from base import DirectAPIToSQLite
+from client_refresh import ClientRefresher, RefreshRateLimited, set_client_refresher
+from config import Config
+from database import DatabaseManager, set_db_manager
+
+
+class StubImporter:
+    """Вместо DirectAPIToSQLite: refresh_client ждёт release, запросов в банк нет"""
+
+    def __init__(self, calls: list, release: threading.Event):
+        self.calls = calls
+        self.release = release
+        self.since = None
+        self.stats = {'accounts': 1, 'balances': 1, 'transactions': 3}
+
+    def refresh_client(self, client_id, bank_code):
+        self.calls.append((client_id, bank_code))
+        assert self.release.wait(5)
+        return True
+
+
+@pytest.fixture(autouse=True)
+def no_sync_runs(monkeypatch):
+    # Дата инкрементальной загрузки не нужна заглушке
+    monkeypatch.setattr(client_refresh, 'incremental_since', lambda bank_code: None)
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def make_refresher(calls, release):
+    refreshers = []
+
+    def make(**kwargs):
+        refresher = ClientRefresher(db_file='unused.db', importer_factory=lambda: StubImporter(calls, release),
+                                    **kwargs)
+        refreshers.append(refresher)
+        return refresher
+
+    yield make
+    release.set()
+    for refresher in refreshers:
+        refresher.executor.shutdown(wait=True)
+
+
+def test_concurrent_requests_share_future(make_refresher, calls, release):
+    refresher = make_refresher(min_interval=0)
+
+    first, first_coalesced = refresher.submit('team-1', 'abank')
+    second, second_coalesced = refresher.submit('team-1', 'abank')
+    assert second is first
+    assert (first_coalesced, second_coalesced) == (False, True)
+
+    release.set()
+    assert first.result(timeout=5)['transactions'] == 3
+    assert calls == [('team-1', 'abank')]
+
+    # Загрузка закончилась — следующий запрос начинает новую
+    third, coalesced = refresher.submit('team-1', 'abank')
+    assert third is not first and not coalesced
+    third.result(timeout=5)
+    assert len(calls) == 2
+
+
+def test_min_interval(make_refresher, release):
+    refresher = make_refresher(min_interval=30)
+    release.set()
+    refresher.submit('team-1', 'abank')[0].result(timeout=5)
+
+    with pytest.raises(RefreshRateLimited) as error:
+        refresher.submit('team-1', 'abank')
+    assert 0 < error.value.retry_after <= 30
+
+    # Интервал считается для каждого клиента отдельно
+    refresher.submit('team-2', 'abank')[0].result(timeout=5)
+
+
+def test_max_concurrent(make_refresher):
+    refresher = make_refresher(min_interval=0, max_concurrent=1)
+    refresher.submit('team-1', 'abank')
+
+    with pytest.raises(RefreshRateLimited) as error:
+        refresher.submit('team-2', 'abank')
+    assert error.value.retry_after == 1
+
+
+@pytest.fixture
+def banking_api(tmp_path, make_refresher, monkeypatch):
+    """Тестовый клиент над банковской БД с клиентом team-1 (abank)"""
+    db_file = str(tmp_path / 'bank.db')
+    importer = DirectAPIToSQLite(db_file)
+    importer.create_database()
+    importer.close()
+    conn = sqlite3.connect(db_file)
+    conn.execute("INSERT INTO clients (client_id, bank_code) VALUES ('team-1', 'abank')")
+    conn.commit()
+    conn.close()
+
+    manager = DatabaseManager(db_file)
+    previous_db = set_db_manager(manager)
+    refresher = make_refresher(min_interval=30)
+    previous_refresher = set_client_refresher(refresher)
+    monkeypatch.setattr(Config, 'CLIENT_REFRESH_TIMEOUT', 5)
+
+    from app import create_app
+    client = create_app({'TESTING': True}).test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+    yield client
+
+    set_client_refresher(previous_refresher)
+    set_db_manager(previous_db)
+    manager.close()
+
+
+def test_endpoint_refresh_then_rate_limited(banking_api, release):
+    release.set()
+    response = banking_api.post('/api/clients/team-1-abank/refresh')
+    assert response.status_code == 200
+    assert response.get_json()['coalesced'] is False
+    assert response.get_json()['transactions'] == 3
+
+    response = banking_api.post('/api/clients/team-1-abank/refresh')
+    assert response.status_code == 429
+    retry_after = int(response.headers['Retry-After'])
+    assert 1 <= retry_after <= 30
+    assert response.get_json()['retry_after'] == retry_after
+
+
+def test_endpoint_pending(banking_api, monkeypatch, calls, release):
+    monkeypatch.setattr(Config, 'CLIENT_REFRESH_TIMEOUT', 0.05)
+
+    response = banking_api.post('/api/clients/team-1-abank/refresh')
+    assert response.status_code == 202
+    assert response.get_json() == {'status': 'pending', 'coalesced': False}
+
+    # Загрузка продолжается: повторный запрос присоединяется к ней
+    response = banking_api.post('/api/clients/team-1-abank/refresh')
+    assert response.status_code == 202
+    assert response.get_json()['coalesced'] is True
+    assert calls == [('team-1', 'abank')]
+
+
+def test_endpoint_unknown_client(banking_api, calls):
+    response = banking_api.post('/api/clients/team-9-abank/refresh')
+
+    assert response.status_code == 404
+    assert calls == []
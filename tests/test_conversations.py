@@ -0,0 +1,65 @@
+# tests/test_conversations.py
+"""Постраничная история AI диалогов: курсор before по (created_at, id)
+
+    python3 -m pytest tests/test_conversations.py
+"""
+
+import pytest
+
+from database import db_manager
+from repositories import AIConversationRepository
+
+
+@pytest.fixture
+def conversation_ids(memory_db):
+    """Пять диалогов: три с одинаковым created_at, два позже"""
+    ids = [AIConversationRepository.create(1, f'вопрос {i}', f'ответ {i}') for i in range(5)]
+    db_manager.execute_update("UPDATE ai_conversations SET created_at = '2026-03-01 10:00:00' WHERE id <= ?",
+                              (ids[2],))
+    db_manager.execute_update("UPDATE ai_conversations SET created_at = '2026-03-01 11:00:00' WHERE id > ?",
+                              (ids[2],))
+    return ids
+
+
+def read_pages(api, limit):
+    """Все страницы /api/ai/conversations подряд по next_before"""
+    pages = []
+    before = None
+    while True:
+        query = f'/api/ai/conversations?limit={limit}' + (f'&before={before}' if before else '')
+        response = api.get(query)
+        assert response.status_code == 200
+        body = response.get_json()
+        pages.append([conversation['id'] for conversation in body['conversations']])
+        before = body['next_before']
+        if before is None:
+            return pages
+
+
+def test_ties_on_created_at(api, conversation_ids):
+    pages = read_pages(api, limit=2)
+
+    # Новые первыми, при равном created_at — по id; ни пропусков, ни повторов
+    assert sum(pages, []) == sorted(conversation_ids, reverse=True)
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+def test_next_before_on_last_page(api, conversation_ids):
+    # Полная последняя страница ещё даёт курсор, следующая пуста и без курсора
+    pages = read_pages(api, limit=5)
+    assert pages == [sorted(conversation_ids, reverse=True), []]
+
+    pages = read_pages(api, limit=10)
+    assert pages == [sorted(conversation_ids, reverse=True)]
+
+
+def test_before_inside_tie(conversation_ids):
+    page = AIConversationRepository.get_page(before=conversation_ids[1], limit=10)
+    assert [conversation['id'] for conversation in page] == [conversation_ids[0]]
+
+
+def test_unknown_before(api, conversation_ids):
+    response = api.get('/api/ai/conversations?before=9999')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'conversations': [], 'next_before': None}
@@ -0,0 +1,122 @@
+# tests/test_rollups.py
+"""Итоги месяцев transaction_rollups: совпадают с суммами по transactions
+после create, create_many и заполнения из истории; периоды get_timeline
+
+    python3 -m pytest tests/test_rollups.py
+"""
+
+import pytest
+
+from database import db_manager, ROLLUP_BACKFILL
+from repositories import ClientRepository, TransactionRepository
+
+# (сумма, категория, направление, дата)
+HISTORY = [
+    (100.0, 'Продукты', 'expense', '2026-01-05'),
+    (50.5, 'Продукты', 'expense', '2026-01-20'),
+    (1000.0, 'Зарплата', 'income', '2026-01-25'),
+    (30.0, 'Транспорт', 'expense', '2026-02-03'),
+    (1000.0, 'Зарплата', 'income', '2026-02-25'),
+    (70.0, 'Продукты', 'expense', '2026-04-10'),
+    (200.0, 'Кэшбэк', 'income', '2026-05-31'),
+]
+
+
+@pytest.fixture
+def client_id(memory_db):
+    return int(ClientRepository.create('anna', 'anna@example.com', '+70000000000', 'active'))
+
+
+def create_history(client_id):
+    for amount, category, direction, transaction_date in HISTORY:
+        TransactionRepository.create(client_id, amount, category, direction, None, transaction_date)
+
+
+def rollups():
+    return sorted(
+        (row['client_id'], row['month'], row['direction'], row['category'], round(row['total'], 2),
+         row['transaction_count'])
+        for row in db_manager.execute_query('SELECT * FROM transaction_rollups')
+    )
+
+
+def raw_sums():
+    """Те же итоги, посчитанные по всей истории transactions"""
+    return sorted(
+        (row['client_id'], row['month'], row['direction'], row['category'], round(row['total'], 2),
+         row['transaction_count'])
+        for row in db_manager.execute_query('''
+            SELECT CAST(client_id AS TEXT) as client_id, substr(transaction_date, 1, 7) as month,
+                   direction, category, SUM(amount) as total, COUNT(*) as transaction_count
+            FROM transactions
+            GROUP BY 1, 2, 3, 4
+        ''')
+    )
+
+
+def test_create_matches_raw_sums(client_id):
+    create_history(client_id)
+
+    assert rollups() == raw_sums()
+    assert (str(client_id), '2026-01', 'expense', 'Продукты', 150.5, 2) in rollups()
+
+
+def test_create_many_matches_raw_sums(client_id):
+    other = int(ClientRepository.create('boris', 'boris@example.com', '+70000000001', 'active'))
+    rows = [(cid, amount, category, direction, None, transaction_date)
+            for cid in (client_id, other) for amount, category, direction, transaction_date in HISTORY]
+
+    # Две пачки: вторая добавляется к итогам первой, а не перезаписывает их
+    assert TransactionRepository.create_many(rows[:4]) == 4
+    assert TransactionRepository.create_many(rows[4:]) == len(rows) - 4
+
+    assert rollups() == raw_sums()
+    assert TransactionRepository.create_many([]) == 0
+
+
+def test_backfill_matches_raw_sums(client_id):
+    create_history(client_id)
+    TransactionRepository.create_many([(client_id, 5.0, 'Продукты', 'expense', None, '2026-01-31')])
+    expected = raw_sums()
+
+    db_manager.execute_update('DELETE FROM transaction_rollups')
+    db_manager.execute_update(ROLLUP_BACKFILL['crm'])
+    assert rollups() == expected
+
+    # Таблица, созданная поверх существующей истории, заполняется сразу
+    db_manager.execute_update('DROP TABLE transaction_rollups')
+    db_manager._add_transaction_rollups_table('crm')
+    assert rollups() == expected
+
+
+def test_timeline_by_month(client_id):
+    create_history(client_id)
+    timeline = TransactionRepository.get_timeline(str(client_id))
+
+    assert [period['period'] for period in timeline] == ['2026-01', '2026-02', '2026-04', '2026-05']
+    january = timeline[0]
+    assert (january['total_income'], january['total_expense'], january['transaction_count']) == (1000.0, 150.5, 3)
+    assert january['balance'] == 849.5
+    assert january['categories'][0] == {'category': 'Зарплата', 'direction': 'income', 'total': 1000.0, 'count': 1}
+
+    timeline = TransactionRepository.get_timeline(str(client_id), month_from='2026-02', month_to='2026-04')
+    assert [period['period'] for period in timeline] == ['2026-02', '2026-04']
+
+
+def test_timeline_by_quarter(client_id):
+    create_history(client_id)
+    timeline = TransactionRepository.get_timeline(str(client_id), granularity='quarter')
+
+    assert [(period['period'], period['total_income'], period['total_expense'], period['transaction_count'])
+            for period in timeline] == [
+        ('2026-Q1', 2000.0, 180.5, 5),
+        ('2026-Q2', 200.0, 70.0, 2),
+    ]
+    # Одна категория из разных месяцев квартала — одна строка
+    groceries = [c for c in timeline[0]['categories'] if c['category'] == 'Продукты']
+    assert groceries == [{'category': 'Продукты', 'direction': 'expense', 'total': 150.5, 'count': 2}]
+
+
+def test_timeline_unknown_granularity(client_id):
+    with pytest.raises(ValueError):
+        TransactionRepository.get_timeline(str(client_id), granularity='week')
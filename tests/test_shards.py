@@ -0,0 +1,106 @@
+# tests/test_shards.py
+"""Раздельные БД банков: страницы и итоги собираются из всех файлов
+(ShardedDatabaseManager, _merge_page)
+
+    python3 -m pytest tests/test_shards.py
+"""
+
+import sqlite3
+
+import pytest
+
+from base import DirectAPIToSQLite
+from database import ShardedDatabaseManager, set_db_manager
+from repositories import ClientRepository, TransactionRepository, _merge_page
+
+# Клиенты банков вперемешку: общий порядок (bank_code, client_id) чередует файлы
+SHARD_CLIENTS = {
+    'abank': ['team-1', 'team-3', 'team-5'],
+    'vbank': ['team-2', 'team-4'],
+}
+
+# (банк, клиент, сумма, направление)
+SHARD_TRANSACTIONS = [
+    ('abank', 'team-1', 100.0, 'Credit'),
+    ('abank', 'team-3', 40.0, 'Debit'),
+    ('vbank', 'team-2', 250.0, 'Credit'),
+    ('vbank', 'team-4', 15.5, 'Debit'),
+    ('vbank', 'team-4', 4.5, 'Debit'),
+]
+
+
+def create_shard(shard_dir: str, bank_code: str):
+    """Файл банка со схемой импорта (как shard_db.split_database) и данными"""
+    importer = DirectAPIToSQLite(None)
+    importer.shard_dir = shard_dir
+    importer.create_database(bank_code)
+    importer.close()
+
+    conn = sqlite3.connect(f'{shard_dir}/{bank_code}.db')
+    conn.executemany('INSERT INTO clients (client_id, bank_code) VALUES (?, ?)',
+                     [(client_id, bank_code) for client_id in SHARD_CLIENTS[bank_code]])
+    conn.executemany('''
+        INSERT INTO transactions (transaction_id, account_id, client_id, bank_code, amount, currency,
+                                  credit_debit_indicator, status, booking_date_time)
+        VALUES (?, ?, ?, ?, ?, 'RUB', ?, 'Booked', '2026-03-01T10:00:00')
+    ''', [(f'tx-{i}', f'acc-{client_id}', client_id, bank, amount, direction)
+          for i, (bank, client_id, amount, direction) in enumerate(SHARD_TRANSACTIONS) if bank == bank_code])
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def sharded_db(tmp_path):
+    shard_dir = str(tmp_path / 'banks')
+    for bank_code in SHARD_CLIENTS:
+        create_shard(shard_dir, bank_code)
+
+    manager = ShardedDatabaseManager(str(tmp_path / 'crm.db'), shard_dir, workers=2)
+    previous = set_db_manager(manager)
+    yield manager
+    set_db_manager(previous)
+    manager.close()
+
+
+def all_clients():
+    return sorted((bank_code, client_id) for bank_code, clients in SHARD_CLIENTS.items() for client_id in clients)
+
+
+def test_merge_page():
+    rows = [{'n': n} for n in (5, 1, 4, 2, 3)]
+    key = lambda row: row['n']
+
+    assert [row['n'] for row in _merge_page(rows, key, 1, 2)] == [2, 3]
+    assert [row['n'] for row in _merge_page(rows, key, 3, None)] == [4, 5]
+    assert [row['n'] for row in _merge_page(rows, key, 0, 2, reverse=True)] == [5, 4]
+    assert _merge_page(rows, key, 5, 2) == []
+
+
+def test_clients_pages_across_shards(sharded_db):
+    assert sharded_db.shard_codes() == ['abank', 'vbank']
+
+    pages = [ClientRepository.get_all(limit=2, offset=offset) for offset in (0, 2, 4, 6)]
+    clients = [(client['bank_code'], client['client_id_original']) for page in pages for client in page]
+
+    # Ни пропусков, ни повторов на стыках страниц, хотя каждая БД отдала первые offset + limit
+    assert [len(page) for page in pages] == [2, 2, 1, 0]
+    assert clients == all_clients()
+    assert [client['id'] for client in pages[1]] == ['team-5-abank', 'team-2-vbank']
+
+
+def test_clients_without_limit(sharded_db):
+    clients = ClientRepository.get_all()
+
+    assert [(client['bank_code'], client['client_id_original']) for client in clients] == all_clients()
+    assert ClientRepository.get_count() == len(all_clients())
+
+
+def test_totals_across_shards(sharded_db):
+    totals = TransactionRepository.get_totals()
+
+    assert totals == {
+        'total_income': 350.0,
+        'total_expense': 60.0,
+        'balance': 290.0,
+        'transaction_count': len(SHARD_TRANSACTIONS),
+    }